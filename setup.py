@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 setup(
     name = 'syntaxTrees',
     packages = ['syntaxTrees'],
@@ -13,4 +13,9 @@ setup(
     },
     install_requires=[
     ],
+    entry_points={
+        'console_scripts': [
+            'syntaxTrees-bulk = syntaxTrees.bulk:main',
+        ],
+    },
 )
@@ -0,0 +1,282 @@
+import argparse
+import collections
+import importlib
+import json
+import re
+import sys
+import threading
+
+from . import basics
+from . import profiling
+from .utilities import InvalidParamsException
+
+
+#####################################################################################
+# Objects that leave out the 'type' of a Node that is one of several choices are slow to validate,
+# because execute_function_on_node() has to try to validate them with every candidate Node.
+# This module finds out where in a corpus of stored objects this happens,
+# and can rewrite the objects with the resolved 'type' fields inserted, so that it doesn't happen again.
+#
+# Usage:
+#     report = ambiguity.analyze_corpus(objects, functions.validate_example_object)
+#     annotated_obj = ambiguity.annotate_types(obj, functions.validate_example_object)
+# or for files with one JSON object per line:
+#     python -m syntaxTrees.ambiguity corpus.jsonl --annotate annotated.jsonl
+#####################################################################################
+
+
+_index_in_path_regex = re.compile(r"\[\d+\]")
+
+
+def analyze_corpus(objects, validate_function):
+    """
+    validates each of the objects with the given function, e.g. functions.validate_example_object,
+    and reports how often ambiguity had to be resolved, as a JSON-serializable dict.
+    The report is grouped by the choice and by the JSON path of the object, with list indices replaced by [*],
+    so that the same position in many objects is counted together.
+    Resolutions that happen while trying out a candidate that turns out to be wrong are counted as well,
+    because they cost just as much time.
+    Objects that fail to validate are counted, but otherwise ignored.
+    """
+    statistics = {}
+    object_count = 0
+    invalid_objects = []
+    for i, obj in enumerate(objects):
+        object_count += 1
+        recorder = _AmbiguityRecorder()
+        try:
+            with recorder:
+                validate_function(obj)
+        except InvalidParamsException as e:
+            invalid_objects.append({'index': i, 'error': str(e)})
+            continue
+        for resolution in recorder.resolutions:
+            key = (_index_in_path_regex.sub('[*]', resolution['path']), resolution['choice'])
+            entry = statistics.get(key)
+            if entry is None:
+                entry = {
+                    'path': key[0],
+                    'choice': key[1],
+                    'resolutions': 0,
+                    'candidate_attempts': 0,
+                    'failed_candidate_attempts': 0,
+                    'resolved_types': collections.Counter(),
+                }
+                statistics[key] = entry
+            entry['resolutions'] += 1
+            entry['candidate_attempts'] += resolution['candidate_attempts']
+            entry['failed_candidate_attempts'] += resolution['failed_candidate_attempts']
+            if resolution['resolved_type'] is not None:
+                entry['resolved_types'][resolution['resolved_type']] += 1
+    hotspots = sorted(statistics.values(), key=lambda a: a['candidate_attempts'], reverse=True)
+    for entry in hotspots:
+        entry['resolved_types'] = dict(entry['resolved_types'].most_common())
+    return {
+        'objects': object_count,
+        'invalid_objects': invalid_objects,
+        'resolutions': sum(a['resolutions'] for a in hotspots),
+        'candidate_attempts': sum(a['candidate_attempts'] for a in hotspots),
+        'hotspots': hotspots,
+    }
+
+
+def annotate_types(obj, validate_function, expand_shortforms=False):
+    """
+    validates the object with the given function, e.g. functions.validate_example_object,
+    and returns a copy of the raw object in which the 'type' is inserted into every dict whose type had to be
+    resolved by trying out the candidates. Nothing else is changed, so default values are not filled in.
+    Shortforms have no place for a 'type', so they are left as they are,
+    unless expand_shortforms is True, in which case they are replaced by the full form of the Node.
+    Raises an InvalidParamsException if the object is not valid.
+    """
+    recorder = _AmbiguityRecorder()
+    with recorder:
+        validate_function(obj)
+    return _copy_with_types(obj, recorder.resolved_types_of_objects, expand_shortforms)
+
+
+def _copy_with_types(obj, resolved_types, expand_shortforms, path='$'):
+    # dicts are identified by their id, but other values only by their path, because equal values can share an id
+    if isinstance(obj, dict):
+        res = obj.__class__()
+        resolution = resolved_types.get(('id', id(obj)))
+        if resolution is not None and 'type' not in obj:
+            res['type'] = resolution[0]
+        for k, v in obj.items():
+            res[k] = _copy_with_types(v, resolved_types, expand_shortforms,
+                                      path + profiling._get_path_component_of_key(k))
+        return res
+    if isinstance(obj, list):
+        return [_copy_with_types(a, resolved_types, expand_shortforms, "%s[%d]" % (path, i))
+                for i, a in enumerate(obj)]
+    resolution = resolved_types.get(('path', path))
+    if resolution is not None and expand_shortforms:
+        choice_type, node = resolution
+        res = collections.OrderedDict([('type', choice_type)])
+        res.update(node.Meta.shortform_conversion(obj))
+        return res
+    return obj
+
+
+class _AmbiguityRecorder(basics.ExecutionObserver):
+    """
+    records every resolution of ambiguity during the calls of execute_function_on_node() in the current thread.
+    Types are only remembered for resolutions that are part of the final result:
+    while a candidate is being tried, the types it resolves are kept separately,
+    and they are discarded if the candidate fails.
+    """
+    def __init__(self):
+        self.thread_id = threading.get_ident()
+        self.resolutions = []
+        # maps ('id', id) for dicts and ('path', path) for other values in the raw object
+        # to a tuple of (choice_type, Node)
+        self.resolved_types_of_objects = {}
+        self._paths_of_objects = {}
+        self._root_object = None
+        self._stack = []
+
+    def __enter__(self):
+        basics.add_execution_observer(self)
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        basics.remove_execution_observer(self)
+
+    def node_function_started(self, function, obj, stack_objects, value, choice):
+        if threading.get_ident() != self.thread_id:
+            return
+        node_trace = stack_objects.get('node_trace') or []
+        if not self._stack:
+            # remember where everything is in the raw object.
+            # The raw object is kept alive until the next one, so that the ids stay unique.
+            self._root_object = obj
+            self._paths_of_objects = {}
+            profiling._collect_paths_of_objects(obj, '$', self._paths_of_objects)
+            path = '$'
+        else:
+            parent = self._stack[-1]
+            path = parent['path'] + ''.join(profiling._node_trace_label_to_path_component(a)
+                                            for a in node_trace[parent['node_trace_length']:])
+        if isinstance(obj, (dict, list)):
+            is_part_of_raw_object = id(obj) in self._paths_of_objects
+            if is_part_of_raw_object:
+                path = self._paths_of_objects[id(obj)]
+            object_key = ('id', id(obj))
+        else:
+            # other values are part of the raw object if the enclosing call was on the raw object
+            is_part_of_raw_object = not self._stack or self._stack[-1]['is_part_of_raw_object']
+            object_key = ('path', path)
+        self._stack.append({
+            'object_key': object_key,
+            'choice': choice,
+            'path': path,
+            'node_trace_length': len(node_trace),
+            'is_part_of_raw_object': is_part_of_raw_object,
+            'candidate_attempts': 0,
+            'failed_candidate_attempts': 0,
+            # the types resolved by this call and by the calls nested in it, as tuples of (key, choice_type, Node)
+            'resolved_types': [],
+            # the types resolved while trying out the current candidate, and by the candidate that succeeded
+            'candidate_resolved_types': None,
+            'successful_candidate_resolved_types': None,
+        })
+
+    def ambiguity_candidate_started(self, node):
+        if threading.get_ident() != self.thread_id or not self._stack:
+            return
+        frame = self._stack[-1]
+        frame['candidate_attempts'] += 1
+        frame['candidate_resolved_types'] = []
+
+    def ambiguity_candidate_finished(self, node, succeeded):
+        if threading.get_ident() != self.thread_id or not self._stack:
+            return
+        frame = self._stack[-1]
+        if succeeded:
+            frame['successful_candidate_resolved_types'] = frame['candidate_resolved_types']
+        else:
+            frame['failed_candidate_attempts'] += 1
+        frame['candidate_resolved_types'] = None
+
+    def node_selected(self, node):
+        if threading.get_ident() != self.thread_id or not self._stack:
+            return
+        frame = self._stack[-1]
+        if frame['candidate_attempts'] == 0:
+            return
+        # the ambiguity has been resolved
+        frame['resolved_types'].extend(frame['successful_candidate_resolved_types'] or [])
+        if frame['is_part_of_raw_object']:
+            frame['resolved_types'].append((frame['object_key'], node.Meta.choice_type, node))
+        frame['resolved_type'] = node.Meta.choice_type
+
+    def node_function_finished(self, error):
+        if threading.get_ident() != self.thread_id or not self._stack:
+            return
+        frame = self._stack.pop()
+        if frame['candidate_attempts']:
+            self.resolutions.append({
+                'path': frame['path'],
+                'choice': frame['choice'],
+                'candidate_attempts': frame['candidate_attempts'],
+                'failed_candidate_attempts': frame['failed_candidate_attempts'],
+                'resolved_type': frame.get('resolved_type') if error is None else None,
+            })
+        if error is not None:
+            return
+        if self._stack:
+            parent = self._stack[-1]
+            if parent['candidate_resolved_types'] is not None:
+                parent['candidate_resolved_types'].extend(frame['resolved_types'])
+            else:
+                parent['resolved_types'].extend(frame['resolved_types'])
+        else:
+            for object_key, choice_type, node in frame['resolved_types']:
+                self.resolved_types_of_objects[object_key] = (choice_type, node)
+
+
+#####################################################################################
+# command line
+#####################################################################################
+
+
+def _get_validate_function(name):
+    module_name, function_name = name.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report where ambiguity resolution happens in a corpus of objects, "
+                                                 "and optionally insert the resolved 'type' fields.")
+    parser.add_argument('corpus', help="a file with one JSON object per line")
+    parser.add_argument('--validate-function', default=basics.__name__.rsplit('.', 1)[0] +
+                        '.functions:validate_example_object',
+                        help="the function that validates an object, as module:function")
+    parser.add_argument('--annotate', help="write the objects with the resolved 'type' fields to this file")
+    parser.add_argument('--expand-shortforms', action='store_true',
+                        help="when annotating, replace shortforms that needed resolving by their full form")
+    parser.add_argument('--output', help="write the report as JSON to this file instead of stdout")
+    args = parser.parse_args(argv)
+    validate_function = _get_validate_function(args.validate_function)
+    with open(args.corpus) as f:
+        objects = [json.loads(line, object_pairs_hook=collections.OrderedDict) for line in f if line.strip()]
+    report = analyze_corpus(objects, validate_function)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    if args.annotate is not None:
+        invalid_indices = set(a['index'] for a in report['invalid_objects'])
+        with open(args.annotate, 'w') as f:
+            for i, obj in enumerate(objects):
+                # invalid objects are written unchanged
+                if i not in invalid_indices:
+                    obj = annotate_types(obj, validate_function, expand_shortforms=args.expand_shortforms)
+                f.write(json.dumps(obj) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
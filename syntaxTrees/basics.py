@@ -1,9 +1,21 @@
 import collections
+import collections.abc
+import contextlib
+import contextvars
+import functools
+import hashlib
 import html
+import itertools
 import json
+import os
 import re
+import tempfile
+import threading
+import time
+import types
 
-from .utilities import get_error_message_details, InvalidParamsException, ProgrammingError
+from .utilities import get_error_message_details, ExecutionLimitExceededException, InputLimitExceededException, \
+    InvalidParamsException, ProgrammingError
 
 
 #####################################################################################
@@ -28,63 +40,82 @@ class NodeSubclassDeclarationWatcher(type):
     When it is instantiated, it parses the newly declared class and stores some metadata about it.
     """
     def __init__(cls, name, bases, clsdict):
+        start_time = time.perf_counter()
         # every time this is subclassed for a non-abstract class:
         if not getattr(cls.Meta, 'is_an_abstract_class', False):
-            # register the Node
-            _register_that_a_node_was_defined(cls)
-            # remember the fields of the Node, in the order in which they were defined
-            # and also take the most recent value of required_additional_arguments_for_validation
-            required_additional_arguments_for_validation = []
-            quietly_drop_superfluous_fields = []
-            documentation_name = None
-            documentation_description = None
-            documentation_shortform = None
-            if len(cls.mro()) > 2:
-                dict_of_fields = {}
-                # go through the superclasses in descending order to ensure that fields from subclasses
-                # overwrite fields of the same name from superclasses
-                for superclass in reversed(cls.mro()):
-                    if issubclass(superclass, Node):
-                        if hasattr(superclass.Meta, 'required_additional_arguments_for_validation'):
-                            required_additional_arguments_for_validation = superclass.Meta.required_additional_arguments_for_validation
-                        if hasattr(superclass.Meta, 'quietly_drop_superfluous_fields'):
-                            quietly_drop_superfluous_fields += superclass.Meta.quietly_drop_superfluous_fields
-                        if hasattr(superclass.Meta, 'documentation_name'):
-                            documentation_name = superclass.Meta.documentation_name
-                        if hasattr(superclass.Meta, 'documentation_description'):
-                            documentation_description = superclass.Meta.documentation_description
-                        if hasattr(superclass.Meta, 'documentation_shortform'):
-                            documentation_shortform = superclass.Meta.documentation_shortform
-                        for k,v in superclass.__dict__.items():
-                            if isinstance(v, Field):
-                                if k.endswith('_'):
-                                    # remove a trailing underscore from the name
-                                    # (this is necessary if you use a keyword as the name)
-                                    k = k[:-1]
-                                if k in dict_of_fields and k not in getattr(cls.Meta, 'overwrites_existing_fields', []):
-                                    raise ProgrammingError("field %s in Node %s is already defined. "
-                                                             "This error message is just to prevent you from "
-                                                             "doing this by accident: "
-                                                             "Just set Meta.overwrites_existing_fields "
-                                                             "to allow it." % (k, name,))
-                                dict_of_fields[k] = v
-                # order the fields by their order of creation
-                list_of_fields = [(a, b) for a,b in dict_of_fields.items()]
-                list_of_fields.sort(key=lambda a: a[1].order_of_creation)
-                _value_to_node_fields[cls.Meta.name] = list_of_fields
-            # set some inheritable fields of the Meta class
-            # (because it might have been set only by a superclass)
-            cls.Meta.required_additional_arguments_for_validation = required_additional_arguments_for_validation
-            cls.Meta.quietly_drop_superfluous_fields = quietly_drop_superfluous_fields
-            cls.Meta.documentation_name = documentation_name
-            cls.Meta.documentation_description = documentation_description
-            cls.Meta.documentation_shortform = documentation_shortform
-            if documentation_name is None or documentation_description is None:
-                raise ProgrammingError("these values must be set. Don't forget to add documentation!")
-            _register_node_for_documentation(cls)
+            get_active_registry()._declare_node(cls)
+        # (Node itself has no bases and is declared before the functions used for this are)
+        if bases:
+            _record_node_declaration_cost(cls, time.perf_counter() - start_time)
         super().__init__(name, bases, clsdict)
 
 
+def _process_node_declaration(registry, cls, documentation_page, stack_of_choices):
+    """
+    parses a newly declared non-abstract Node and stores some metadata about it in the Registry.
+    The documentation_page and stack_of_choices are the values
+    that were active for the documentation at the time the Node was declared.
+    """
+    # register the Node
+    registry._register_that_a_node_was_defined(cls)
+    # remember the fields of the Node, in the order in which they were defined
+    # and also take the most recent value of required_additional_arguments_for_validation
+    required_additional_arguments_for_validation = []
+    quietly_drop_superfluous_fields = []
+    mutates_stack_objects = False
+    documentation_name = None
+    documentation_description = None
+    documentation_shortform = None
+    if len(cls.mro()) > 2:
+        dict_of_fields = {}
+        # go through the superclasses in descending order to ensure that fields from subclasses
+        # overwrite fields of the same name from superclasses
+        for superclass in reversed(cls.mro()):
+            if issubclass(superclass, Node):
+                if hasattr(superclass.Meta, 'required_additional_arguments_for_validation'):
+                    required_additional_arguments_for_validation = superclass.Meta.required_additional_arguments_for_validation
+                if hasattr(superclass.Meta, 'quietly_drop_superfluous_fields'):
+                    quietly_drop_superfluous_fields += superclass.Meta.quietly_drop_superfluous_fields
+                if hasattr(superclass.Meta, 'mutates_stack_objects'):
+                    mutates_stack_objects = superclass.Meta.mutates_stack_objects
+                if hasattr(superclass.Meta, 'documentation_name'):
+                    documentation_name = superclass.Meta.documentation_name
+                if hasattr(superclass.Meta, 'documentation_description'):
+                    documentation_description = superclass.Meta.documentation_description
+                if hasattr(superclass.Meta, 'documentation_shortform'):
+                    documentation_shortform = superclass.Meta.documentation_shortform
+                for k,v in superclass.__dict__.items():
+                    if isinstance(v, Field):
+                        if k.endswith('_'):
+                            # remove a trailing underscore from the name
+                            # (this is necessary if you use a keyword as the name)
+                            k = k[:-1]
+                        if k in dict_of_fields and k not in getattr(cls.Meta, 'overwrites_existing_fields', []):
+                            raise ProgrammingError("field %s in Node %s is already defined. "
+                                                     "This error message is just to prevent you from "
+                                                     "doing this by accident: "
+                                                     "Just set Meta.overwrites_existing_fields "
+                                                     "to allow it." % (k, cls.__name__,))
+                        dict_of_fields[k] = v
+        # order the fields by their order of creation
+        list_of_fields = [(a, b) for a,b in dict_of_fields.items()]
+        list_of_fields.sort(key=lambda a: a[1].order_of_creation)
+        registry.value_to_node_fields[cls.Meta.name] = list_of_fields
+    # set some inheritable fields of the Meta class
+    # (because it might have been set only by a superclass)
+    cls.Meta.required_additional_arguments_for_validation = required_additional_arguments_for_validation
+    cls.Meta.quietly_drop_superfluous_fields = quietly_drop_superfluous_fields
+    # whether validating the Node changes the stack_objects in a way that matters afterwards,
+    # apart from the node_trace and current_object (see validate_elements())
+    cls.Meta.mutates_stack_objects = mutates_stack_objects
+    cls.Meta.documentation_name = documentation_name
+    cls.Meta.documentation_description = documentation_description
+    cls.Meta.documentation_shortform = documentation_shortform
+    if documentation_name is None or documentation_description is None:
+        raise ProgrammingError("these values must be set. Don't forget to add documentation!")
+    _register_node_for_documentation(registry, cls, documentation_page, stack_of_choices)
+
+
 class Node(metaclass=NodeSubclassDeclarationWatcher):
     class Meta:
         is_an_abstract_class = True
@@ -101,19 +132,28 @@ class Node(metaclass=NodeSubclassDeclarationWatcher):
         -stack_objects contains a list 'immutable_fields', consisting of all those objects that can not be altered.
         All other fields are copied using json.loads(json.dumps(x)) when multiple alternatives need to be considered.
         """
+        registry = cls.Meta.registry
+        # in lazy mode, the fields of the top-level Node are validated only when they are accessed
+        # (see LazyValidatedObject)
+        validate_lazily = stack_objects.get('lazy_validation_depth') == len(stack_objects['node_trace'])
+        # if a validator was generated ahead of time for this Node, use it instead (see codegen.py)
+        generated_validator = registry.generated_node_validators.get(cls.Meta.name)
+        if generated_validator is not None and not validate_lazily:
+            return generated_validator(cls, obj, stack_objects, kwargs)
         # before calling Node.validate() or any of its field.validate(), call Node.shortform()
         # if it exists and the value is not already a dictionary
-        if hasattr(cls.Meta, 'shortform_field') and not isinstance(obj, dict):
+        # (the value can also be a LazyValidatedObject, if validate() is called on the result of validate())
+        if hasattr(cls.Meta, 'shortform_field') and not isinstance(obj, (dict, collections.abc.Mapping)):
             with node_trace_step(stack_objects, 'conversion from shortform', obj):
                 tmp = cls.Meta.shortform_field.validate(obj)
                 obj = cls.Meta.shortform_conversion(obj)
                 if not isinstance(obj, dict):
                     raise ProgrammingError("the shortform conversion did not return a dict")
         # if it doesn't have a shortform, verify that the object is a dict
-        elif not isinstance(obj, dict):
+        elif not isinstance(obj, (dict, collections.abc.Mapping)):
             raise InvalidParamsException("the value must be a dictionary")
         # if there is a key in the object that isn't a valid field name, raise an Exception
-        ordered_list_of_fields = _value_to_node_fields[cls.Meta.name]
+        ordered_list_of_fields = registry.value_to_node_fields[cls.Meta.name]
         ordered_field_names = [a for a,b in ordered_list_of_fields]
         for k in obj.keys():
             if k in cls.Meta.quietly_drop_superfluous_fields:
@@ -129,11 +169,17 @@ class Node(metaclass=NodeSubclassDeclarationWatcher):
         # go through each field in the order they were defined
         # (this includes fields of superclasses, which come first in the order)
         res_dict = {}
+        fields_to_validate_lazily = {}
         for field_name, field in ordered_list_of_fields:
             # for each field, call its validation function and save the validated value
             # special case: field has dont_auto_validate: ignore it. It gets set later.
             # special case: field is not required, so use its default value
+            # special case: lazy mode, so remember where the value comes from and validate it later
             if not field.dont_auto_validate:
+                if field_name in obj and validate_lazily:
+                    res_dict[field_name] = _NOT_VALIDATED_YET
+                    fields_to_validate_lazily[field_name] = (field, obj)
+                    continue
                 if field_name in obj:
                     field_value = obj[field_name]
                     with node_trace_step(stack_objects, field_name, field_value):
@@ -156,6 +202,8 @@ class Node(metaclass=NodeSubclassDeclarationWatcher):
                             raise InvalidParamsException("the value must not be null")
         # put the validated result in an OrderedDict and return it
         res = collections.OrderedDict(sorted(res_dict.items(), key=lambda t: ordered_field_names.index(t[0])))
+        if validate_lazily:
+            return LazyValidatedObject(res, fields_to_validate_lazily, stack_objects, kwargs)
         return res
 
     def construct_object_visualization_html(cls, obj, stack_objects, kwargs):
@@ -164,7 +212,7 @@ class Node(metaclass=NodeSubclassDeclarationWatcher):
         Constructs an HTML representation for this object in the stack_objects.
         The HTML representation is a python dictionary / a JSON object, which also has some additional HTML tags in it.
         """
-        ordered_list_of_fields = _value_to_node_fields[cls.Meta.name]
+        ordered_list_of_fields = cls.Meta.registry.value_to_node_fields[cls.Meta.name]
         html_fragments = stack_objects['html_fragments']
         indent_string = stack_objects['indent_string']
         # add an HTML marker that is displayed next to the text and contains a link
@@ -172,7 +220,7 @@ class Node(metaclass=NodeSubclassDeclarationWatcher):
         annotation_attribute = 'value="%s"' % cls.Meta.name
         if hasattr(cls.Meta, 'choice_of'):
             annotation_attribute += ' choice="%s"' % cls.Meta.choice_of
-        annotation_link = _doc_string_to_enriched_html("[[%s]]" % cls.Meta.name)
+        annotation_link = _doc_string_to_enriched_html(cls.Meta.registry, "[[%s]]" % cls.Meta.name)
         html_fragments.append(('html', """<span class="syntax-trees-object-dict-annotation" %s>%s</span>""" %
                                (annotation_attribute, annotation_link,)))
         # add the dictionary content of the object
@@ -221,12 +269,264 @@ class Node(metaclass=NodeSubclassDeclarationWatcher):
         html_fragments.append(('html', "</span>"))
 
 
+#####################################################################################
+# lazy validation
+#####################################################################################
+
+
+# Consumers that only read a few fields of a large object don't need to wait for all of it to be validated.
+# If stack_objects['lazy_validation_depth'] is the length of the node_trace at which a Node is validated,
+# Node.validate() only checks the structure of the object (unknown keys, required fields, default values),
+# and returns a LazyValidatedObject that validates each field when it is first accessed.
+# Only that Node is validated lazily. The fields are validated completely when they are accessed,
+# and ambiguity between several Nodes is always resolved immediately by validating the candidates completely.
+# The caller removes 'lazy_validation_depth' from the stack_objects again once its validation call has finished.
+# (see functions.validate_example_object() for an example)
+
+
+# marks a value in a LazyValidatedObject that has not been validated yet
+_NOT_VALIDATED_YET = object()
+
+
+class LazyValidatedObject(collections.abc.MutableMapping):
+    """
+    the result of validating the object of a Node in lazy mode.
+    It behaves like the OrderedDict that validate() would have returned,
+    but each field is only validated when it is first accessed, and the result is memoized.
+    force() validates all remaining fields and returns the OrderedDict.
+    The fields are validated with the node_trace, current_object and kwargs of the original validation,
+    so errors have the same node trace as in eager validation.
+    While the original validation call is still running (e.g. when the custom validate() of a Node accesses a field),
+    the fields are validated with its stack_objects and errors are passed on to it.
+    Afterwards, they are validated with a copy of the stack_objects,
+    and errors are reported with detailed_error_handler_with_node_trace().
+    """
+    def __init__(self, values, fields_to_validate_lazily, stack_objects, kwargs):
+        # the values in the order of the fields, with _NOT_VALIDATED_YET for the fields that are not validated yet
+        self._values = values
+        # maps the names of those fields to tuples of (Field, object that contains the value to validate)
+        self._fields_to_validate_lazily = fields_to_validate_lazily
+        self._stack_objects = stack_objects
+        self._node_trace = list(stack_objects['node_trace'])
+        self._current_object = stack_objects['current_object']
+        self._kwargs = kwargs
+
+    def __getitem__(self, key):
+        res = self._values[key]
+        if res is _NOT_VALIDATED_YET:
+            res = self._validate_field(key)
+        return res
+
+    def __setitem__(self, key, val):
+        self._values[key] = val
+        self._fields_to_validate_lazily.pop(key, None)
+
+    def __delitem__(self, key):
+        del self._values[key]
+        self._fields_to_validate_lazily.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "LazyValidatedObject(%r, not validated yet: %s)" % \
+               (list(self._values), ', '.join(self._fields_to_validate_lazily))
+
+    def move_to_end(self, key, last=True):
+        self._values.move_to_end(key, last=last)
+
+    def force(self):
+        """
+        validates all fields that have not been validated yet, and returns the validated object as an OrderedDict.
+        """
+        for field_name in list(self._fields_to_validate_lazily):
+            if field_name in self._fields_to_validate_lazily:
+                self._validate_field(field_name)
+        return collections.OrderedDict(self._values)
+
+    def _validate_field(self, field_name):
+        field, obj = self._fields_to_validate_lazily[field_name]
+        field_value = obj[field_name]
+        original_validation_is_running = 'lazy_validation_depth' in self._stack_objects
+        if original_validation_is_running:
+            stack_objects = self._stack_objects
+            previous_node_trace = stack_objects['node_trace']
+            previous_object = stack_objects['current_object']
+        else:
+            stack_objects = dict(self._stack_objects)
+        stack_objects['node_trace'] = list(self._node_trace)
+        stack_objects['current_object'] = self._current_object
+        try:
+            with node_trace_step(stack_objects, field_name, field_value):
+                res = field.validate(field_value, stack_objects=stack_objects, kwargs=self._kwargs)
+            # the same sanity check as in Node.validate()
+            if res is None and not field.null and not field.dont_print_default:
+                raise InvalidParamsException("the value must not be null")
+        except Exception as e:
+            if original_validation_is_running:
+                # the node_trace is left as it is, so that the caller can report where the error occurred
+                raise
+            detailed_error_handler_with_node_trace(e, stack_objects)
+        if original_validation_is_running:
+            stack_objects['node_trace'] = previous_node_trace
+            stack_objects['current_object'] = previous_object
+        self._values[field_name] = res
+        self._fields_to_validate_lazily.pop(field_name, None)
+        return res
+
+
+#####################################################################################
+# parallel validation
+#####################################################################################
+
+
+# Container Fields that are declared with parallel=True (fields.List and fields.Mapping) can split their elements
+# into chunks and validate the chunks in a pool of worker threads, see validate_elements().
+# This is off until an executor is set with set_parallel_validation_executor().
+# Each chunk is validated with its own copy of the stack_objects, which is discarded afterwards.
+# Nodes that change the stack_objects in a way that matters afterwards must declare Meta.mutates_stack_objects,
+# and the elements of Fields that can reach such a Node are always validated sequentially.
+# The result is the same as that of sequential validation: the elements are returned in order,
+# and if several elements are invalid, the error of the first one is raised, with the node_trace it would have had.
+# Since validation is Python code, this only uses several cores on free-threaded builds of Python.
+
+
+_parallel_validation_executor = None
+_parallel_validation_chunk_size = 1000
+# set in the worker threads, so that nested containers don't wait for the pool they are running in
+_is_in_parallel_validation = contextvars.ContextVar('syntaxTrees_is_in_parallel_validation', default=False)
+
+
+def set_parallel_validation_executor(executor, chunk_size=1000):
+    """
+    sets the concurrent.futures.Executor, usually a ThreadPoolExecutor,
+    that container Fields declared with parallel=True use to validate chunks of chunk_size elements each.
+    Containers with no more than chunk_size elements are validated sequentially.
+    None turns parallel validation off.
+    """
+    global _parallel_validation_executor, _parallel_validation_chunk_size
+    if chunk_size < 1:
+        raise ProgrammingError("the chunk_size must be positive")
+    _parallel_validation_executor = executor
+    _parallel_validation_chunk_size = chunk_size
+
+
+def validate_elements(field, elements, validate_element, stack_objects):
+    """
+    yields validate_element(i, element, stack_objects) for each element of the list of elements, in order.
+    This is used by container Fields. The validate_element function must add its own node_trace_step.
+    If the Field was declared with parallel=True and an executor has been set, the elements are validated
+    in chunks in parallel (see above), unless execution observers are registered (they only see the current thread),
+    or the Field can reach a Node that declares Meta.mutates_stack_objects.
+    """
+    executor = _parallel_validation_executor
+    chunk_size = _parallel_validation_chunk_size
+    if executor is None or not getattr(field, 'parallel', False) or len(elements) <= chunk_size \
+            or _execution_observers or _is_in_parallel_validation.get() \
+            or _field_may_mutate_stack_objects(field.registry, field):
+        for i, element in enumerate(elements):
+            yield validate_element(i, element, stack_objects)
+        return
+    chunks = []
+    try:
+        for start in range(0, len(elements), chunk_size):
+            copy_of_stack_objects = _copy_stack_objects_for_chunk(stack_objects)
+            # each chunk gets its own copy of the context, because the active Registry is stored in it
+            future = executor.submit(contextvars.copy_context().run, _validate_chunk_of_elements, elements, start,
+                                     min(start + chunk_size, len(elements)), validate_element, copy_of_stack_objects)
+            chunks.append((future, copy_of_stack_objects))
+        for future, copy_of_stack_objects in chunks:
+            results, error = future.result()
+            yield from results
+            if error is not None:
+                # leave the node_trace where the error occurred, as sequential validation would
+                stack_objects['node_trace'] = copy_of_stack_objects['node_trace']
+                stack_objects['current_object'] = copy_of_stack_objects['current_object']
+                raise error
+    finally:
+        # if an error occurred, or the caller stopped early, the remaining chunks are not needed
+        for future, copy_of_stack_objects in chunks:
+            future.cancel()
+
+
+def _validate_chunk_of_elements(elements, start, end, validate_element, stack_objects):
+    """
+    runs in a worker thread. Returns the results of the elements that were validated before the first error,
+    and the error or None.
+    """
+    _is_in_parallel_validation.set(True)
+    results = []
+    try:
+        for i in range(start, end):
+            results.append(validate_element(i, elements[i], stack_objects))
+    except Exception as e:
+        return results, e
+    return results, None
+
+
+def _copy_stack_objects_for_chunk(stack_objects):
+    """
+    copies the stack_objects like the ambiguity resolution of execute_function_on_node() does,
+    except that the current_object is only read, so it is not copied.
+    """
+    immutable_fields = stack_objects['immutable_fields']
+    res = {}
+    for k,v in stack_objects.items():
+        if k in immutable_fields or k == 'current_object':
+            res[k] = v
+        elif k == 'node_trace':
+            res[k] = list(v)
+        else:
+            res[k] = json.loads(json.dumps(v))
+    return res
+
+
+def _field_may_mutate_stack_objects(registry, field):
+    """
+    returns whether validating a value of the Field can reach a Node that declares Meta.mutates_stack_objects.
+    """
+    cache = registry._field_may_mutate_stack_objects_cache
+    res = cache.get(field)
+    if res is None:
+        res = _search_for_node_that_mutates_stack_objects(registry, field, set())
+        # until the Registry is frozen, Nodes can still be declared that change the answer
+        if registry.is_frozen:
+            cache[field] = res
+    return res
+
+
+def _search_for_node_that_mutates_stack_objects(registry, field, visited_values):
+    # Fields reference Nodes through their 'value' or 'choice', and can contain other Fields
+    values = []
+    if isinstance(getattr(field, 'value', None), str):
+        values.append(field.value)
+    if isinstance(getattr(field, 'choice', None), str):
+        values.extend(registry.choice_to_type_to_values[field.choice].values())
+    for value in values:
+        if value in visited_values:
+            continue
+        visited_values.add(value)
+        if getattr(registry.value_to_node[value].Meta, 'mutates_stack_objects', False):
+            return True
+        for field_name, node_field in registry.value_to_node_fields.get(value, ()):
+            if _search_for_node_that_mutates_stack_objects(registry, node_field, visited_values):
+                return True
+    return any(_search_for_node_that_mutates_stack_objects(registry, a, visited_values)
+               for a in field.__dict__.values() if isinstance(a, Field))
+
+
 #####################################################################################
 # Field
 #####################################################################################
 
 
-_field_creation_order_counter = 0
+_field_creation_order_counter = itertools.count()
 
 
 class Field:
@@ -237,6 +537,13 @@ class Field:
     """
     def __init__(self, null=False, default=None, dont_auto_validate=False, derived_field=False,
                  dont_print_default=False, validation_accepts_nulls=False, help="TODO"):
+        registry = get_active_registry()
+        # the Registry of the Nodes this Field is declared on, which their objects are validated against
+        self.registry = registry
+        # the cost of declaring Fields is only measured in lazy mode, where it is a large part of the cost of an import
+        lazy = registry.is_lazy()
+        if lazy:
+            start_time = time.perf_counter()
         self.null = null
         self.default = default
         self.dont_auto_validate = dont_auto_validate
@@ -251,20 +558,28 @@ class Field:
         if default is not None and not isinstance(default, (str, int, float, bool)) and not callable(default):
             raise ProgrammingError("the default must be None, or a primitive, or a function")
         # if the Field is not required, verify that the defaut value is allowed
+        # (in lazy mode, this is postponed until the schema is first used)
         if not self.required:
-            val = self.get_the_default_value()
-            stack_objects = {
-                'node_trace': [],
-                'current_object': None,
-                'immutable_fields': [],
-            }
-            kwargs = {}
-            self.validate(val, stack_objects, kwargs)
+            if not (lazy and registry._defer_validation_of_default_value(self)):
+                self.validate_the_default_value()
         # store the order_of_creation for each field, which is used to make sure that Fields are ordered in the way
         # in which they are defined, because classes do not keep track of the order of their fields
-        global _field_creation_order_counter
-        self.order_of_creation = _field_creation_order_counter
-        _field_creation_order_counter += 1
+        self.order_of_creation = next(_field_creation_order_counter)
+        if lazy:
+            registry._field_declaration_seconds_since_last_node += time.perf_counter() - start_time
+
+    def validate_the_default_value(self):
+        """
+        verifies that the default value is allowed.
+        """
+        val = self.get_the_default_value()
+        stack_objects = {
+            'node_trace': [],
+            'current_object': None,
+            'immutable_fields': [],
+        }
+        kwargs = {}
+        self.validate(val, stack_objects, kwargs)
 
     def get_the_default_value(self):
         """
@@ -325,10 +640,17 @@ class Field:
         """
         combines the text from get_documentation_purpose() and get_documentation_description()
         and wraps it in an HTML block.
+        The result is memoized per Field and Node, since nested Fields are documented as part of their parents.
         """
-        purpose = _doc_string_to_enriched_html(self.get_documentation_purpose(node))
-        description = _doc_string_to_enriched_html(self.get_documentation_description(node))
-        res = """<div class="field-documentation"><div class="field-documentation-purpose">%s</div><div class="field-documentation-description">%s</div></div>""" % (purpose, description,)
+        registry = node.Meta.registry
+        cache = registry._field_documentation_html_cache
+        key = (self, node)
+        res = cache.get(key)
+        if res is None:
+            purpose = _doc_string_to_enriched_html(registry, self.get_documentation_purpose(node))
+            description = _doc_string_to_enriched_html(registry, self.get_documentation_description(node))
+            res = """<div class="field-documentation"><div class="field-documentation-purpose">%s</div><div class="field-documentation-description">%s</div></div>""" % (purpose, description,)
+            cache[key] = res
         return res
 
     def construct_object_visualization_html(self, field_name, field_value, stack_objects):
@@ -365,7 +687,7 @@ class Field:
 #####################################################################################
 
 
-def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, choice=None):
+def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, choice=None, registry=None):
     """
     References a Node by either 'value' or 'choice' and executes a named function on it
     with the given object and keyword parameters.
@@ -374,45 +696,89 @@ def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, c
     The parameter stack_objects should be a dict that is altered in-place by recursive calls.
     In contrast, the parameter kwargs should not be altered
     and is only for immediate use by the selected function, not recursive calls.
+    The Nodes are looked up in the given Registry, or in the active Registry if none is given.
+    A given Registry stays active until the call returns, so recursive calls don't need to pass it along.
     """
+    if registry is not None and registry is not _active_registry.get():
+        with registry.activate():
+            return execute_function_on_node(function, obj, stack_objects, kwargs, value=value, choice=choice)
+    if not _execution_observers:
+        return _execute_function_on_node(function, obj, stack_objects, kwargs, value, choice)
+    # notify the observers. Use a copy of the list, in case an observer is added or removed during the call.
+    observers = list(_execution_observers)
+    for observer in observers:
+        observer.node_function_started(function, obj, stack_objects, value, choice)
+    try:
+        res = _execute_function_on_node(function, obj, stack_objects, kwargs, value, choice)
+    except BaseException as e:
+        for observer in reversed(observers):
+            observer.node_function_finished(e)
+        raise
+    for observer in reversed(observers):
+        observer.node_function_finished(None)
+    return res
+
+
+def _execute_function_on_node(function, obj, stack_objects, kwargs, value, choice):
+    registry = _active_registry.get()
+    registry.ensure_schema_is_built()
     if (value is None) == (choice is None):
         raise ProgrammingError("the Node or group of nodes must be identified by either a 'value' or a 'choice' of values.")
     if not isinstance(stack_objects, dict) or not isinstance(kwargs, dict):
         raise ProgrammingError("the stack_objects and kwargs must both be dictionaries")
+    prevalidated_objects = stack_objects.get('prevalidated_objects')
+    if prevalidated_objects is not None and function == 'validate':
+        prevalidated = prevalidated_objects.get(id(obj))
+        if prevalidated is not None and prevalidated[0] is obj:
+            return prevalidated[1]
+    execution_budget = stack_objects.get('execution_budget')
+    if execution_budget is not None:
+        execution_budget.take_step(stack_objects)
+    validation_limit_counter = stack_objects.get('validation_limits')
+    if validation_limit_counter is not None and function == 'validate':
+        validation_limit_counter.count_node(stack_objects, obj)
+    # if this is the validation function, verify for each candidate node that the kwargs have the right format
+    # (all required_additional_arguments_for_validation are given, and no others)
+    # This only depends on the names of the kwargs, so each combination is checked only once.
+    if function == 'validate':
+        signature = (value, choice, kwargs.signature if type(kwargs) is FrozenKwargs else frozenset(kwargs))
+        if signature not in registry._valid_kwargs_signatures:
+            _check_kwargs_signature(_get_candidate_nodes(registry, value, choice), kwargs)
+            if registry.is_frozen:
+                registry._valid_kwargs_signatures.add(signature)
+    # use the dispatch function that was generated ahead of time, if there is one (see codegen.py).
+    # Observers need to be told which Node is selected, so they only work with the code below.
+    if not _execution_observers:
+        generated_dispatcher = registry.generated_dispatchers.get((function, value, choice))
+        if generated_dispatcher is not None:
+            res_obj = generated_dispatcher(obj, stack_objects, kwargs)
+            if res_obj is not NOT_DISPATCHED:
+                return res_obj
     # get the list of Nodes that might be a good fit
-    if value is not None:
-        candidate_nodes = [_value_to_node[value]]
-    else:
-        candidate_nodes = [_value_to_node[v] for k,v in _choice_to_type_to_values[choice].items()]
+    candidate_nodes = _get_candidate_nodes(registry, value, choice)
     # a helper feature to get documentation if an empty dict is submitted when several differen types are possible:
-    if len(candidate_nodes) > 1 and isinstance(obj, dict) and len(obj) == 0:
+    # (objects can also be read-only Mappings that behave like validated dicts, see store.py)
+    if len(candidate_nodes) > 1 and isinstance(obj, (dict, collections.abc.Mapping)) and len(obj) == 0:
         raise InvalidParamsException("""submitted an empty dictionary.\nValid types are: %s\nSelect one of the valid types for a description of its fields.""" %
                                      ', '.join(a.Meta.name for a in candidate_nodes))
-    # if this is the validation function, verify for each candidate node that the kwargs have the right format
-    # (all required_additional_arguments_for_validation are given, and no others)
-    if function == 'validate':
-        for candidate_node in candidate_nodes:
-            required_additional_arguments_for_validation = candidate_node.Meta.required_additional_arguments_for_validation
-            if len(required_additional_arguments_for_validation) != len(kwargs) \
-                    or any(k not in kwargs for k in required_additional_arguments_for_validation):
-                raise ProgrammingError("the kwargs don't match for node %s.\nWas: %s\nShould be: %s" %
-                                        (candidate_node.Meta.name, ', '.join(kwargs.keys()),
-                                         ', '.join(required_additional_arguments_for_validation),))
     selected_node = None
     # if there is only one possible node, pick it
     if len(candidate_nodes) == 1:
         selected_node = candidate_nodes[0]
-    elif isinstance(obj, dict) and 'type' in obj:
+    elif isinstance(obj, (dict, collections.abc.Mapping)) and 'type' in obj:
         # pick the correct 'value' based on the 'type' attribute
-        valid_types_to_value = _choice_to_type_to_values[choice]
+        valid_types_to_value = registry.choice_to_type_to_values[choice]
         provided_type = obj['type']
         if provided_type not in valid_types_to_value:
             raise InvalidParamsException("the type '%s' is not valid.\nValid types are: %s" %
                                          (provided_type, ', '.join(valid_types_to_value.keys()),))
-        selected_node = _value_to_node[valid_types_to_value[provided_type]]
+        selected_node = registry.value_to_node[valid_types_to_value[provided_type]]
     if selected_node is not None:
+        if _execution_observers:
+            _notify_observers('node_selected', selected_node)
         # run the selected function on the selected_node
-        res_obj = getattr(selected_node, function)(selected_node, obj, stack_objects, kwargs)
+        node_function = getattr(selected_node, function)
+        res_obj = node_function(selected_node, obj, stack_objects, _get_kwargs_for_node_function(node_function, kwargs))
         if function == 'validate':
             # if the Node is one of several choices, add the 'type' to the result
             if hasattr(selected_node.Meta, 'choice_type'):
@@ -441,6 +807,8 @@ def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, c
             raise ProgrammingError("it is ambiguous which Node to use and the requested function was not"
                                      " 'validate', which is the function used to clear up ambiguity. "
                                      "Validate() should have been called beforehand to clean this up.")
+        if validation_limit_counter is not None:
+            validation_limit_counter.count_ambiguity_resolution()
         # go through all candidates and attempt to validate them
         successful_parsing_values = []
         for candidate_node in candidate_nodes:
@@ -449,6 +817,9 @@ def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, c
             # it will only be executed the first time something needs to be validated,
             # as the 'type' fields will be set afterwards,
             # so the next time it is validated, the type is already known and no experimenting is necessary.
+            if _execution_observers:
+                _notify_observers('ambiguity_candidate_started', candidate_node)
+            succeeded = False
             try:
                 # This can be reassigned below,
                 # so rename it first so other loops aren't stuck with the new value by accident
@@ -458,6 +829,8 @@ def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, c
                 copy_of_stack_objects = {}
                 for k,v in stack_objects.items():
                     copy_of_stack_objects[k] = v if k in immutable_fields else json.loads(json.dumps(v))
+                # the candidates can only be told apart by validating them completely, so lazy mode is turned off
+                copy_of_stack_objects.pop('lazy_validation_depth', None)
                 # A small security measure to prevent errors other than InvalidParamsException:
                 # Nodes are usually written with the assumption that objects they test are a dict,
                 # and validate() actually tests for that.
@@ -472,16 +845,26 @@ def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, c
                     # This error will immediately be caught by the surrounding try/except clause.
                     raise InvalidParamsException("the value must be a dictionary")
                 # try to validate the object, and if no error occurred then append the result to the list of successes
-                res_obj = candidate_node.validate(candidate_node, tmp_obj, copy_of_stack_objects, kwargs)
+                res_obj = candidate_node.validate(candidate_node, tmp_obj, copy_of_stack_objects,
+                                                  _get_kwargs_for_node_function(candidate_node.validate, kwargs))
                 successful_parsing_values.append((candidate_node, res_obj, copy_of_stack_objects))
+                succeeded = True
+            except InputLimitExceededException:
+                # the object is too large for any of the candidates
+                raise
             except InvalidParamsException:
                 pass
+            finally:
+                if _execution_observers:
+                    _notify_observers('ambiguity_candidate_finished', candidate_node, succeeded)
         # if exactly one of the candidates is a match:
         # set the 'type' field,
         # overwrite stack_objects to match that candidate's stack_objects,
         # and return its result
         if len(successful_parsing_values) == 1:
             candidate_node, res_obj, copy_of_stack_objects = successful_parsing_values[0]
+            if _execution_observers:
+                _notify_observers('node_selected', candidate_node)
             res_obj['type'] = candidate_node.Meta.choice_type
             res_obj.move_to_end('type', last=False) # make sure the 'type' is listed first
             stack_objects.clear()
@@ -500,80 +883,881 @@ def execute_function_on_node(function, obj, stack_objects, kwargs, value=None, c
                                      (', '.join(["'%s'" % a[0].Meta.choice_type for a in successful_parsing_values])))
 
 
+def _get_candidate_nodes(registry, value, choice):
+    if value is not None:
+        return [registry.value_to_node[value]]
+    return [registry.value_to_node[v] for k,v in registry.choice_to_type_to_values[choice].items()]
+
+
+def _check_kwargs_signature(candidate_nodes, kwargs):
+    for candidate_node in candidate_nodes:
+        required_additional_arguments_for_validation = candidate_node.Meta.required_additional_arguments_for_validation
+        if len(required_additional_arguments_for_validation) != len(kwargs) \
+                or any(k not in kwargs for k in required_additional_arguments_for_validation):
+            raise ProgrammingError("the kwargs don't match for node %s.\nWas: %s\nShould be: %s" %
+                                    (candidate_node.Meta.name, ', '.join(kwargs.keys()),
+                                     ', '.join(required_additional_arguments_for_validation),))
+
+
+#####################################################################################
+# execution budgets
+#####################################################################################
+
+
+class ExecutionBudget:
+    """
+    limits how many calls of execute_function_on_node() one execution may make, and until when it may run.
+    Put it into the stack_objects with set_execution_budget(). Each call counts as one step.
+    When the budget is used up, the call raises an ExecutionLimitExceededException with the node_trace at that point,
+    and so does every call after it, so the execution stops even if a Node catches the exception.
+    If the stack_objects are shared between threads, for example by parallel validation, the count is approximate.
+    """
+    def __init__(self, max_steps=None, timeout=None, deadline=None):
+        """
+        The deadline is a value of time.monotonic(). A timeout in seconds is converted to a deadline from now.
+        If both are given, the earlier one counts.
+        """
+        self.max_steps = max_steps
+        if timeout is not None:
+            timeout_deadline = time.monotonic() + timeout
+            deadline = timeout_deadline if deadline is None else min(deadline, timeout_deadline)
+        self.deadline = deadline
+        self.steps = 0
+
+    def take_step(self, stack_objects):
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self._stop("it exceeded the limit of %d steps" % self.max_steps, stack_objects)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self._stop("it exceeded its deadline", stack_objects)
+
+    def _stop(self, reason, stack_objects):
+        node_trace = stack_objects['node_trace']
+        raise ExecutionLimitExceededException("the execution was stopped after %d steps because %s.\n"
+                                              "It was stopped at the following position:\n%s" %
+                                              (self.steps, reason, " - ".join("%s" % a for a in node_trace)),
+                                              node_trace)
+
+
+def set_execution_budget(stack_objects, max_steps=None, timeout=None, deadline=None):
+    """
+    limits the execution that uses the given stack_objects. See ExecutionBudget.
+    Returns the ExecutionBudget, which counts the steps that were taken.
+    """
+    execution_budget = ExecutionBudget(max_steps=max_steps, timeout=timeout, deadline=deadline)
+    stack_objects['execution_budget'] = execution_budget
+    # the budget is shared, not copied, when several candidates are tried to resolve ambiguity
+    if 'execution_budget' not in stack_objects['immutable_fields']:
+        stack_objects['immutable_fields'].append('execution_budget')
+    return execution_budget
+
+
+#####################################################################################
+# validation limits
+#####################################################################################
+
+
+class ValidationLimits:
+    """
+    limits on the size of the objects that may be validated, so that oversized input is rejected
+    before it takes up much time or memory, or hits the recursion limit.
+    Each limit can be None, which means that it is not limited.
+    -max_nodes: how many values the object contains. Every dictionary, list and primitive value counts as one.
+     During validation, this also limits how many Nodes are validated,
+     counting Nodes that are validated more than once and candidates that are tried to resolve ambiguity.
+    -max_depth: how deeply dictionaries and lists are nested. Other values don't count:
+     {"a": 1} has a depth of 1, and {"a": [1]} a depth of 2.
+     During validation, this is checked for the object of each Node, including the objects created from a shortform.
+    -max_list_length: how many elements each list has.
+    -max_string_bytes: how many bytes each string, including the keys of dictionaries, has in UTF-8.
+    -max_ambiguity_resolutions: how often validation has to try out the candidates of a choice to find the 'type'.
+    check_object() checks the object before validation, and set_validation_limits() makes validation check the rest.
+    """
+    def __init__(self, max_nodes=None, max_depth=None, max_list_length=None, max_string_bytes=None,
+                 max_ambiguity_resolutions=None):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_list_length = max_list_length
+        self.max_string_bytes = max_string_bytes
+        self.max_ambiguity_resolutions = max_ambiguity_resolutions
+
+    def __repr__(self):
+        return "<ValidationLimits %s>" % ', '.join("%s=%s" % (k, v) for k,v in self.__dict__.items())
+
+    def check_object(self, obj):
+        """
+        raises an InputLimitExceededException if the object exceeds the limits that can be checked without validating it.
+        Goes through the object level by level, without recursion, and stops as soon as a limit is exceeded.
+        """
+        max_nodes = self.max_nodes
+        max_depth = self.max_depth
+        max_list_length = self.max_list_length
+        max_string_bytes = self.max_string_bytes
+        # a string can't have more bytes than 4 times its length, so only longer strings need to be encoded
+        max_string_length_without_encoding = max_string_bytes // 4 if max_string_bytes is not None else None
+        nodes = 0
+        # the number of dictionaries and lists that are nested in each other, counting the ones on this level
+        depth = 0
+        level = [obj]
+        while level:
+            depth += 1
+            too_deep = max_depth is not None and depth > max_depth
+            nodes += len(level)
+            if max_nodes is not None and nodes > max_nodes:
+                _fail_on_limit('max_nodes', "the object contains more than %d values" % max_nodes)
+            next_level = []
+            for val in level:
+                if too_deep and isinstance(val, (dict, list)):
+                    _fail_on_limit('max_depth', "the object is nested more than %d levels deep" % max_depth)
+                if isinstance(val, dict):
+                    if max_string_bytes is not None:
+                        for k in val:
+                            if isinstance(k, str) and len(k) > max_string_length_without_encoding:
+                                self._check_string(k)
+                    next_level.extend(val.values())
+                elif isinstance(val, list):
+                    if max_list_length is not None and len(val) > max_list_length:
+                        _fail_on_limit('max_list_length', "a list has %d elements, but at most %d are allowed" %
+                                       (len(val), max_list_length))
+                    next_level.extend(val)
+                elif isinstance(val, str):
+                    if max_string_bytes is not None and len(val) > max_string_length_without_encoding:
+                        self._check_string(val)
+                    continue
+                else:
+                    continue
+                if max_nodes is not None and nodes + len(next_level) > max_nodes:
+                    _fail_on_limit('max_nodes', "the object contains more than %d values" % max_nodes)
+            level = next_level
+
+    def _check_string(self, val):
+        # every character has at least one byte
+        if len(val) > self.max_string_bytes or len(val.encode('utf-8', 'surrogatepass')) > self.max_string_bytes:
+            _fail_on_limit('max_string_bytes', "a string is longer than %d bytes" % self.max_string_bytes)
+
+
+def _fail_on_limit(limit, message):
+    raise InputLimitExceededException("the input is too large: %s." % message, limit)
+
+
+class _ValidationLimitCounter:
+    """
+    counts what validation does, for the limits that can only be checked while validating.
+    """
+    __slots__ = ('limits', 'nodes', 'ambiguity_resolutions', 'base_node_trace_length')
+
+    def __init__(self, limits, base_node_trace_length):
+        self.limits = limits
+        self.nodes = 0
+        self.ambiguity_resolutions = 0
+        # the length of the node_trace at the top-level object
+        self.base_node_trace_length = base_node_trace_length
+
+    def count_node(self, stack_objects, obj):
+        self.nodes += 1
+        limits = self.limits
+        if limits.max_nodes is not None and self.nodes > limits.max_nodes:
+            _fail_on_limit('max_nodes', "validating it takes more than %d Nodes" % limits.max_nodes)
+        max_depth = limits.max_depth
+        if max_depth is not None:
+            # each step in the node_trace goes from a dictionary or list to one of its values,
+            # except for the conversion from a shortform, which replaces the value with a dictionary
+            node_trace = stack_objects['node_trace']
+            depth = len(node_trace) - self.base_node_trace_length
+            if isinstance(obj, (dict, list, collections.abc.Mapping)):
+                depth += 1
+            if depth > max_depth:
+                depth -= node_trace[self.base_node_trace_length:].count('conversion from shortform')
+                if depth > max_depth:
+                    _fail_on_limit('max_depth', "the object is nested more than %d levels deep" % max_depth)
+
+    def count_ambiguity_resolution(self):
+        self.ambiguity_resolutions += 1
+        max_ambiguity_resolutions = self.limits.max_ambiguity_resolutions
+        if max_ambiguity_resolutions is not None and self.ambiguity_resolutions > max_ambiguity_resolutions:
+            _fail_on_limit('max_ambiguity_resolutions', "the type of more than %d Nodes has to be found out. "
+                           "Please specify the 'type' fields" % max_ambiguity_resolutions)
+
+
+def set_validation_limits(stack_objects, limits):
+    """
+    makes validation with the given stack_objects check the ValidationLimits that can only be checked while validating.
+    """
+    stack_objects['validation_limits'] = _ValidationLimitCounter(limits, len(stack_objects['node_trace']))
+    # the counts are shared, not copied, when several candidates are tried to resolve ambiguity
+    if 'validation_limits' not in stack_objects['immutable_fields']:
+        stack_objects['immutable_fields'].append('validation_limits')
+
+
+#####################################################################################
+# reusing validation results
+#####################################################################################
+
+
+# Code that builds objects bottom-up, like generator.py, has already validated the parts of an object
+# by the time it validates the whole. Validating each part again for every level above it
+# makes the total cost grow with the depth of the object.
+# Instead, the results can be given to execute_function_on_node(), which returns them without validating again.
+# They are looked up by the identity of the object, not by its content,
+# so they can only be used for the very objects they were created for.
+
+
+def set_prevalidated_objects(stack_objects, prevalidated_objects):
+    """
+    makes validation with the given stack_objects reuse earlier results.
+    prevalidated_objects maps the id() of an object to a tuple of (object, validated object).
+    The caller must make sure that each object was validated with the same kwargs and value or choice
+    that it is validated with here, and that nothing modifies the validated objects.
+    """
+    stack_objects['prevalidated_objects'] = prevalidated_objects
+    # the results are shared, not copied, when several candidates are tried to resolve ambiguity
+    if 'prevalidated_objects' not in stack_objects['immutable_fields']:
+        stack_objects['immutable_fields'].append('prevalidated_objects')
+
+
+#####################################################################################
+# registries
+#####################################################################################
+
+
+# A Registry holds everything that is known about one schema:
+# its Nodes, the tables used to look them up, and the documentation generated for them.
+# Nodes are declared into the active Registry, which is the default Registry unless another one has been activated
+# with Registry.activate(). Several schemas (for example several versions of the same schema) can be loaded
+# side by side in one process by declaring each of them while its own Registry is active.
+# The module-level functions like finalize() and get_final_documentation_html() act on the active Registry.
+#
+# finalize() freezes the tables of a Registry into read-only mappings and tuples,
+# which any number of threads can read without locking, including on free-threaded builds of Python.
+# Everything that is still computed on demand afterwards (the deferred build in lazy mode,
+# the documentation pages and the schema fingerprint) is computed under the lock of the Registry,
+# and only published once it is complete.
+
+
+class Registry:
+    """
+    the Nodes and the documentation of one schema.
+    """
+    def __init__(self, name=None, lazy=None):
+        self.name = name
+        # reentrant, because building the schema validates default values, which can look up Nodes again
+        self.lock = threading.RLock()
+        # whether lazy mode is used (see set_lazy_schema_declaration()). None means the module-level setting is used.
+        self.lazy = lazy
+        # all of these are set while the Nodes are declared.
+        # They are used to map values, choices, and classes to each other.
+        self.all_nodes = []
+        self.value_to_node = {}
+        self.value_to_choice = {}
+        # for each Node, stores a list of tuples of (field_name, Field)
+        self.value_to_node_fields = {}
+        # a dict mapping 'choice_of' to a dict mapping 'choice_type' to 'name'
+        self.choice_to_type_to_values = collections.defaultdict(dict)
+        # these exist for debugging purposes
+        self.referenced_values = {}
+        self.referenced_choices = {}
+        self.finalize_has_been_called = False
+        self.is_frozen = False
+        # set while the Nodes are declared, to determine where their documentation goes
+        self.documentation_pages = []
+        self.current_documentation_page = None
+        self.documentation_target_to_page = {}
+        self.documentation_target_to_hierarchy_level = {}
+        self.choice_to_description = {}
+        self.stack_of_choices_for_documentation_hierarchy = []
+        self.page_to_url = None
+        self.documentation_cache_directory = None
+        # the generated documentation, and the rendered HTML of documentation strings and links.
+        # These only depend on the schema and on page_to_url, so they are replaced when the latter changes.
+        self._final_documentation_html = {}
+        self._enriched_html_cache = {}
+        self._enriched_link_cache = {}
+        self._field_documentation_html_cache = {}
+        self._schema_fingerprint = None
+        # lazy mode, see _build_pending_schema()
+        self._schema_build_is_pending = False
+        self._schema_is_being_built = False
+        # the exception that the deferred build of the schema raised. The Registry can't be used after that.
+        self._schema_build_error = None
+        self._finalize_was_deferred = False
+        # tuples of (Node, documentation_page, stack_of_choices), in the order in which the Nodes were declared
+        self._pending_node_declarations = []
+        # tuples of (module, Field) for Fields whose default value still needs to be validated
+        self._pending_field_default_validations = []
+        self._fields_declared_since_last_node = []
+        # how long it took to declare those Fields. Only measured in lazy mode.
+        self._field_declaration_seconds_since_last_node = 0.0
+        # for each module that declares Nodes, how long it took to declare them
+        self._schema_import_report = collections.OrderedDict()
+        # maps the name of a Node to a function that does the same as Node.validate(), but was generated ahead of time.
+        # See codegen.py. This is replaced as a whole instead of being modified, so readers never see a partial update.
+        self.generated_node_validators = {}
+        # maps tuples of (function, value, choice) to functions that do the same as execute_function_on_node()
+        # after its checks, but were generated ahead of time. See codegen.py. This is also replaced as a whole.
+        self.generated_dispatchers = {}
+        # maps each container Field that has been validated in parallel to whether its elements can reach a Node
+        # that mutates the stack_objects (see validate_elements()). Only filled in after the Registry is frozen.
+        self._field_may_mutate_stack_objects_cache = {}
+        # maps each Node to what parsing.parse_json_for_validation() needs to know about it
+        self._json_parsing_node_info_cache = {}
+        # tuples of (value, choice, names of the kwargs) that execute_function_on_node() has already checked
+        # against the required_additional_arguments_for_validation of the Nodes. Only filled in after the Registry is frozen.
+        self._valid_kwargs_signatures = set()
+
+    def __repr__(self):
+        return "<Registry %s>" % (self.name,)
+
+    def is_lazy(self):
+        return _lazy_schema_declaration if self.lazy is None else self.lazy
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        makes this the active Registry until the block is left.
+        Nodes declared inside the block are declared into this Registry,
+        and execute_function_on_node() looks up Nodes in it.
+        This only affects the current thread (or asyncio task). New threads start out with the default Registry,
+        so either activate the Registry in each worker thread, or pass it to execute_function_on_node().
+        """
+        token = _active_registry.set(self)
+        try:
+            yield self
+        finally:
+            _active_registry.reset(token)
+
+    ##### declaring Nodes #####
+
+    def _declare_node(self, cls):
+        """
+        called when a non-abstract Node is declared while this Registry is active.
+        """
+        with self.lock:
+            if self.finalize_has_been_called:
+                raise ProgrammingError("can't define any more Nodes! finalize() has already been called!")
+            cls.Meta.registry = self
+            # the documentation context needs to be captured now, because it changes while Nodes are declared
+            declaration = (cls, self.current_documentation_page,
+                           list(self.stack_of_choices_for_documentation_hierarchy))
+            if self.is_lazy():
+                # only record the raw definition. It is processed by _build_pending_schema() on first use.
+                self._pending_node_declarations.append(declaration)
+                self._schema_build_is_pending = True
+            else:
+                _process_node_declaration(self, *declaration)
+
+    def _register_that_a_node_was_defined(self, cls):
+        """
+        registers that a Node was defined.
+        This sets various mappings so that nodes can later be referenced by their 'name' or 'choice'.
+        This is also used by finalize() for confirming that all usages add up properly.
+        """
+        value = cls.Meta.name
+        choice_of = getattr(cls.Meta, 'choice_of', None)
+        choice_type = getattr(cls.Meta, 'choice_type', None)
+        self.all_nodes.append(cls)
+        if value in self.value_to_node:
+            raise ProgrammingError("can't define two nodes with the same name/value: %s" % value)
+        self.value_to_node[value] = cls
+        if choice_of is not None:
+            if choice_type is None:
+                raise ProgrammingError("if a 'choice_of' is given, a 'choice_type' must also be given.")
+            self.value_to_choice[value] = (choice_of, choice_type)
+            type_to_value = self.choice_to_type_to_values[choice_of]
+            if choice_type in type_to_value:
+                raise ProgrammingError("can't define the type '%s' of choice '%s' twice" %
+                                                 (choice_type, choice_of,))
+            type_to_value[choice_type] = value
+
+    def register_that_a_value_was_referenced(self, value):
+        """
+        remembers that an entity in syntaxTrees or its derivatives made a reference to a Node by its 'value'.
+        This is used by finalize() for confirming that all usages add up properly.
+        References made after finalize() are verified immediately.
+        """
+        with self.lock:
+            if not self.is_frozen:
+                self.referenced_values[value] = True
+            elif value not in self.value_to_node:
+                raise ProgrammingError("the value '%s' was referenced but never defined" % value)
+
+    def register_that_a_choice_was_referenced(self, choice):
+        """
+        remembers that an entity in syntaxTrees or its derivatives made a reference to a group of Nodes
+        by their 'choice'.
+        This is used by finalize() for confirming that all references add up properly.
+        References made after finalize() are verified immediately.
+        """
+        with self.lock:
+            if not self.is_frozen:
+                self.referenced_choices[choice] = True
+            elif choice not in self.choice_to_type_to_values:
+                raise ProgrammingError("the choice '%s' was referenced but never defined" % choice)
+
+    def set_current_documentation_page(self, name):
+        """
+        this needs to be called in between definitions of nodes
+        in order to set on which page their documentation will go.
+        Names must correspond to the url of the page the documentation should be on.
+        """
+        with self.lock:
+            self._verify_that_nodes_can_still_be_declared()
+            if name not in self.documentation_pages:
+                self.documentation_pages.append(name)
+            self.current_documentation_page = name
+
+    def register_choice_for_documentation(self, choice, readable_name, description):
+        """
+        analogous to _register_node_for_documentation(), but for choice-summaries instead of Nodes.
+        Marks the Beginning of a block of choices.
+        """
+        with self.lock:
+            self._verify_that_nodes_can_still_be_declared()
+            # remember on which page this entry can be found
+            if choice in self.documentation_target_to_page:
+                raise ProgrammingError("this error is for debugging only. A duplicate value here should be impossible.")
+            self.documentation_target_to_page[choice] = self.current_documentation_page
+            # remember the entry
+            self.choice_to_description[choice] = (readable_name, description)
+            self.documentation_target_to_hierarchy_level[choice] = \
+                10 * (1 + len(self.stack_of_choices_for_documentation_hierarchy))
+            self.stack_of_choices_for_documentation_hierarchy.append(choice)
+
+    def register_end_of_choices(self, choice):
+        """
+        marks the end of a block of choices.
+        """
+        with self.lock:
+            self._verify_that_nodes_can_still_be_declared()
+            if self.stack_of_choices_for_documentation_hierarchy[-1] != choice:
+                raise ProgrammingError("wrong choice. Selected %s, but most recent choice is %s." %
+                                         (choice, self.stack_of_choices_for_documentation_hierarchy[-1]))
+            self.stack_of_choices_for_documentation_hierarchy.pop()
+
+    def _verify_that_nodes_can_still_be_declared(self):
+        if self.finalize_has_been_called:
+            raise ProgrammingError("the declaration of the schema can't be changed any more. "
+                                   "finalize() has already been called!")
+
+    ##### finalizing #####
+
+    def finalize(self):
+        """
+        finalizes the registration of Nodes
+        Once this is called, no new Nodes can be registered.
+        Also verifies that the connections between all registered Nodes make sense and nothing is missing,
+        and then freezes the tables of the Registry.
+        In lazy mode, both are postponed until the schema is first used.
+        """
+        with self.lock:
+            self.finalize_has_been_called = True
+            if self.is_lazy():
+                self._finalize_was_deferred = True
+                self._schema_build_is_pending = True
+            else:
+                _verify_references_between_nodes(self)
+                self._freeze()
+
+    def _freeze(self):
+        """
+        replaces the tables by read-only copies.
+        Each table is replaced as a whole, so a thread that reads it concurrently sees either the old or the new one,
+        both of which are complete.
+        """
+        self.all_nodes = tuple(self.all_nodes)
+        self.value_to_node = types.MappingProxyType(dict(self.value_to_node))
+        self.value_to_choice = types.MappingProxyType(dict(self.value_to_choice))
+        self.value_to_node_fields = types.MappingProxyType({k: tuple(v) for k,v in self.value_to_node_fields.items()})
+        self.choice_to_type_to_values = types.MappingProxyType(
+            {k: types.MappingProxyType(dict(v)) for k,v in self.choice_to_type_to_values.items()})
+        self.referenced_values = types.MappingProxyType(dict(self.referenced_values))
+        self.referenced_choices = types.MappingProxyType(dict(self.referenced_choices))
+        self.documentation_pages = tuple(self.documentation_pages)
+        self.documentation_target_to_page = types.MappingProxyType(dict(self.documentation_target_to_page))
+        self.documentation_target_to_hierarchy_level = \
+            types.MappingProxyType(dict(self.documentation_target_to_hierarchy_level))
+        self.choice_to_description = types.MappingProxyType(dict(self.choice_to_description))
+        self.stack_of_choices_for_documentation_hierarchy = tuple(self.stack_of_choices_for_documentation_hierarchy)
+        self.is_frozen = True
+        _compile_kwargs_plans(self)
+
+    def ensure_schema_is_built(self):
+        """
+        this needs to be called before accessing any of the tables describing the schema.
+        It is cheap if there is nothing to do.
+        If several threads get here at once in lazy mode, one of them builds the schema and the others wait for it.
+        If the build fails, the schema is left partially built, so every later call fails as well.
+        """
+        if self._schema_build_is_pending:
+            with self.lock:
+                if self._schema_build_error is not None:
+                    raise ProgrammingError("the schema can't be used, because building it failed: %s" %
+                                           (self._schema_build_error,)) from self._schema_build_error
+                # the thread that is building the schema can get here again, and must not start over
+                if self._schema_build_is_pending and not self._schema_is_being_built:
+                    self._schema_is_being_built = True
+                    try:
+                        self._build_pending_schema()
+                    except BaseException as e:
+                        self._schema_build_error = e
+                        raise
+                    finally:
+                        self._schema_is_being_built = False
+                    self._schema_build_is_pending = False
+
+    def _build_pending_schema(self):
+        """
+        processes all Node declarations and default values that were postponed in lazy mode,
+        and runs the verification of finalize() if that was postponed as well.
+        """
+        pending_node_declarations = list(self._pending_node_declarations)
+        self._pending_node_declarations.clear()
+        for declaration in pending_node_declarations:
+            start_time = time.perf_counter()
+            _process_node_declaration(self, *declaration)
+            self._get_import_report_entry(declaration[0].__module__)['deferred_build_seconds'] += \
+                time.perf_counter() - start_time
+        # Fields that were declared after the last Node are not attributed to any module yet
+        self._attribute_declared_fields_to_module(None)
+        pending_field_default_validations = list(self._pending_field_default_validations)
+        self._pending_field_default_validations.clear()
+        for module, field in pending_field_default_validations:
+            start_time = time.perf_counter()
+            field.validate_the_default_value()
+            self._get_import_report_entry(module)['deferred_build_seconds'] += time.perf_counter() - start_time
+        if self._finalize_was_deferred:
+            self._finalize_was_deferred = False
+            _verify_references_between_nodes(self)
+            self._freeze()
+
+    def _defer_validation_of_default_value(self, field):
+        """
+        in lazy mode, remembers a newly declared Field so that its default value is validated later.
+        Returns False if it should be validated right away instead.
+        """
+        if not self.is_lazy():
+            return False
+        with self.lock:
+            if not self.is_lazy() or self.finalize_has_been_called:
+                return False
+            self._fields_declared_since_last_node.append(field)
+            self._schema_build_is_pending = True
+            return True
+
+    def _attribute_declared_fields_to_module(self, module):
+        """
+        Fields are declared in the body of a class, before the class itself is declared.
+        This assigns the Fields whose default values still need to be validated to the module of that class.
+        """
+        with self.lock:
+            for field in self._fields_declared_since_last_node:
+                self._pending_field_default_validations.append((module, field))
+            self._fields_declared_since_last_node.clear()
+
+    def _get_import_report_entry(self, module):
+        if module not in self._schema_import_report:
+            self._schema_import_report[module] = {
+                'nodes': 0,
+                'fields': 0,
+                'declaration_seconds': 0.0,
+                'deferred_build_seconds': 0.0,
+            }
+        return self._schema_import_report[module]
+
+    def get_schema_import_report(self):
+        """
+        returns a dictionary that maps each module that declared Nodes to a summary of how costly that was:
+        the number of Nodes and Fields declared in it, the time spent on bookkeeping while the module was imported
+        (in lazy mode, this includes declaring the Fields in the bodies of the Nodes),
+        and (in lazy mode) the time spent later in the deferred build of the schema.
+        Fields declared outside of any class are listed under None.
+        """
+        with self.lock:
+            return {k: dict(v) for k,v in self._schema_import_report.items()}
+
+    def get_list_of_fields_for_node(self, node_name):
+        """
+        returns the fields of a Node as a list of tuples of (field_name, field).
+        """
+        self.ensure_schema_is_built()
+        return self.value_to_node_fields[node_name]
+
+    ##### documentation #####
+
+    def get_final_documentation_html(self, page):
+        """
+        returns the documentation of a page.
+        This is cached, so that it is only calculated once per page,
+        but it is only evaluated the first time the documentation of that page is actually requested,
+        because calculating this when loading the server results in circular import errors
+        because the URLs are needed for the documentation,
+        but they are only set after the syntaxTrees files have been loaded.
+        If a cache directory has been set with set_documentation_cache_directory(),
+        the page is read from there if possible, and written there after generating it.
+        """
+        res = self._final_documentation_html.get(page)
+        if res is not None:
+            return res
+        self.ensure_schema_is_built()
+        with self.lock:
+            # another thread may have generated the page in the meantime
+            final_documentation_html = self._final_documentation_html
+            res = final_documentation_html.get(page)
+            if res is not None:
+                return res
+            if page not in self.documentation_pages:
+                raise ProgrammingError("there is no documentation page called '%s'" % (page,))
+            res = _read_documentation_page_from_disk_cache(self, page)
+            if res is None:
+                res = _generate_documentation_for_page(self, page)
+                _write_documentation_page_to_disk_cache(self, page, res)
+            final_documentation_html[page] = res
+        return res
+
+    def set_function_to_convert_page_name_to_url(self, func):
+        """
+        Set a function that can be used to convert from a website's name to its URL.
+        This can be a simple dictionary lookup.
+        If you are using Django, just use reverse_lazy as the input of this function.
+        """
+        with self.lock:
+            self.page_to_url = func
+            # the URLs are part of the documentation, so anything generated with the old function is outdated
+            self.clear_documentation_cache()
+            self._schema_fingerprint = None
+
+    def set_documentation_cache_directory(self, path):
+        """
+        Set a directory in which generated documentation pages are persisted.
+        Each page is stored in a file whose name contains the schema fingerprint (see get_schema_fingerprint()),
+        so a restarted process can serve the documentation without generating it again,
+        and any change to the Nodes, their Fields or the URLs of the pages automatically invalidates the old files.
+        Set this to None to disable the disk cache.
+        """
+        with self.lock:
+            self.documentation_cache_directory = path
+
+    def clear_documentation_cache(self):
+        """
+        forgets all documentation that has been generated in this process,
+        so that it is generated again (or read from the disk cache) the next time it is requested.
+        The caches are replaced instead of cleared, so that threads that are still rendering with the old ones
+        can't put outdated results into the new ones.
+        (Each cache is looked up before the caches it depends on, so they are replaced in the opposite order.)
+        """
+        with self.lock:
+            self._enriched_link_cache = {}
+            self._enriched_html_cache = {}
+            self._field_documentation_html_cache = {}
+            self._final_documentation_html = {}
+
+    def get_schema_fingerprint(self):
+        """
+        returns a hash that identifies the schema.
+        It covers the names of all Nodes and choices, the definitions and help texts of all Fields,
+        the documentation texts, and the URL of each documentation page.
+        Anything that is stored on the basis of the schema (like generated documentation) can be keyed by this,
+        so that it is automatically invalidated when the schema changes.
+        This should only be called after finalize().
+        """
+        res = self._schema_fingerprint
+        if res is None:
+            self.ensure_schema_is_built()
+            with self.lock:
+                if self._schema_fingerprint is None:
+                    self._schema_fingerprint = _compute_schema_fingerprint(self)
+                res = self._schema_fingerprint
+        return res
+
+    ##### generated validators #####
+
+    def install_generated_node_validators(self, validators):
+        """
+        installs functions that replace Node.validate() for the Nodes with the given names.
+        Nodes that overwrite validate() still run their own code, which reaches the generated function through super().
+        """
+        with self.lock:
+            generated_node_validators = dict(self.generated_node_validators)
+            generated_node_validators.update(validators)
+            self.generated_node_validators = generated_node_validators
+
+    def install_generated_dispatchers(self, dispatchers):
+        """
+        installs functions that execute_function_on_node() uses to select the Node and call its function.
+        """
+        with self.lock:
+            generated_dispatchers = dict(self.generated_dispatchers)
+            generated_dispatchers.update(dispatchers)
+            self.generated_dispatchers = generated_dispatchers
+
+    def uninstall_generated_node_validators(self):
+        """
+        goes back to using Node.validate() and the dispatch of execute_function_on_node() for all Nodes.
+        """
+        with self.lock:
+            self.generated_node_validators = {}
+            self.generated_dispatchers = {}
+
+
+_default_registry = Registry('default')
+_active_registry = contextvars.ContextVar('syntaxTrees_active_registry', default=_default_registry)
+
+
+def get_default_registry():
+    """
+    returns the Registry that is active unless another one has been activated.
+    """
+    return _default_registry
+
+
+def get_active_registry():
+    """
+    returns the Registry that Nodes are currently declared into and looked up in.
+    """
+    return _active_registry.get()
+
+
 #####################################################################################
 # documentation
 #####################################################################################
 
 
-_documentation_html_builder = {}
-_final_documentation_html = None
-_current_documentation_page = None
-_documentation_target_to_page = {}
+# bump this whenever the generated HTML changes, so that stale files in the disk cache are not used
+_documentation_format_version = 1
+
 
 def set_current_documentation_page(name):
     """
-    this needs to be called in between definitions of nodes in order to set on which page their documentation will go.
-    Names must correspond to the url of the page the documentation should be on.
+    sets on which page the documentation of the Nodes declared next will go.
+    See Registry.set_current_documentation_page().
     """
-    global _documentation_html_builder
-    global _current_documentation_page
-    # initialize a list, which will be turned into a single string in finalize()
-    _documentation_html_builder[name] = []
-    _current_documentation_page = name
+    get_active_registry().set_current_documentation_page(name)
+
+
+def set_documentation_cache_directory(path):
+    """
+    sets a directory in which generated documentation pages are persisted.
+    See Registry.set_documentation_cache_directory().
+    """
+    get_active_registry().set_documentation_cache_directory(path)
 
 
 def get_final_documentation_html(page):
     """
-    returns the documentation pages.
-    This is cached, so that it is only calculated once,
-    but it is only evaluated the first time the documentation is actually requested,
-    because calculating this when loading the server results in circular import errors
-    because the URLs are needed for the documentation,
-    but they are only set after the syntaxTrees files have been loaded.
+    returns the documentation of a page of the active Registry. See Registry.get_final_documentation_html().
     """
-    global _documentation_html_builder
-    global _final_documentation_html
-    choices_documented_so_far = {}
-    if _final_documentation_html is None:
-        # generate documentation for each Node
-        # and the first time a new choice is encountered in a Node, generate its documentation
-        for node in _all_nodes:
-            if hasattr(node.Meta, 'choice_of') and node.Meta.choice_of not in choices_documented_so_far:
-                choices_documented_so_far[node.Meta.choice_of] = True
-                _generate_documentation_for_choice(node.Meta.choice_of)
-            _generate_documentation_for_node(node)
-        # turn the entries in _documentation_html_builder from list of code pieces
-        # into a single large html string element
-        _final_documentation_html = {}
-        for k,v in _documentation_html_builder.items():
-            _final_documentation_html[k] = ''.join(v)
-    # return the result
-    return _final_documentation_html[page]
+    return get_active_registry().get_final_documentation_html(page)
+
+
+def register_choice_for_documentation(choice, readable_name, description):
+    """
+    marks the beginning of a block of choices. See Registry.register_choice_for_documentation().
+    """
+    get_active_registry().register_choice_for_documentation(choice, readable_name, description)
 
 
-_documentation_target_to_hierarchy_level = {}
+def register_end_of_choices(choice):
+    """
+    marks the end of a block of choices.
+    """
+    get_active_registry().register_end_of_choices(choice)
 
 
-def _register_node_for_documentation(node):
+def set_function_to_convert_page_name_to_url(func):
+    """
+    Set a function that can be used to convert from a website's name to its URL.
+    See Registry.set_function_to_convert_page_name_to_url().
+    """
+    get_active_registry().set_function_to_convert_page_name_to_url(func)
+
+
+def clear_documentation_cache():
+    """
+    forgets all documentation of the active Registry that has been generated in this process.
+    """
+    get_active_registry().clear_documentation_cache()
+
+
+def _register_node_for_documentation(registry, node, documentation_page, stack_of_choices):
     """
     registers information about a node for the purpose of generating documentation later.
     This needs to be called for each node before _generate_documentation_for_node() can be called,
     because otherwise references to Nodes that are defined later will not have been set yet.
+    The documentation_page and stack_of_choices are the values that were active when the Node was declared.
     """
     # remember on which page this entry can be found
-    global _documentation_target_to_page
-    if node.Meta.name in _documentation_target_to_page:
+    if node.Meta.name in registry.documentation_target_to_page:
         raise ProgrammingError("this error is for debugging only. A duplicate value here should be impossible.")
-    if hasattr(node.Meta, 'choice_of') and node.Meta.choice_of != _stack_of_choices_for_documentation_hierarchy[-1]:
+    if hasattr(node.Meta, 'choice_of') and node.Meta.choice_of != stack_of_choices[-1]:
         raise ProgrammingError("this is not the currently active block of choices!. Was %s, should be %s" %
-                                         (node.Meta.choice_of, _stack_of_choices_for_documentation_hierarchy[-1]))
-    _documentation_target_to_page[node.Meta.name] = _current_documentation_page
-    _documentation_target_to_hierarchy_level[node.Meta.name] = 10 * (1 + len(_stack_of_choices_for_documentation_hierarchy))
+                                         (node.Meta.choice_of, stack_of_choices[-1]))
+    registry.documentation_target_to_page[node.Meta.name] = documentation_page
+    registry.documentation_target_to_hierarchy_level[node.Meta.name] = 10 * (1 + len(stack_of_choices))
+
+
+def _generate_documentation_for_page(registry, page):
+    """
+    generates documentation for each Node on the given page,
+    and the first time a new choice is encountered in a Node, generates its documentation as well.
+    Choices are documented on the page on which they were registered, which need not be the page of the Node.
+    """
+    choices_documented_so_far = {}
+    html_builder = []
+    for node in registry.all_nodes:
+        if hasattr(node.Meta, 'choice_of') and node.Meta.choice_of not in choices_documented_so_far:
+            choices_documented_so_far[node.Meta.choice_of] = True
+            if registry.documentation_target_to_page[node.Meta.choice_of] == page:
+                html_builder.append(_generate_documentation_for_choice(registry, node.Meta.choice_of))
+        if registry.documentation_target_to_page[node.Meta.name] == page:
+            html_builder.append(_generate_documentation_for_node(registry, node))
+    return ''.join(html_builder)
+
+
+def _get_documentation_cache_file(registry, page):
+    """
+    returns the file in the disk cache that the documentation of the given page is stored in.
+    """
+    page_hash = hashlib.sha256(page.encode('utf-8')).hexdigest()[:32]
+    file_name = "documentation-v%d-%s-%s.html" % (_documentation_format_version, registry.get_schema_fingerprint(),
+                                                  page_hash,)
+    return os.path.join(registry.documentation_cache_directory, file_name)
 
 
-def _generate_documentation_for_node(node):
+def _read_documentation_page_from_disk_cache(registry, page):
+    """
+    returns the cached documentation of a page, or None if it is not in the disk cache.
+    """
+    if registry.documentation_cache_directory is None:
+        return None
+    try:
+        with open(_get_documentation_cache_file(registry, page), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_documentation_page_to_disk_cache(registry, page, res):
+    """
+    writes the documentation of a page to the disk cache.
+    The file is written under a temporary name first and then renamed,
+    so that several processes sharing the cache never see a partially written file.
+    Failing to write the cache is not an error, it just means that the page is generated again next time.
     """
-    takes a Node and generates documentation for it, adding it to the _documentation_html_builder.
+    if registry.documentation_cache_directory is None:
+        return
+    try:
+        os.makedirs(registry.documentation_cache_directory, exist_ok=True)
+        target_file = _get_documentation_cache_file(registry, page)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=registry.documentation_cache_directory,
+                                         suffix='.tmp', delete=False) as f:
+            f.write(res)
+        os.replace(f.name, target_file)
+    except OSError:
+        pass
+
+
+def _generate_documentation_for_node(registry, node):
+    """
+    takes a Node and returns the HTML documentation for it.
     This is called once for each non-abstract Node, in the order in which they are defined.
     """
     anchor_name = node.Meta.name
@@ -583,20 +1767,20 @@ def _generate_documentation_for_node(node):
     else:
         node_header_choice_addendum = ""
     name_in_navbar = node.Meta.documentation_name
-    node_header = _doc_string_to_enriched_html("[[%s]]%s" % (node.Meta.name, node_header_choice_addendum,))
-    level_of_hierarchy = _documentation_target_to_hierarchy_level[node.Meta.name]
+    node_header = _doc_string_to_enriched_html(registry, "[[%s]]%s" % (node.Meta.name, node_header_choice_addendum,))
+    level_of_hierarchy = registry.documentation_target_to_hierarchy_level[node.Meta.name]
     node_header = """<h3 class="node-name" level-of-hierarchy="%d" name-in-navbar="%s">%s%s</h3>""" % \
                   (level_of_hierarchy, name_in_navbar, anchor, node_header,)
     node_doc = node.Meta.documentation_description
     if node.Meta.documentation_shortform is not None:
         node_doc += "\nThis Node has a shortform (instead of specifying a JSON object / a dictionary, you can specify only a constant):\n%s" % \
                     node.Meta.documentation_shortform
-    node_doc = _doc_string_to_enriched_html(node_doc)
+    node_doc = _doc_string_to_enriched_html(registry, node_doc)
     node_description = """<div class="node-description">%s</div>""" % (node_doc,)
     field_descriptions = []
     field_table_header = """<tr><th class="field-cell-name">Fields</th><th/ class="field-cell-dummy"><th class="field-cell-null"></th><th class="field-cell-default"></th></tr>"""
     field_descriptions.append(field_table_header)
-    for field_name, field in _value_to_node_fields[node.Meta.name]:
+    for field_name, field in registry.value_to_node_fields[node.Meta.name]:
         # add the name and general information of the field
         default_value = json.dumps(field.default()) if callable(field.default) else json.dumps(field.default)
         if field.derived_field:
@@ -617,118 +1801,122 @@ def _generate_documentation_for_node(node):
         field_descriptions.append(field_html_2)
     field_descriptions = """<table class="fields">%s</table>""" % (''.join(field_descriptions),)
     res = """<div class="node">%s%s%s</div>""" % (node_header, node_description, field_descriptions)
-    # add the entry to the list of documentations for this page
-    _documentation_html_builder[_documentation_target_to_page[node.Meta.name]].append(res)
-
+    return res
 
-_choice_to_description = {}
-_stack_of_choices_for_documentation_hierarchy = []
 
-
-def register_choice_for_documentation(choice, readable_name, description):
-    """
-    analogous to _register_node_for_documentation(), but for choice-summaries instead of Nodes.
-    Marks the Beginning of a block of choices.
-    """
-    # remember on which page this entry can be found
-    global _documentation_target_to_page
-    if choice in _documentation_target_to_page:
-        raise ProgrammingError("this error is for debugging only. A duplicate value here should be impossible.")
-    _documentation_target_to_page[choice] = _current_documentation_page
-    # remember the entry
-    global _choice_to_description
-    _choice_to_description[choice] = (readable_name, description)
-    _documentation_target_to_hierarchy_level[choice] = 10 * (1 + len(_stack_of_choices_for_documentation_hierarchy))
-    _stack_of_choices_for_documentation_hierarchy.append(choice)
-
-
-def register_end_of_choices(choice):
-    """
-    marks the end of a block of choices.
-    """
-    if _stack_of_choices_for_documentation_hierarchy[-1] != choice:
-        raise ProgrammingError("wrong choice. Selected %s, but most recent choice is %s." %
-                                 (choice, _stack_of_choices_for_documentation_hierarchy[-1]))
-    _stack_of_choices_for_documentation_hierarchy.pop()
-
-
-def _generate_documentation_for_choice(choice):
+def _generate_documentation_for_choice(registry, choice):
     """
     analogous to _generate_documentation_for_node(), but for choice-summaries instead of Nodes.
     """
     # get the description that was saved earlier and enrich it
-    readable_name = _doc_string_to_enriched_html("[[%s]] (a choice of several types)" % choice)
-    description = _doc_string_to_enriched_html(_choice_to_description[choice][1])
+    readable_name = _doc_string_to_enriched_html(registry, "[[%s]] (a choice of several types)" % choice)
+    description = _doc_string_to_enriched_html(registry, registry.choice_to_description[choice][1])
     # create a header and description for the choice, and list all possible options of the choice
     anchor_name = choice
     anchor = """<a id="%s" class="internal-link-anchor"></a>""" % anchor_name
-    level_of_hierarchy = _documentation_target_to_hierarchy_level[choice]
-    name_in_navbar = _choice_to_description[choice][0]
+    level_of_hierarchy = registry.documentation_target_to_hierarchy_level[choice]
+    name_in_navbar = registry.choice_to_description[choice][0]
     choice_header = """<h3 class="choice-name" level-of-hierarchy="%d" name-in-navbar="%s">%s%s</h3>""" % \
                     (level_of_hierarchy, name_in_navbar, anchor, readable_name,)
     choice_description = """<div class="choice-description">%s</div>""" % (description,)
     choice_options = []
     table_header = """<tr><th class="choice-option-cell-type">type</th><th class="choice-option-cell-name">name</th><th class="choice-option-cell-description">description</th></tr>"""
-    for node in _all_nodes:
+    for node in registry.all_nodes:
         if hasattr(node.Meta, 'choice_of') and node.Meta.choice_of == choice:
             choice_option_type = """[[%s|%s]]""" % (node.Meta.name, node.Meta.choice_type)
-            choice_option_type = _doc_string_to_enriched_html(choice_option_type)
+            choice_option_type = _doc_string_to_enriched_html(registry, choice_option_type)
             choice_option_name = """[[%s|%s]]""" % (node.Meta.name, node.Meta.documentation_name)
-            choice_option_name = _doc_string_to_enriched_html(choice_option_name)
+            choice_option_name = _doc_string_to_enriched_html(registry, choice_option_name)
             choice_option_description = node.Meta.documentation_description
-            choice_option_description = _doc_string_to_enriched_html(choice_option_description)
+            choice_option_description = _doc_string_to_enriched_html(registry, choice_option_description)
             option_html = """<tr class="choice-option"><td>%s</td><td>%s</td><td>%s</td></tr>""" % \
                           (choice_option_type, choice_option_name, choice_option_description,)
             choice_options.append(option_html)
     choice_options = """<table class="choice-options">%s%s</table>""" % (table_header, ''.join(choice_options),)
     res = """<div class="choice">%s%s%s</div>""" % (choice_header, choice_description, choice_options)
-    # add the entry to the list of documentations for this page
-    _documentation_html_builder[_documentation_target_to_page[choice]].append(res)
+    return res
+
 
+# the markup used in documentation strings consists of links of the form [[name|optional_text_of_link]]
+# and linebreaks, which separate paragraphs
+_doc_markup_token_regex = re.compile(r"\[\[([a-zA-Z_\-]+)(?:\|([a-zA-Z_\-() ]+))?\]\]|\n")
 
-def _doc_string_to_enriched_html(s):
+
+def _doc_string_to_enriched_html(registry, s):
     """
     takes a documentation string and turns it into an enriched HTML string that can contain links.
+    The result is memoized, because the same help texts and descriptions are rendered many times
+    when Fields are nested in other Fields, and the annotation links of visualizations are rendered once per object.
+    (The memoized results don't need a lock: if two threads render the same string at once, they get the same result.)
     """
-    # turn strings of this form into links: [[name|optional_text_of_link]]
-    link_shortforms = re.findall(r"(\[\[([a-zA-Z_\-]+)(\|([a-zA-Z_\-() ]+))?\]\])", s)
-    for link_shortform in link_shortforms:
-        target = link_shortform[1]
-        text = link_shortform[3]
-        # find out on which page the referenced value/choice is defined and set the link accordingly
-        page = _documentation_target_to_page[target]
-        global _page_to_url
-        if _page_to_url is None:
-            raise ProgrammingError("_page_to_url is not defined. "
-                                   "You need to call syntaxTrees.basics.set_function_to_convert_page_name_to_url() "
-                                   "to assign a URL to each page.")
-        url = _page_to_url(page)
-        href = "%s#%s" % (url, target)
-        if text == '':
-            # if the text is not given explicitly, use the documentation name corresponding to the Node or to the Choice
-            if target in _choice_to_description:
-                text = _choice_to_description[target][0]
-            else:
-                text = _value_to_node[target].Meta.documentation_name
-        # build a link out of this and replace the link_shortform with the finished link in the text
-        final_link = """<a href="%s">%s</a>""" % (href, text)
-        s = s.replace(link_shortform[0], final_link)
-    # replace linebreaks with paragraphs
-    s = ''.join("<p>%s</p>" % a.lstrip().rstrip() for a in s.split("\n") if a.lstrip().rstrip() != "")
-    return s
+    cache = registry._enriched_html_cache
+    res = cache.get(s)
+    if res is None:
+        res = _compile_doc_string_to_enriched_html(registry, s)
+        cache[s] = res
+    return res
 
 
-_page_to_url = None
+def _compile_doc_string_to_enriched_html(registry, s):
+    """
+    renders a documentation string in a single pass over the string:
+    links are replaced as they are encountered, and each linebreak ends a paragraph.
+    Empty paragraphs are skipped and the remaining ones are stripped of whitespace.
+    """
+    paragraphs = []
+    current_paragraph = []
+    position = 0
+    for token in _doc_markup_token_regex.finditer(s):
+        current_paragraph.append(s[position:token.start()])
+        position = token.end()
+        if token.group(1) is None:
+            # a linebreak
+            _add_enriched_html_paragraph(paragraphs, current_paragraph)
+            current_paragraph = []
+        else:
+            current_paragraph.append(_get_enriched_html_link(registry, token.group(1), token.group(2)))
+    current_paragraph.append(s[position:])
+    _add_enriched_html_paragraph(paragraphs, current_paragraph)
+    return ''.join(paragraphs)
 
 
-def set_function_to_convert_page_name_to_url(func):
+def _add_enriched_html_paragraph(paragraphs, paragraph_fragments):
     """
-    Set a function that can be used to convert from a website's name to its URL.
-    This can be a simple dictionary lookup.
-    If you are using Django, just use reverse_lazy as the input of this function.
+    a helper function for _compile_doc_string_to_enriched_html() that turns a list of fragments into a paragraph.
+    """
+    paragraph = ''.join(paragraph_fragments).strip()
+    if paragraph != "":
+        paragraphs.append("<p>%s</p>" % paragraph)
+
+
+def _get_enriched_html_link(registry, target, text):
     """
-    global _page_to_url
-    _page_to_url = func
+    returns the HTML link for a link of the form [[target|text]] in a documentation string.
+    The text is optional and can be None.
+    """
+    key = (target, text)
+    cache = registry._enriched_link_cache
+    res = cache.get(key)
+    if res is not None:
+        return res
+    # find out on which page the referenced value/choice is defined and set the link accordingly
+    page = registry.documentation_target_to_page[target]
+    page_to_url = registry.page_to_url
+    if page_to_url is None:
+        raise ProgrammingError("_page_to_url is not defined. "
+                               "You need to call syntaxTrees.basics.set_function_to_convert_page_name_to_url() "
+                               "to assign a URL to each page.")
+    url = page_to_url(page)
+    href = "%s#%s" % (url, target)
+    if text is None:
+        # if the text is not given explicitly, use the documentation name corresponding to the Node or to the Choice
+        if target in registry.choice_to_description:
+            text = registry.choice_to_description[target][0]
+        else:
+            text = registry.value_to_node[target].Meta.documentation_name
+    res = """<a href="%s">%s</a>""" % (href, text)
+    cache[key] = res
+    return res
 
 
 #####################################################################################
@@ -736,86 +1924,329 @@ def set_function_to_convert_page_name_to_url(func):
 #####################################################################################
 
 
-# all of these are set while the Nodes in syntaxTrees are defined.
-# They are used to map values, choices, and classes to each other.
-_all_nodes = []
-_value_to_node = {}
-_value_to_choice = {}
-# for each Node, stores a list of tuples of (field_name, Field)
-_value_to_node_fields = {}
-# a dict mapping 'choice_of' to a dict mapping 'choice_type' to 'name'
-_choice_to_type_to_values = collections.defaultdict(dict)
-# these exist for debugging purposes
-_debug_referenced_values = {}
-_debug_referenced_choices = {}
-_finalize_has_been_called = False
-
-
 def register_that_a_value_was_referenced(value):
     """
-    remembers that an entity in syntaxTrees or its derivatives made a reference to a Node by its 'value'.
-    This is used by finalize() for confirming that all usages add up properly.
+    remembers that a Node was referenced by its 'value'. See Registry.register_that_a_value_was_referenced().
     """
-    _debug_referenced_values[value] = True
+    get_active_registry().register_that_a_value_was_referenced(value)
 
 
 def register_that_a_choice_was_referenced(choice):
     """
-    remembers that an entity in syntaxTrees or its derivatives made a reference to a group of Nodes by their 'choice'.
-    This is used by finalize() for confirming that all references add up properly.
+    remembers that a group of Nodes was referenced by their 'choice'.
+    See Registry.register_that_a_choice_was_referenced().
     """
-    _debug_referenced_choices[choice] = True
+    get_active_registry().register_that_a_choice_was_referenced(choice)
 
 
-def _register_that_a_node_was_defined(cls):
+def finalize():
     """
-    registers that a Node was defined.
-    This sets various mappings so that nodes can later be referenced by their 'name' or 'choice'.
-    This is also used by finalize() for confirming that all usages add up properly.
+    finalizes the registration of Nodes in the active Registry. See Registry.finalize().
     """
-    if _finalize_has_been_called:
-        raise ProgrammingError("can't define any more Nodes! finalize() has already been called!")
-    value = cls.Meta.name
-    choice_of = getattr(cls.Meta, 'choice_of', None)
-    choice_type = getattr(cls.Meta, 'choice_type', None)
-    _all_nodes.append(cls)
-    if value in _value_to_node:
-        raise ProgrammingError("can't define two nodes with the same name/value: %s" % value)
-    _value_to_node[value] = cls
-    if choice_of is not None:
-        if choice_type is None:
-            raise ProgrammingError("if a 'choice_of' is given, a 'choice_type' must also be given.")
-        _value_to_choice[value] = (choice_of, choice_type)
-        type_to_value = _choice_to_type_to_values[choice_of]
-        if choice_type in type_to_value:
-            raise ProgrammingError("can't define the type '%s' of choice '%s' twice" %
-                                             (choice_type, choice_of,))
-        type_to_value[choice_type] = value
+    get_active_registry().finalize()
 
 
-def finalize():
+def _verify_references_between_nodes(registry):
     """
-    finalizes the registration of Nodes
-    Once this is called, no new Nodes can be registered.
-    Also verifies that the connections between all registered Nodes make sense and nothing is missing.
+    verifies that the connections between all registered Nodes make sense and nothing is missing.
     """
-    # debugging
-    global _finalize_has_been_called
-    _finalize_has_been_called = True
-    for used_value in _debug_referenced_values:
-        if used_value not in _value_to_node:
+    for used_value in registry.referenced_values:
+        if used_value not in registry.value_to_node:
             raise ProgrammingError("the value '%s' was referenced but never defined" % used_value)
-    for used_choice in _debug_referenced_choices:
-        if used_choice not in _choice_to_type_to_values:
+    for used_choice in registry.referenced_choices:
+        if used_choice not in registry.choice_to_type_to_values:
             raise ProgrammingError("the choice '%s' was referenced but never defined" % used_choice)
-    for choice in _choice_to_type_to_values.keys():
-        for value in _value_to_node.keys():
-            if choice == value:
-                raise ProgrammingError("there are both a choice and a value called '%s'." % choice)
-        if choice not in _choice_to_description:
+    for choice in registry.choice_to_type_to_values.keys():
+        if choice in registry.value_to_node:
+            raise ProgrammingError("there are both a choice and a value called '%s'." % choice)
+        if choice not in registry.choice_to_description:
             raise ProgrammingError("missing documentation for choice: %s" % choice)
 
 
+#####################################################################################
+# lazy declaration of schemas
+#####################################################################################
+
+
+# In lazy mode, declaring a Node only records its definition,
+# and the field tables, the validation of default values and the registration for documentation
+# are all done in bulk by Registry._build_pending_schema() the first time the schema is actually used.
+# This makes importing large schemas much faster, which matters for short-lived processes.
+# Lazy mode can be enabled with set_lazy_schema_declaration(), or with the environment variable SYNTAXTREES_LAZY_SCHEMA.
+# Either way it needs to be enabled before the modules defining the Nodes are imported.
+_lazy_schema_declaration = os.environ.get('SYNTAXTREES_LAZY_SCHEMA', '') not in ('', '0')
+
+
+def set_lazy_schema_declaration(lazy):
+    """
+    enables or disables lazy mode for all Registries that were not created with an explicit setting.
+    This only affects Nodes and Fields that are declared afterwards.
+    """
+    global _lazy_schema_declaration
+    _lazy_schema_declaration = lazy
+
+
+def _ensure_schema_is_built():
+    """
+    this needs to be called before accessing any of the tables describing the schema of the active Registry.
+    It is cheap if there is nothing to do.
+    """
+    get_active_registry().ensure_schema_is_built()
+
+
+def _record_node_declaration_cost(cls, seconds):
+    """
+    attributes the cost of declaring a Node class, including the Fields declared in its body, to its module.
+    """
+    registry = get_active_registry()
+    with registry.lock:
+        report_entry = registry._get_import_report_entry(cls.__module__)
+        if not getattr(cls.Meta, 'is_an_abstract_class', False):
+            report_entry['nodes'] += 1
+        report_entry['fields'] += len([v for v in cls.__dict__.values() if isinstance(v, Field)])
+        report_entry['declaration_seconds'] += seconds + registry._field_declaration_seconds_since_last_node
+        registry._field_declaration_seconds_since_last_node = 0.0
+        registry._attribute_declared_fields_to_module(cls.__module__)
+
+
+def get_schema_import_report():
+    """
+    returns the cost of declaring the Nodes of the active Registry, by module. See Registry.get_schema_import_report().
+    """
+    return get_active_registry().get_schema_import_report()
+
+
+#####################################################################################
+# generated validators
+#####################################################################################
+
+
+# returned by a generated dispatch function if it can't handle the object,
+# for example because the 'type' is missing and has to be found out by trying all candidates.
+# execute_function_on_node() then does the work itself.
+NOT_DISPATCHED = object()
+
+
+def install_generated_node_validators(validators):
+    """
+    installs functions that replace Node.validate() in the active Registry.
+    See Registry.install_generated_node_validators() and codegen.py.
+    """
+    get_active_registry().install_generated_node_validators(validators)
+
+
+def uninstall_generated_node_validators():
+    """
+    goes back to using Node.validate() for all Nodes of the active Registry.
+    """
+    get_active_registry().uninstall_generated_node_validators()
+
+
+#####################################################################################
+# observers
+#####################################################################################
+
+
+# Observers are notified about every call of execute_function_on_node() and every call of an entry point,
+# so that they can be used for profiling. See profiling.py.
+# As long as no observers are registered, this costs a single check per call.
+_execution_observers = []
+
+
+class ExecutionObserver:
+    """
+    base class for objects that want to be notified about calls of execute_function_on_node().
+    All methods are called in the thread that makes the call, and do nothing by default.
+    The calls are properly nested: every node_function_started() is followed by exactly one node_function_finished(),
+    and everything in between belongs to that call or to calls nested inside it.
+    """
+    def node_function_started(self, function, obj, stack_objects, value, choice):
+        """
+        called when execute_function_on_node() is called, before the Node is selected.
+        """
+        pass
+
+    def node_selected(self, node):
+        """
+        called when it is known which Node the function of the current call is run on.
+        If there was ambiguity, this is called after it has been resolved.
+        """
+        pass
+
+    def ambiguity_candidate_started(self, node):
+        """
+        called before the validation of an untyped object is attempted with one of several candidate Nodes.
+        """
+        pass
+
+    def ambiguity_candidate_finished(self, node, succeeded):
+        """
+        called after the validation of an untyped object has been attempted with one of several candidate Nodes.
+        """
+        pass
+
+    def node_function_finished(self, error):
+        """
+        called when execute_function_on_node() returns. The error is the exception it raised, or None.
+        """
+        pass
+
+    def entry_point_started(self, name):
+        """
+        called when a function decorated with observed_entry_point() is called.
+        """
+        pass
+
+    def entry_point_finished(self, name, seconds, error):
+        """
+        called when a function decorated with observed_entry_point() returns.
+        """
+        pass
+
+
+def add_execution_observer(observer):
+    """
+    registers an ExecutionObserver for all threads.
+    """
+    if observer in _execution_observers:
+        raise ProgrammingError("this observer has already been added.")
+    _execution_observers.append(observer)
+
+
+def remove_execution_observer(observer):
+    if observer not in _execution_observers:
+        raise ProgrammingError("this observer has not been added.")
+    _execution_observers.remove(observer)
+
+
+def _notify_observers(method_name, *args):
+    for observer in list(_execution_observers):
+        getattr(observer, method_name)(*args)
+
+
+def observed_entry_point(name):
+    """
+    a decorator for the public functions that use syntaxTrees, such as those in functions.py.
+    Reports each call and its latency to the observers.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _execution_observers:
+                return func(*args, **kwargs)
+            _notify_observers('entry_point_started', name)
+            start = time.perf_counter()
+            try:
+                res = func(*args, **kwargs)
+            except BaseException as e:
+                _notify_observers('entry_point_finished', name, time.perf_counter() - start, e)
+                raise
+            _notify_observers('entry_point_finished', name, time.perf_counter() - start, None)
+            return res
+        return wrapper
+    return decorator
+
+
+#####################################################################################
+# schema fingerprint
+#####################################################################################
+
+
+def get_schema_fingerprint():
+    """
+    returns a hash that identifies the schema of the active Registry. See Registry.get_schema_fingerprint().
+    """
+    return get_active_registry().get_schema_fingerprint()
+
+
+def _compute_schema_fingerprint(registry):
+    """
+    computes the value returned by Registry.get_schema_fingerprint().
+    """
+    page_to_url = registry.page_to_url
+    description = {
+        'nodes': [_describe_node_for_fingerprint(registry, node) for node in registry.all_nodes],
+        'choices': [[choice, registry.choice_to_description[choice], registry.documentation_target_to_page[choice],
+                     registry.documentation_target_to_hierarchy_level[choice]]
+                    for choice in sorted(registry.choice_to_description.keys())],
+        'pages': [[page, None if page_to_url is None else str(page_to_url(page))]
+                  for page in registry.documentation_pages],
+    }
+    serialized_description = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(serialized_description.encode('utf-8')).hexdigest()
+
+
+def _describe_node_for_fingerprint(registry, node):
+    """
+    a helper function for get_schema_fingerprint() that describes a Node as a JSON-serializable object.
+    """
+    meta_attributes = ['name', 'choice_of', 'choice_type', 'documentation_name', 'documentation_description',
+                       'documentation_shortform', 'required_additional_arguments_for_validation',
+                       'quietly_drop_superfluous_fields', 'shortform_field', 'shortform_conversion']
+    return {
+        'class': "%s.%s" % (node.__module__, node.__qualname__),
+        'meta': {a: _describe_value_for_fingerprint(getattr(node.Meta, a)) for a in meta_attributes
+                 if hasattr(node.Meta, a)},
+        'page': registry.documentation_target_to_page[node.Meta.name],
+        'hierarchy_level': registry.documentation_target_to_hierarchy_level[node.Meta.name],
+        'fields': [[field_name, _describe_value_for_fingerprint(field)]
+                   for field_name, field in registry.value_to_node_fields[node.Meta.name]],
+    }
+
+
+def _describe_value_for_fingerprint(val):
+    """
+    a helper function for get_schema_fingerprint() that turns the attributes of a Field, or anything else
+    that is used to define a schema, into a JSON-serializable object.
+    """
+    if val is None or isinstance(val, (str, int, float, bool)):
+        return val
+    if val is PASS_ARG_ALONG:
+        return '<PASS_ARG_ALONG>'
+    if isinstance(val, OverwriteKeywordArgOfField):
+        return {'<OverwriteKeywordArgOfField>': _describe_value_for_fingerprint(val.value)}
+    if isinstance(val, Field):
+        res = {'<class>': "%s.%s" % (type(val).__module__, type(val).__qualname__)}
+        for k,v in val.__dict__.items():
+            # (whether a Field is validated in parallel doesn't change which values are valid)
+            if k in ('order_of_creation', 'parallel', 'registry') or k.startswith('_'):
+                continue
+            if k == 'default' and callable(v):
+                # describe the default value, not the function that creates it
+                v = val.get_the_default_value()
+            res[k] = _describe_value_for_fingerprint(v)
+        return res
+    if isinstance(val, (list, tuple)):
+        return [_describe_value_for_fingerprint(a) for a in val]
+    if isinstance(val, dict):
+        return {str(k): _describe_value_for_fingerprint(v) for k,v in val.items()}
+    if callable(val):
+        # functions are identified by their name and their bytecode
+        res = getattr(val, '__qualname__', type(val).__qualname__)
+        code = getattr(val, '__code__', None)
+        if code is not None:
+            res += ":" + _describe_code_for_fingerprint(code)
+        return res
+    return "<%s>" % type(val).__qualname__
+
+
+def _describe_code_for_fingerprint(code):
+    """
+    returns a hash of a code object that is stable across processes.
+    (The repr() of nested code objects contains memory addresses, and the repr() of frozensets depends on hash seeds.)
+    """
+    consts = []
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            consts.append(_describe_code_for_fingerprint(const))
+        elif isinstance(const, frozenset):
+            consts.append(sorted(repr(a) for a in const))
+        else:
+            consts.append(repr(const))
+    serialized_consts = json.dumps([consts, code.co_names], sort_keys=True).encode('utf-8')
+    return hashlib.sha256(code.co_code + serialized_consts).hexdigest()
+
+
 #####################################################################################
 # helper functions
 #####################################################################################
@@ -835,7 +2266,7 @@ def simplify_stack_objects_current_object_for_display(stack_objects):
     depth = 2
 
     def _rec_shortener(obj, remaining_depth):
-        if isinstance(obj, dict):
+        if isinstance(obj, (dict, collections.abc.Mapping)):
             res = {}
             if len(obj) > max_dict_field_count:
                 return "[a dictionary with %d fields, which is too many to display here]" % len(obj)
@@ -893,9 +2324,10 @@ class node_trace_step:
 
 def get_list_of_fields_for_node(node_name):
     """
-    a helper function that returns the fields of a Node as a list of tuples of (field_name, field).
+    a helper function that returns the fields of a Node of the active Registry
+    as a list of tuples of (field_name, field).
     """
-    return _value_to_node_fields[node_name]
+    return get_active_registry().get_list_of_fields_for_node(node_name)
 
 
 def detailed_error_handler_with_node_trace(e, stack_objects):
@@ -905,6 +2337,9 @@ def detailed_error_handler_with_node_trace(e, stack_objects):
     logs it if it wasn't an InvalidParamsException,
     then raises it again as an InvalidParamsException.
     """
+    # a stopped execution is not the fault of the object or the code, and already says where it stopped
+    if isinstance(e, ExecutionLimitExceededException):
+        raise e
     node_trace = stack_objects['node_trace']
     simplify_stack_objects_current_object_for_display(stack_objects)
     current_object = stack_objects['current_object']
@@ -918,12 +2353,172 @@ def detailed_error_handler_with_node_trace(e, stack_objects):
     # Raise the error again, either as an InvalidParamsException or a ServersideProgrammingError
     # the functions in collabtoolsApi.py will react differently to these
     # (the former is just passed to the user as is. The latter is again enriched with the stacktrace and also logged.)
-    if isinstance(e, InvalidParamsException):
+    if isinstance(e, InputLimitExceededException):
+        raise InputLimitExceededException(error_message, e.limit)
+    elif isinstance(e, InvalidParamsException):
         raise InvalidParamsException(error_message)
     else:
         raise ProgrammingError(error_message)
 
 
+#####################################################################################
+# kwargs propagation plans
+#####################################################################################
+
+
+# Value, Choice and List Fields pass kwargs on to the Nodes they reference, after transforming them
+# with their own kwargs (see fields._get_kwargs_to_use()).
+# Instead of building a new dictionary for every Node that is validated, each Field compiles its transformation
+# into a KwargsPlan once, and the plan returns FrozenKwargs: read-only dictionaries that are interned,
+# so that all Fields that pass on the same kwargs share the same dictionary.
+# When the Registry is frozen, the plans of all its Fields are compiled,
+# and the kwargs they produce are checked against the Nodes they reference,
+# so that execute_function_on_node() only has to check kwargs with names it hasn't seen yet.
+# Only the functions defined by Node itself receive FrozenKwargs.
+# Nodes that override a function receive a copy, which they are free to modify.
+# Interning stops after this many distinct kwargs, in case the values of some kwargs keep changing.
+_MAX_INTERNED_KWARGS = 10000
+_interned_kwargs = {}
+
+
+class FrozenKwargs(dict):
+    """
+    a read-only dictionary of kwargs, which can be shared between any number of Nodes and threads.
+    """
+    __slots__ = ('signature', 'overwrites')
+
+    def __init__(self, items):
+        super().__init__(items)
+        # the names of the kwargs, which execute_function_on_node() checks
+        self.signature = frozenset(self)
+        # tuples of (name, value) for the kwargs given as OverwriteKeywordArgOfField
+        self.overwrites = tuple((k, v.value) for k,v in self.items() if isinstance(v, OverwriteKeywordArgOfField))
+
+    def _modify(self, *args, **kwargs):
+        raise ProgrammingError("kwargs are shared between Nodes and must not be modified.")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _modify
+
+    def __reduce__(self):
+        return (FrozenKwargs, (dict(self),))
+
+
+def _get_kwargs_for_node_function(node_function, kwargs):
+    """
+    returns the kwargs to pass to a function of a Node:
+    a modifiable copy of FrozenKwargs if the Node overrides the function, and the kwargs themselves otherwise.
+    """
+    if type(kwargs) is FrozenKwargs and node_function is not getattr(Node, node_function.__name__, None):
+        return dict(kwargs)
+    return kwargs
+
+
+def intern_kwargs(items):
+    """
+    returns FrozenKwargs with the items of the given dictionary,
+    which is the same object for all dictionaries with the same items, unless a value is not hashable.
+    """
+    # the types are part of the key, so that for example True and 1 are not mixed up
+    try:
+        key = tuple(sorted((k, type(v), v) for k,v in items.items()))
+        res = _interned_kwargs.get(key)
+    except TypeError:
+        return FrozenKwargs(items)
+    if res is None:
+        res = FrozenKwargs(items)
+        if len(_interned_kwargs) < _MAX_INTERNED_KWARGS:
+            res = _interned_kwargs.setdefault(key, res)
+    return res
+
+
+class KwargsPlan:
+    """
+    the kwargs transformation of one Field, precomputed. apply() returns the same as fields._get_kwargs_to_use().
+    """
+    def __init__(self, field_kwargs):
+        self.field_kwargs = dict(field_kwargs)
+        # the names of the kwargs that are copied from the given kwargs
+        self.passed_along = tuple(k for k,v in field_kwargs.items() if v is PASS_ARG_ALONG)
+        # if nothing is passed along, the result is the same every time unless something is overwritten
+        self.constant_kwargs = None if self.passed_along else intern_kwargs(self.field_kwargs)
+        # maps the values of the kwargs that are passed along to the result
+        self._values_to_kwargs = {}
+
+    def apply(self, given_kwargs):
+        if type(given_kwargs) is FrozenKwargs:
+            overwrites = given_kwargs.overwrites
+        else:
+            overwrites = tuple((k, v.value) for k,v in given_kwargs.items()
+                               if isinstance(v, OverwriteKeywordArgOfField))
+        if overwrites:
+            return intern_kwargs(self._build(given_kwargs, overwrites))
+        if not self.passed_along:
+            return self.constant_kwargs
+        values = tuple((type(v), v) for v in (given_kwargs[k] for k in self.passed_along))
+        try:
+            res = self._values_to_kwargs.get(values)
+        except TypeError:
+            return FrozenKwargs(self._build(given_kwargs, overwrites))
+        if res is None:
+            res = intern_kwargs(self._build(given_kwargs, overwrites))
+            if len(self._values_to_kwargs) < _MAX_INTERNED_KWARGS:
+                self._values_to_kwargs[values] = res
+        return res
+
+    def _build(self, given_kwargs, overwrites):
+        res = {}
+        for k,v in self.field_kwargs.items():
+            res[k] = given_kwargs[k] if v is PASS_ARG_ALONG else v
+        for k,v in overwrites:
+            res[k] = v
+        return res
+
+
+def get_kwargs_plan(field):
+    """
+    returns the KwargsPlan of a Field that has kwargs, compiling it if that hasn't happened yet.
+    """
+    plan = field.__dict__.get('_kwargs_plan')
+    if plan is None:
+        plan = KwargsPlan(field.kwargs)
+        field._kwargs_plan = plan
+    return plan
+
+
+def _compile_kwargs_plans(registry):
+    """
+    compiles the KwargsPlans of all Fields of the schema that reference Nodes,
+    and records the kwargs they produce as valid for the referenced Nodes if they are.
+    Kwargs that are invalid are not reported here, but when they are used, as before.
+    """
+    visited_fields = set()
+
+    def _compile(field):
+        if field in visited_fields:
+            return
+        visited_fields.add(field)
+        value = getattr(field, 'value', None)
+        choice = getattr(field, 'choice', None)
+        if isinstance(getattr(field, 'kwargs', None), dict) and (isinstance(value, str) or isinstance(choice, str)):
+            get_kwargs_plan(field)
+            if isinstance(value, str):
+                candidate_nodes = [registry.value_to_node[value]]
+            else:
+                candidate_nodes = [registry.value_to_node[a] for a in registry.choice_to_type_to_values[choice].values()]
+            try:
+                _check_kwargs_signature(candidate_nodes, field.kwargs)
+                registry._valid_kwargs_signatures.add((value, choice, frozenset(field.kwargs)))
+            except ProgrammingError:
+                pass
+        for a in field.__dict__.values():
+            if isinstance(a, Field):
+                _compile(a)
+
+    for node_fields in registry.value_to_node_fields.values():
+        for field_name, field in node_fields:
+            _compile(field)
+
+
 #####################################################################################
 # miscellaneous
 #####################################################################################
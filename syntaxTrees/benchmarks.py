@@ -0,0 +1,368 @@
+import argparse
+import gc
+import itertools
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+from . import basics
+from . import functions
+
+
+#####################################################################################
+# A benchmark suite for the entry points in functions.py.
+# Each entry point is run on synthetic trees of numerical_nodes of varying shape,
+# and the results are reported as JSON, so that different runs can be compared.
+#
+# Usage:
+#     python -m syntaxTrees.benchmarks --depth 2 4 --fan-out 2 8 --output results.json
+#     python -m syntaxTrees.benchmarks --compare old_results.json --output new_results.json
+#     python -m syntaxTrees.benchmarks --scaling
+#####################################################################################
+
+
+ENTRY_POINTS = ['validate', 'evaluate', 'visualize', 'document']
+# documentation does not depend on the tree, so it is left out of the scaling benchmarks
+SCALING_ENTRY_POINTS = ['validate', 'evaluate', 'visualize']
+
+
+#####################################################################################
+# synthetic trees
+#####################################################################################
+
+
+def build_synthetic_tree(depth, fan_out, typed=True, shortforms=False):
+    """
+    builds a numerical_node that is a complete tree of the given depth,
+    in which every inner node has fan_out children.
+    Inner nodes are alternately a sum and a constant_multiple whose 'rest' is a sum.
+    Leaves are constants, given either as full dicts or as shortforms (plain numbers).
+    If typed is False, the 'type' fields are left out, so that validation needs to resolve the ambiguity.
+    The tree contains no user_input, so it can be evaluated without asking for input.
+    """
+    def _node(type_, **fields):
+        res = {'type': type_} if typed else {}
+        res.update(fields)
+        return res
+
+    def _leaf(i):
+        val = (i % 7) - 3
+        return val if shortforms else _node('constant', val=val)
+
+    counter = itertools.count()
+
+    def _rec(remaining_depth):
+        if remaining_depth <= 0:
+            return _leaf(next(counter))
+        summands = [_rec(remaining_depth - 1) for _ in range(fan_out)]
+        if remaining_depth % 2 == 0:
+            # the constant part must be a small constant, so the result of evaluating it stays within its limits
+            return _node('constant_multiple', constant=_leaf(2), rest=_node('sum', summands=summands))
+        return _node('sum', summands=summands)
+    return _rec(depth)
+
+
+def count_nodes(obj):
+    """
+    counts the JSON objects and the shortforms in a tree of numerical_nodes.
+    """
+    if isinstance(obj, dict):
+        return 1 + sum(count_nodes(v) for v in obj.values())
+    if isinstance(obj, list):
+        return sum(count_nodes(a) for a in obj)
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        # numbers only appear as the values of constants, or as shortforms of constants
+        return 1
+    return 0
+
+
+#####################################################################################
+# measurements
+#####################################################################################
+
+
+def _get_entry_point(entry_point, raw_obj):
+    """
+    returns a function without arguments that runs the given entry point on the given tree once.
+    """
+    if entry_point == 'validate':
+        return lambda: functions.validate_example_object(raw_obj)
+    validated_obj = functions.validate_example_object(raw_obj)
+    if entry_point == 'evaluate':
+        return lambda: functions.evaluate_numerical_node(validated_obj)
+    if entry_point == 'visualize':
+        return lambda: functions.visualize_numerical_node_in_html(validated_obj)
+    if entry_point == 'document':
+        # documentation does not depend on the tree. Clear the cache so that it is actually generated.
+        def _document():
+            basics.clear_documentation_cache()
+            return functions.get_documentation_of_numerical_nodes()
+        return _document
+    raise ValueError("unknown entry point: %s" % entry_point)
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(function, min_time=0.2, min_iterations=3, max_iterations=100000):
+    """
+    calls the function repeatedly for at least min_time seconds and returns statistics about its latency.
+    Peak memory is measured in a separate call with tracemalloc, so that tracing does not distort the timings.
+    """
+    function()  # warm up
+    latencies = []
+    gc.collect()
+    start = time.perf_counter()
+    while len(latencies) < max_iterations:
+        t = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - t)
+        if len(latencies) >= min_iterations and time.perf_counter() - start >= min_time:
+            break
+    total_time = sum(latencies)
+    latencies.sort()
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    if not already_tracing:
+        tracemalloc.stop()
+    return {
+        'iterations': len(latencies),
+        'ops_per_second': len(latencies) / total_time if total_time > 0 else None,
+        'latency_seconds': {
+            'mean': total_time / len(latencies),
+            'min': latencies[0],
+            'p50': _percentile(latencies, 0.5),
+            'p90': _percentile(latencies, 0.9),
+            'p99': _percentile(latencies, 0.99),
+            'max': latencies[-1],
+        },
+        'peak_memory_bytes': peak - baseline,
+    }
+
+
+def run_benchmarks(depths=(2, 4), fan_outs=(2, 4), typed_variants=(True, False), shortform_variants=(False, True),
+                   entry_points=ENTRY_POINTS, min_time=0.2):
+    """
+    runs every entry point on every combination of the given parameters for the synthetic trees.
+    Returns a JSON-serializable dict.
+    """
+    results = []
+    for depth, fan_out, typed, shortforms in itertools.product(depths, fan_outs, typed_variants, shortform_variants):
+        raw_obj = build_synthetic_tree(depth, fan_out, typed=typed, shortforms=shortforms)
+        parameters = {'depth': depth, 'fan_out': fan_out, 'typed': typed, 'shortforms': shortforms}
+        node_count = count_nodes(raw_obj)
+        for entry_point in entry_points:
+            if entry_point == 'document' and results and any(r['entry_point'] == 'document' for r in results):
+                # documentation does not depend on the tree, so measure it only once
+                continue
+            result = measure(_get_entry_point(entry_point, raw_obj), min_time=min_time)
+            result['entry_point'] = entry_point
+            result['parameters'] = parameters
+            result['nodes'] = node_count
+            result['input_bytes'] = len(json.dumps(raw_obj))
+            result['seconds_per_node'] = result['latency_seconds']['mean'] / node_count
+            results.append(result)
+    return {
+        'environment': _get_environment(),
+        'results': results,
+    }
+
+
+def _result_key(result):
+    return (result['entry_point'],) + tuple(sorted(result['parameters'].items()))
+
+
+def compare_benchmarks(old, new, tolerance=0.1):
+    """
+    compares two results of run_benchmarks() and returns a list of the measurements that got slower
+    by more than the given relative tolerance, as dicts with the old and new median latencies.
+    (The median is used because it is much less sensitive to noise than the mean.)
+    """
+    old_results = {_result_key(a): a for a in old['results']}
+    regressions = []
+    for result in new['results']:
+        old_result = old_results.get(_result_key(result))
+        if old_result is None:
+            continue
+        old_median = old_result['latency_seconds']['p50']
+        new_median = result['latency_seconds']['p50']
+        if new_median > old_median * (1 + tolerance):
+            regressions.append({
+                'entry_point': result['entry_point'],
+                'parameters': result['parameters'],
+                'old_median_seconds': old_median,
+                'new_median_seconds': new_median,
+                'slowdown': new_median / old_median,
+            })
+    return regressions
+
+
+#####################################################################################
+# scaling
+# Absolute timings don't show if an entry point scales badly with the shape of its input.
+# These benchmarks sweep the size and the depth of the trees and fit a power law to the results,
+# so that anything that grows faster than linearly with the number of nodes can be flagged.
+#####################################################################################
+
+
+def fit_growth_exponent(sizes, values):
+    """
+    fits values = c * sizes^k with least squares on a log-log scale and returns k.
+    A k of about 1 means linear growth. Values that are not positive are ignored.
+    Returns None if there are fewer than two usable points.
+    """
+    points = [(math.log(s), math.log(v)) for s, v in zip(sizes, values) if s > 0 and v is not None and v > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, y in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def run_scaling_benchmarks(fan_outs=(2, 4, 8, 16, 32), depths=(4, 8, 12, 16), typed_variants=(True, False),
+                           entry_points=SCALING_ENTRY_POINTS, min_time=0.1, max_exponent=1.25):
+    """
+    measures how the runtime and the peak memory of each entry point grow with the size of the input.
+    There are two sweeps:
+    -'size': trees of depth 2 with increasing fan_out, so that the number of nodes grows while the depth stays fixed.
+    -'depth': chains with a fan_out of 1 and increasing depth, so that nesting grows with the number of nodes.
+    For each sweep, entry point and typed variant, the growth exponent of the median latency and of the peak memory
+    over the number of nodes is fitted. Exponents above max_exponent are reported as super-linear.
+    Returns a JSON-serializable dict.
+    """
+    sweeps = [
+        ('size', [(2, fan_out) for fan_out in fan_outs]),
+        ('depth', [(depth, 1) for depth in depths]),
+    ]
+    results = []
+    for (sweep, shapes), typed, entry_point in itertools.product(sweeps, typed_variants, entry_points):
+        points = []
+        for depth, fan_out in shapes:
+            raw_obj = build_synthetic_tree(depth, fan_out, typed=typed)
+            measurement = measure(_get_entry_point(entry_point, raw_obj), min_time=min_time)
+            points.append({
+                'depth': depth,
+                'fan_out': fan_out,
+                'nodes': count_nodes(raw_obj),
+                'latency_seconds': measurement['latency_seconds']['p50'],
+                'peak_memory_bytes': measurement['peak_memory_bytes'],
+            })
+        nodes = [a['nodes'] for a in points]
+        time_exponent = fit_growth_exponent(nodes, [a['latency_seconds'] for a in points])
+        memory_exponent = fit_growth_exponent(nodes, [a['peak_memory_bytes'] for a in points])
+        results.append({
+            'sweep': sweep,
+            'entry_point': entry_point,
+            'typed': typed,
+            'points': points,
+            'time_exponent': time_exponent,
+            'memory_exponent': memory_exponent,
+            'super_linear': [name for name, exponent in [('time', time_exponent), ('memory', memory_exponent)]
+                             if exponent is not None and exponent > max_exponent],
+        })
+    return {
+        'environment': _get_environment(),
+        'max_exponent': max_exponent,
+        'scaling': results,
+    }
+
+
+def _print_scaling_summary(report, out):
+    for r in report['scaling']:
+        out.write("%-10s sweep=%-6s typed=%-5s nodes=%-14s time ~ n^%-6s memory ~ n^%-6s %s\n" %
+                  (r['entry_point'], r['sweep'], r['typed'],
+                   "%d..%d" % (r['points'][0]['nodes'], r['points'][-1]['nodes']),
+                   _format_exponent(r['time_exponent']), _format_exponent(r['memory_exponent']),
+                   "SUPER-LINEAR (%s)" % ", ".join(r['super_linear']) if r['super_linear'] else ""))
+
+
+def _format_exponent(exponent):
+    return "?" if exponent is None else "%.2f" % exponent
+
+
+def _get_environment():
+    return {
+        'python': sys.version,
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'schema_fingerprint': basics.get_schema_fingerprint(),
+        'timestamp': time.time(),
+    }
+
+
+def _print_summary(report, out):
+    for r in report['results']:
+        p = r['parameters']
+        out.write("%-10s depth=%-2d fan_out=%-3d typed=%-5s shortforms=%-5s nodes=%-7d %12.1f ops/s %10.2f us/node "
+                  "peak %d bytes\n" %
+                  (r['entry_point'], p['depth'], p['fan_out'], p['typed'], p['shortforms'], r['nodes'],
+                   r['ops_per_second'], r['seconds_per_node'] * 1e6, r['peak_memory_bytes']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the entry points of syntaxTrees.functions.")
+    parser.add_argument('--depth', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--fan-out', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--typed', choices=['yes', 'no', 'both'], default='both')
+    parser.add_argument('--shortforms', choices=['yes', 'no', 'both'], default='both')
+    parser.add_argument('--entry-points', nargs='+', choices=ENTRY_POINTS, default=ENTRY_POINTS)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="minimum number of seconds to spend on each measurement")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="a file with earlier results. Regressions are printed and fail the run.")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative slowdown that is tolerated when comparing with earlier results")
+    parser.add_argument('--scaling', action='store_true',
+                        help="instead of measuring fixed trees, sweep the size and the depth of the trees "
+                             "and report how the runtime and memory grow. Super-linear growth fails the run.")
+    parser.add_argument('--scaling-fan-outs', type=int, nargs='+', default=[2, 4, 8, 16, 32],
+                        help="the fan_outs of the trees of depth 2 in the 'size' sweep")
+    parser.add_argument('--scaling-depths', type=int, nargs='+', default=[4, 8, 12, 16],
+                        help="the depths of the chains in the 'depth' sweep")
+    parser.add_argument('--max-exponent', type=float, default=1.25,
+                        help="growth exponents above this are reported as super-linear")
+    args = parser.parse_args(argv)
+    variants = {'yes': (True,), 'no': (False,), 'both': (True, False)}
+    if args.scaling:
+        entry_points = [a for a in args.entry_points if a in SCALING_ENTRY_POINTS]
+        report = run_scaling_benchmarks(fan_outs=args.scaling_fan_outs, depths=args.scaling_depths,
+                                        typed_variants=variants[args.typed], entry_points=entry_points,
+                                        min_time=args.min_time, max_exponent=args.max_exponent)
+        _print_scaling_summary(report, sys.stdout)
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=4)
+        return 1 if any(r['super_linear'] for r in report['scaling']) else 0
+    report = run_benchmarks(depths=args.depth, fan_outs=args.fan_out, typed_variants=variants[args.typed],
+                            shortform_variants=variants[args.shortforms], entry_points=args.entry_points,
+                            min_time=args.min_time)
+    _print_summary(report, sys.stdout)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old_report = json.load(f)
+        regressions = compare_benchmarks(old_report, report, tolerance=args.tolerance)
+        for r in regressions:
+            sys.stdout.write("REGRESSION: %s %s: %.2fx slower\n" % (r['entry_point'], r['parameters'], r['slowdown']))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
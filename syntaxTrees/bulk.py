@@ -0,0 +1,182 @@
+import argparse
+import collections
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from . import functions
+
+
+#####################################################################################
+# Validating or evaluating a large number of objects from the command line.
+# The objects are read as NDJSON (one JSON object per line) from a file or stdin, in chunks,
+# and the chunks are processed by a pool of worker processes.
+# Only a limited number of chunks is in flight at any time, so the input is never loaded into memory as a whole.
+# The validated objects or the results of the evaluation are written to the output in the order of the input.
+# Invalid lines are left out of the output and written to a separate file of errors instead,
+# as one JSON object per line with the line number, the error message and the type of the error.
+# Throughput statistics are printed to stderr at the end.
+# Evaluation can't ask for input here: user_input Nodes read an empty stdin and fall back to their 'on_error' value.
+#
+# Usage:
+#     syntaxTrees-bulk validate objects.ndjson --output validated.ndjson --errors errors.ndjson --workers 4
+#     cat objects.ndjson | syntaxTrees-bulk evaluate --errors errors.ndjson > results.ndjson
+#     python -m syntaxTrees.bulk validate objects.ndjson --workers 0
+#####################################################################################
+
+
+# the functions that each operation applies to the object, one after the other
+OPERATIONS = {
+    'validate': [functions.validate_example_object],
+    'evaluate': [functions.validate_example_object, functions.evaluate_numerical_node],
+}
+
+
+def _process_chunk(operation, lines):
+    """
+    processes a chunk of (line number, text) tuples.
+    Returns a list of tuples of (line number, JSON text of the result, or None if there was an error, the error).
+    The error is a dictionary that can be written to the file of errors.
+    """
+    res = []
+    # Nodes that interact with the user must not read the input or write into the output
+    original_stdin = sys.stdin
+    sys.stdin = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for line_number, text in lines:
+                try:
+                    obj = json.loads(text)
+                except ValueError as e:
+                    res.append((line_number, None, {'line': line_number, 'error': "the line is not valid JSON: %s" % e,
+                                                    'error_type': 'InvalidJSON'}))
+                    continue
+                try:
+                    for function in OPERATIONS[operation]:
+                        obj = function(obj)
+                    res.append((line_number, json.dumps(obj), None))
+                except Exception as e:
+                    res.append((line_number, None, {'line': line_number, 'error': str(e),
+                                                    'error_type': type(e).__name__}))
+    finally:
+        sys.stdin = original_stdin
+    return res
+
+
+def _read_chunks(f, chunk_size):
+    """
+    yields lists of (line number, text) tuples of the non-empty lines of the file. Line numbers start at 1.
+    """
+    chunk = []
+    for line_number, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        chunk.append((line_number, text))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkStatistics:
+    def __init__(self):
+        self.lines = 0
+        self.successes = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {
+            'lines': self.lines,
+            'successes': self.successes,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'lines_per_second': self.lines / self.seconds if self.seconds > 0 else None,
+        }
+
+
+def process_ndjson(operation, input_file, output_file, error_file, workers=None, chunk_size=256,
+                   max_chunks_in_flight=None):
+    """
+    applies an operation from OPERATIONS to each line of the input_file,
+    writes the results to the output_file in the order of the input, and the errors to the error_file.
+    With workers=0, everything is done in this process. With workers=None, one worker per CPU is used.
+    Returns a BulkStatistics.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("unknown operation '%s'. Valid operations are: %s" % (operation, ', '.join(OPERATIONS)))
+    statistics = BulkStatistics()
+    start = time.perf_counter()
+
+    def _write_results(results):
+        for line_number, text, error in results:
+            statistics.lines += 1
+            if error is None:
+                statistics.successes += 1
+                output_file.write(text + '\n')
+            else:
+                statistics.errors += 1
+                error_file.write(json.dumps(error) + '\n')
+
+    chunks = _read_chunks(input_file, chunk_size)
+    if workers == 0:
+        for chunk in chunks:
+            _write_results(_process_chunk(operation, chunk))
+    else:
+        # the workers are forked after functions.py has finalized the schema, so they start without delay
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_chunks_in_flight is None:
+            max_chunks_in_flight = 2 * workers
+        with context.Pool(workers) as pool:
+            in_flight = collections.deque()
+            for chunk in chunks:
+                if len(in_flight) >= max_chunks_in_flight:
+                    _write_results(in_flight.popleft().get())
+                in_flight.append(pool.apply_async(_process_chunk, (operation, chunk)))
+            while in_flight:
+                _write_results(in_flight.popleft().get())
+    statistics.seconds = time.perf_counter() - start
+    return statistics
+
+
+#####################################################################################
+# command line
+#####################################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate or evaluate the objects in an NDJSON file, "
+                                                 "one JSON object per line.")
+    parser.add_argument('operation', choices=list(OPERATIONS))
+    parser.add_argument('input', nargs='?', default='-', help="the NDJSON file, or - for stdin")
+    parser.add_argument('--output', default='-', help="the file for the results, or - for stdout")
+    parser.add_argument('--errors', default='-', help="the file for the errors, or - for stderr")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="the number of worker processes. 0 processes everything in this process. "
+                             "Defaults to the number of CPUs.")
+    parser.add_argument('--chunk-size', type=int, default=256, help="the number of lines a worker processes at once")
+    args = parser.parse_args(argv)
+    with contextlib.ExitStack() as stack:
+        input_file = sys.stdin if args.input == '-' else stack.enter_context(open(args.input))
+        output_file = sys.stdout if args.output == '-' else stack.enter_context(open(args.output, 'w'))
+        error_file = sys.stderr if args.errors == '-' else stack.enter_context(open(args.errors, 'w'))
+        statistics = process_ndjson(args.operation, input_file, output_file, error_file, workers=args.workers,
+                                    chunk_size=args.chunk_size)
+    s = statistics.to_dict()
+    sys.stderr.write("%d lines, %d succeeded, %d failed in %.2f seconds (%.1f lines/s)\n" %
+                     (s['lines'], s['successes'], s['errors'], s['seconds'], s['lines_per_second'] or 0.0))
+    return 1 if statistics.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,475 @@
+import hashlib
+import importlib
+import inspect
+import sys
+
+from . import basics
+from .utilities import ProgrammingError
+
+
+#####################################################################################
+# Generates a plain Python module with straight-line validation and dispatch functions for all registered Nodes.
+# Installing that module has three effects:
+# -Node.validate() is replaced by the generated functions,
+# which have the field order, the defaults and the error messages of each Node hardcoded,
+# instead of looking them up and sorting the result for every object.
+# -execute_function_on_node() uses generated dispatch functions for 'validate' and 'evaluate'
+# with each 'value' and 'choice', which select the Node by the 'type' of the object from a hardcoded table
+# and call the generated validator directly. They only call the Node's own function if its class overrides it.
+# execute_function_on_node() still does its checks, counts the execution budget and the validation limits first,
+# and does everything itself if observers are registered or the 'type' has to be found out by trying all candidates.
+# -If the schema was declared in lazy mode (see basics.set_lazy_schema_declaration()),
+# the field tables and the registration of the Nodes are taken from the generated module,
+# so the MRO of each Node is not walked and the default values are not validated again.
+# The generated module contains a fingerprint of the source code of the schema and of this library.
+# If it does not match the code that is actually loaded, the generated module is stale and is not installed.
+#
+# Usage:
+#     codegen.write_validator_module('my_schema_validators.py')   # after finalize(), e.g. in a build step
+#     ...
+#     basics.set_lazy_schema_declaration(True)
+#     from my_project import my_schema                             # declares the Nodes and calls finalize()
+#     codegen.install_validator_module('my_schema_validators')
+#####################################################################################
+
+
+def get_schema_source_fingerprint(module_names):
+    """
+    returns a hash of the source code of the given modules, and of the modules of this library.
+    Unlike basics.get_schema_fingerprint(), this can be computed without processing the schema,
+    so it can be checked cheaply at startup.
+    """
+    package = basics.__name__.rsplit('.', 1)[0]
+    library_modules = [package + '.basics', package + '.fields', package + '.codegen']
+    digest = hashlib.sha256()
+    for module_name in library_modules + sorted(module_names):
+        module = importlib.import_module(module_name)
+        try:
+            source = inspect.getsource(module)
+        except (OSError, TypeError):
+            raise ProgrammingError("can't read the source code of the module %s" % (module_name,))
+        digest.update(module_name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(source.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def generate_validator_module():
+    """
+    returns the source code of a module that contains generated validators for all registered Nodes.
+    This can only be called after finalize().
+    """
+    registry = basics.get_active_registry()
+    if not registry.finalize_has_been_called:
+        raise ProgrammingError("finalize() must be called before validators can be generated.")
+    registry.ensure_schema_is_built()
+    node_modules = sorted(set(node.__module__ for node in registry.all_nodes))
+    lines = [
+        '# This module was generated by syntaxTrees.codegen.generate_validator_module(). Do not edit it.',
+        '# Install it with syntaxTrees.codegen.install_validator_module().',
+        '',
+        'import collections',
+        'import collections.abc',
+        '',
+        'from %s import FrozenKwargs, NOT_DISPATCHED, node_trace_step' % basics.__name__,
+        'from %s.utilities import InvalidParamsException, ProgrammingError' % basics.__name__.rsplit('.', 1)[0],
+        '',
+        '',
+        'SCHEMA_SOURCE_FINGERPRINT = %r' % get_schema_source_fingerprint(node_modules),
+        'NODE_MODULES = %r' % node_modules,
+        '',
+        '# one entry for each Node, in the order in which they were declared:',
+        '# (name, module, qualname, choice_of, choice_type, documentation_page, documentation_hierarchy_level,',
+        '#  inherited Meta attributes, fields or None)',
+        '# and each field is described as (field_name, module, qualname of the defining class, attribute name)',
+        'NODE_DECLARATIONS = [',
+    ]
+    for node in registry.all_nodes:
+        lines.append('    %r,' % (_describe_node_declaration(registry, node),))
+    lines.append(']')
+    lines.append('')
+    lines.append('# set by codegen.install_validator_module(): the Node classes and the Field objects used by each Node, by index')
+    lines.append('NODES = {}')
+    lines.append('FIELDS = {}')
+    lines.append('')
+    validator_names = []
+    for i, node in enumerate(registry.all_nodes):
+        if node.Meta.name not in registry.value_to_node_fields:
+            # Nodes without any fields don't have a field table, so Node.validate() can't be used on them anyway
+            continue
+        lines.append('')
+        lines.append('')
+        lines.extend(_generate_validator_function(registry, i, node))
+        validator_names.append((node.Meta.name, '_validate_node_%d' % i))
+    lines.append('')
+    lines.append('')
+    lines.append('VALIDATORS = {')
+    for name, function_name in validator_names:
+        lines.append('    %r: %s,' % (name, function_name))
+    lines.append('}')
+    lines.extend(_generate_dispatchers(registry, set(name for name, function_name in validator_names)))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def write_validator_module(path):
+    """
+    generates the validator module and writes it to the given file.
+    """
+    source = generate_validator_module()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+
+
+def _describe_node_declaration(registry, node):
+    """
+    describes a Node for the NODE_DECLARATIONS of the generated module.
+    Only literals are used, so that the generated module can be read back without executing anything.
+    """
+    fields = None
+    if node.Meta.name in registry.value_to_node_fields:
+        fields = []
+        for field_name, field in registry.value_to_node_fields[node.Meta.name]:
+            defining_class, attribute_name = _find_definition_of_field(node, field_name, field)
+            fields.append((field_name, defining_class.__module__, defining_class.__qualname__, attribute_name))
+    inherited_meta = {}
+    for a in ['required_additional_arguments_for_validation', 'quietly_drop_superfluous_fields',
+              'documentation_name', 'documentation_description', 'documentation_shortform', 'mutates_stack_objects']:
+        val = getattr(node.Meta, a)
+        if not _is_literal(val):
+            raise ProgrammingError("can't generate code for the Meta.%s of the Node %s" % (a, node.Meta.name,))
+        inherited_meta[a] = val
+    _get_class_by_qualname(node.__module__, node.__qualname__)
+    return (node.Meta.name, node.__module__, node.__qualname__,
+            getattr(node.Meta, 'choice_of', None), getattr(node.Meta, 'choice_type', None),
+            registry.documentation_target_to_page[node.Meta.name],
+            registry.documentation_target_to_hierarchy_level[node.Meta.name],
+            inherited_meta, fields)
+
+
+def _find_definition_of_field(node, field_name, field):
+    """
+    returns the class and the name of the attribute under which the given Field of a Node was declared.
+    """
+    for superclass in node.mro():
+        for attribute_name in [field_name, field_name + '_']:
+            if superclass.__dict__.get(attribute_name) is field:
+                _get_class_by_qualname(superclass.__module__, superclass.__qualname__)
+                return superclass, attribute_name
+    raise ProgrammingError("can't find where the field %s of the Node %s was defined" % (field_name, node.Meta.name,))
+
+
+def _get_class_by_qualname(module_name, qualname):
+    """
+    returns a class given the name of its module and its qualified name.
+    """
+    if '<locals>' in qualname:
+        raise ProgrammingError("can't generate code for the class %s, because it is defined inside a function" % qualname)
+    res = importlib.import_module(module_name)
+    for a in qualname.split('.'):
+        res = getattr(res, a)
+    return res
+
+
+def _is_literal(val):
+    if val is None or isinstance(val, (str, int, float, bool)):
+        return True
+    if isinstance(val, (list, tuple)):
+        return all(_is_literal(a) for a in val)
+    return False
+
+
+def _generate_validator_function(registry, node_index, node):
+    """
+    generates the source code of a function that does exactly the same as Node.validate() for the given Node.
+    The loops over the fields are unrolled, and everything that only depends on the schema is hardcoded.
+    """
+    ordered_list_of_fields = registry.value_to_node_fields[node.Meta.name]
+    ordered_field_names = [a for a,b in ordered_list_of_fields]
+    allowed_keys = set(ordered_field_names) | set(node.Meta.quietly_drop_superfluous_fields)
+    if hasattr(node.Meta, 'choice_type'):
+        allowed_keys.add('type')
+    invalid_field_name_message = "'%%s' is not a valid field name.\nValid field names are:\n%s" % \
+                                 '\n'.join(ordered_field_names).replace('%', '%%')
+    lines = [
+        '# %s' % node.Meta.name,
+        '_ALLOWED_KEYS_%d = frozenset(%r)' % (node_index, sorted(allowed_keys)),
+        '',
+        '',
+        'def _validate_node_%d(cls, obj, stack_objects, kwargs):' % node_index,
+    ]
+    if hasattr(node.Meta, 'shortform_field'):
+        lines.extend([
+            '    if not isinstance(obj, (dict, collections.abc.Mapping)):',
+            '        with node_trace_step(stack_objects, \'conversion from shortform\', obj):',
+            '            cls.Meta.shortform_field.validate(obj)',
+            '            obj = cls.Meta.shortform_conversion(obj)',
+            '            if not isinstance(obj, dict):',
+            '                raise ProgrammingError("the shortform conversion did not return a dict")',
+        ])
+    else:
+        lines.extend([
+            '    if not isinstance(obj, (dict, collections.abc.Mapping)):',
+            '        raise InvalidParamsException("the value must be a dictionary")',
+        ])
+    lines.extend([
+        '    for k in obj.keys():',
+        '        if k not in _ALLOWED_KEYS_%d:' % node_index,
+        '            raise InvalidParamsException(%r %% (k,))' % invalid_field_name_message,
+        '    fields = FIELDS[%d]' % node_index,
+        '    res = collections.OrderedDict()',
+    ])
+    for field_index, (field_name, field) in enumerate(ordered_list_of_fields):
+        if field.dont_auto_validate:
+            continue
+        lines.extend([
+            '    # %s' % field_name,
+            '    if %r in obj:' % field_name,
+            '        field_value = obj[%r]' % field_name,
+            '        with node_trace_step(stack_objects, %r, field_value):' % field_name,
+            '            res[%r] = fields[%d].validate(field_value, stack_objects=stack_objects, kwargs=kwargs)' %
+            (field_name, field_index,),
+        ])
+        if field.required:
+            lines.extend([
+                '    else:',
+                '        raise InvalidParamsException(%r)' % ("missing value for the required field '%s'" % field_name),
+            ])
+        elif not field.dont_print_default:
+            if field.default is None or isinstance(field.default, (str, int, float, bool)):
+                default_expression = repr(field.default)
+            else:
+                default_expression = 'fields[%d].default()' % field_index
+            lines.extend([
+                '    else:',
+                '        res[%r] = %s' % (field_name, default_expression,),
+            ])
+        if not field.dont_print_default and not field.null:
+            lines.extend([
+                '    if res[%r] is None:' % field_name,
+                '        raise InvalidParamsException("the value must not be null")',
+            ])
+    lines.append('    return res')
+    return lines
+
+
+#####################################################################################
+# dispatch functions
+#####################################################################################
+
+
+# The functions that the dispatch functions can call, and the functions of the Nodes they call.
+_DISPATCHED_FUNCTIONS = ['validate', 'evaluate']
+
+
+def _generate_dispatchers(registry, names_of_nodes_with_validators):
+    """
+    generates the functions that call a function on a given Node, and the dispatch functions that select the Node.
+    Each of them does the same as the second half of execute_function_on_node(),
+    or returns NOT_DISPATCHED if the Node can only be found by trying out all candidates.
+    """
+    node_to_index = {node: i for i, node in enumerate(registry.all_nodes)}
+    lines = []
+    dispatchers = []
+    for function in _DISPATCHED_FUNCTIONS:
+        for i, node in enumerate(registry.all_nodes):
+            if not hasattr(node, function):
+                continue
+            lines.append('')
+            lines.append('')
+            lines.extend(_generate_node_function_call(function, i, node, node.Meta.name in names_of_nodes_with_validators))
+        # references by 'value'
+        for i, node in enumerate(registry.all_nodes):
+            if not hasattr(node, function):
+                continue
+            candidate_types = [node.Meta.choice_type] if hasattr(node.Meta, 'choice_type') else []
+            function_name = '_dispatch_%s_to_value_%d' % (function, i)
+            lines.extend([
+                '',
+                '',
+                'def %s(obj, stack_objects, kwargs):' % function_name,
+                '    return _%s_with_node_%d(obj, stack_objects, kwargs, %r)' % (function, i, tuple(candidate_types)),
+            ])
+            dispatchers.append(((function, node.Meta.name, None), function_name))
+        # references by 'choice'
+        for j, choice in enumerate(sorted(registry.choice_to_type_to_values)):
+            type_to_value = registry.choice_to_type_to_values[choice]
+            candidate_nodes = [registry.value_to_node[v] for v in type_to_value.values()]
+            if not candidate_nodes or not all(hasattr(a, function) for a in candidate_nodes):
+                continue
+            candidate_types = tuple(a.Meta.choice_type for a in candidate_nodes)
+            function_name = '_dispatch_%s_to_choice_%d' % (function, j)
+            if len(candidate_nodes) == 1:
+                lines.extend([
+                    '',
+                    '',
+                    '# %s' % choice,
+                    'def %s(obj, stack_objects, kwargs):' % function_name,
+                    '    return _%s_with_node_%d(obj, stack_objects, kwargs, %r)' %
+                    (function, node_to_index[candidate_nodes[0]], candidate_types),
+                ])
+            else:
+                table_name = '_%s_BY_TYPE_OF_CHOICE_%d' % (function.upper(), j)
+                empty_dictionary_message = "submitted an empty dictionary.\nValid types are: %s\n" \
+                                           "Select one of the valid types for a description of its fields." % \
+                                           ', '.join(a.Meta.name for a in candidate_nodes)
+                invalid_type_message = "the type '%%s' is not valid.\nValid types are: %s" % \
+                                       ', '.join(type_to_value.keys()).replace('%', '%%')
+                lines.extend([
+                    '',
+                    '',
+                    '# %s' % choice,
+                    '%s = {' % table_name,
+                ])
+                for choice_type, value in type_to_value.items():
+                    lines.append('    %r: _%s_with_node_%d,' % (choice_type, function, node_to_index[registry.value_to_node[value]]))
+                lines.extend([
+                    '}',
+                    '',
+                    '',
+                    'def %s(obj, stack_objects, kwargs):' % function_name,
+                    '    if not isinstance(obj, (dict, collections.abc.Mapping)):',
+                    '        return NOT_DISPATCHED',
+                    '    if len(obj) == 0:',
+                    '        raise InvalidParamsException(%r)' % empty_dictionary_message,
+                    '    if \'type\' not in obj:',
+                    '        return NOT_DISPATCHED',
+                    '    provided_type = obj[\'type\']',
+                    '    if provided_type not in %s:' % table_name,
+                    '        raise InvalidParamsException(%r %% (provided_type,))' % invalid_type_message,
+                    '    return %s[provided_type](obj, stack_objects, kwargs, %r)' % (table_name, candidate_types),
+                ])
+            dispatchers.append(((function, None, choice), function_name))
+    lines.extend([
+        '',
+        '',
+        '# maps (function, value, choice) to the dispatch function that execute_function_on_node() uses for them',
+        'DISPATCHERS = {',
+    ])
+    for key, function_name in dispatchers:
+        lines.append('    %r: %s,' % (key, function_name))
+    lines.append('}')
+    return lines
+
+
+def _generate_node_function_call(function, node_index, node, has_generated_validator):
+    """
+    generates a function that calls a function of a Node like execute_function_on_node() does once it has selected it.
+    The candidate_types are the types that validation may set, which are all types of the choice that was dispatched.
+    """
+    lines = [
+        '# %s.%s()' % (node.Meta.name, function),
+        'def _%s_with_node_%d(obj, stack_objects, kwargs, candidate_types):' % (function, node_index),
+        '    cls = NODES[%d]' % node_index,
+    ]
+    if getattr(node, function) is not getattr(basics.Node, function, None):
+        # the Node overrides the function. It gets kwargs it can modify, see basics._get_kwargs_for_node_function()
+        lines.extend([
+            '    if type(kwargs) is FrozenKwargs:',
+            '        kwargs = dict(kwargs)',
+            '    res = cls.%s(cls, obj, stack_objects, kwargs)' % function,
+        ])
+    elif has_generated_validator:
+        # the same as Node.validate(), which only uses the generated validator if the Node is not validated lazily
+        lines.extend([
+            '    if stack_objects.get(\'lazy_validation_depth\') == len(stack_objects[\'node_trace\']):',
+            '        res = cls.%s(cls, obj, stack_objects, kwargs)' % function,
+            '    else:',
+            '        res = _validate_node_%d(cls, obj, stack_objects, kwargs)' % node_index,
+        ])
+    else:
+        lines.append('    res = cls.%s(cls, obj, stack_objects, kwargs)' % function)
+    if function == 'validate' and hasattr(node.Meta, 'choice_type'):
+        choice_type = node.Meta.choice_type
+        lines.extend([
+            '    if isinstance(obj, dict) and \'type\' in obj and obj[\'type\'] != %r:' % choice_type,
+            '        raise ProgrammingError("the type was already given, but after validating "',
+            '                               "it is not the value of the selected Node. "',
+            '                               "This should not be possible.")',
+            '    if \'type\' in res:',
+            '        if res[\'type\'] not in candidate_types:',
+            '            raise ProgrammingError("after validating the type was already set, "',
+            '                                   "but is not one of the ones that was requested.")',
+            '    else:',
+            '        res[\'type\'] = %r' % choice_type,
+            '    res.move_to_end(\'type\', last=False)',
+        ])
+    lines.append('    return res')
+    return lines
+
+
+#####################################################################################
+# installing generated modules
+#####################################################################################
+
+
+def install_validator_module(module):
+    """
+    installs a module that was generated by generate_validator_module().
+    The module can be given as a module object or by name.
+    The modules defining the Nodes must have been imported before, and finalize() must have been called.
+    Returns True if the module was installed,
+    or False if it does not match the schema that is actually loaded and should be generated again.
+    """
+    if isinstance(module, str):
+        module = importlib.import_module(module)
+    registry = basics.get_active_registry()
+    if not registry.finalize_has_been_called:
+        raise ProgrammingError("finalize() must be called before a generated module can be installed.")
+    if get_schema_source_fingerprint(module.NODE_MODULES) != module.SCHEMA_SOURCE_FINGERPRINT:
+        return False
+    nodes = [_get_class_by_qualname(a[1], a[2]) for a in module.NODE_DECLARATIONS]
+    with registry.lock:
+        pending_nodes = [a[0] for a in registry._pending_node_declarations]
+        if pending_nodes:
+            # lazy mode: the schema has not been built yet, so build it from the generated tables
+            if pending_nodes != nodes or registry.all_nodes:
+                return False
+            _register_nodes_from_generated_module(registry, module, nodes)
+        elif list(registry.all_nodes) != nodes:
+            return False
+    # bind the Node classes and the Field objects used by the generated functions
+    for i, declaration in enumerate(module.NODE_DECLARATIONS):
+        module.NODES[i] = nodes[i]
+        if declaration[8] is not None:
+            module.FIELDS[i] = [field for field_name, field in registry.value_to_node_fields[declaration[0]]]
+    registry.install_generated_node_validators(module.VALIDATORS)
+    registry.install_generated_dispatchers(module.DISPATCHERS)
+    return True
+
+
+def _register_nodes_from_generated_module(registry, module, nodes):
+    """
+    does the same as Registry._build_pending_schema(), but takes the results from the generated module.
+    Since the source code has not changed since the module was generated,
+    the default values of the Fields and the references between the Nodes are known to be valid.
+    """
+    for node, declaration in zip(nodes, module.NODE_DECLARATIONS):
+        name, module_name, qualname, choice_of, choice_type, page, hierarchy_level, inherited_meta, fields = declaration
+        registry._register_that_a_node_was_defined(node)
+        if fields is not None:
+            registry.value_to_node_fields[name] = [
+                (field_name, _get_class_by_qualname(field_module, field_qualname).__dict__[attribute_name])
+                for field_name, field_module, field_qualname, attribute_name in fields
+            ]
+        for k,v in inherited_meta.items():
+            setattr(node.Meta, k, v)
+        registry.documentation_target_to_page[name] = page
+        registry.documentation_target_to_hierarchy_level[name] = hierarchy_level
+    registry._pending_node_declarations.clear()
+    registry._pending_field_default_validations.clear()
+    registry._fields_declared_since_last_node.clear()
+    registry._field_declaration_seconds_since_last_node = 0.0
+    registry._finalize_was_deferred = False
+    registry._freeze()
+    registry._schema_build_is_pending = False
+
+
+if __name__ == '__main__':
+    # python -m syntaxTrees.codegen <module that defines and finalizes the schema> <output file>
+    if len(sys.argv) != 3:
+        print("usage: python -m syntaxTrees.codegen <schema module> <output file>")
+        sys.exit(2)
+    importlib.import_module(sys.argv[1])
+    write_validator_module(sys.argv[2])
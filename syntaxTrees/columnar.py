@@ -0,0 +1,383 @@
+import array
+import bisect
+import collections
+import math
+
+from . import fields
+from . import serialization
+from .utilities import InvalidParamsException, ProgrammingError
+
+
+#####################################################################################
+# A columnar representation of many validated trees, for analytics and for evaluating trees in bulk.
+# Every Node, list, dict and primitive value in the trees is one row, and the rows are stored as parallel arrays
+# instead of as dicts. The rows of each tree are in depth-first order, so the rows of a subtree are contiguous,
+# and each row knows where its subtree ends, so that it can be skipped.
+# Nodes are identified by their index in the Registry and fields by their slot in the field table of the Node,
+# in the same way as in serialization.py, so any schema can be converted.
+# Queries like "all values of a field" or "the trees that contain a Node" become scans over the arrays.
+# The columns are array.array objects, so they can also be wrapped without copying, e.g. by numpy.frombuffer().
+#
+# Usage:
+#     columns = columnar.to_columns(validated_objects, choice='numerical_node')
+#     all_constants = columns.get_field_values('constant', 'val')
+#     trees_with_user_input = columns.get_trees_containing('user_input')
+#     results = functions.evaluate_numerical_nodes_in_columns(columns)
+#####################################################################################
+
+
+# the kind of value in each row
+KIND_NULL = 0
+KIND_BOOLEAN = 1
+KIND_INTEGER = 2
+KIND_FLOAT = 3
+KIND_STRING = 4
+KIND_LIST = 5
+KIND_DICT = 6
+KIND_NODE = 7
+# an integer that doesn't fit into 64 bits. Its decimal digits are stored like a string.
+KIND_LARGE_INTEGER = 8
+
+_min_integer = -(1 << 63)
+_max_integer = (1 << 63) - 1
+
+
+def to_columns(objects, value=None, choice=None, registry=None):
+    """
+    converts validated objects of the Node identified by 'value' or of the group of Nodes identified by 'choice'
+    into a ColumnarTrees, using the given Registry or the active Registry.
+    Parts of the objects that don't look like the result of a validation are still converted, as plain lists and dicts.
+    """
+    res = ColumnarTrees(registry)
+    for obj in objects:
+        res.append_tree(obj, value=value, choice=choice)
+    return res
+
+
+class ColumnarTrees:
+    """
+    a list of validated trees, stored as parallel arrays with one entry per row:
+    * kinds: one of the KIND_* constants.
+    * node_ids: the index of the Node in the Registry, for Nodes. -1 for everything else.
+    * parents: the row of the parent. -1 for the root of a tree.
+    * slots: the position in the parent. For the fields of a Node this is the slot of the field in its field table,
+    for the elements of a list it is their index, and for a dict the key of the i-th entry is at 2*i
+    and its value at 2*i+1. -1 for the root of a tree.
+    * subtree_ends: the row after the last row of the subtree of this row.
+    * numbers: the value of floats, integers and booleans as a float. NaN for everything else.
+    * integers: the exact value of integers and booleans, the length of lists and dicts,
+    and for Nodes 1 if the 'type' was part of the object and 0 otherwise.
+    * string_ids: the index in 'strings' of strings and of the digits of large integers. -1 for everything else.
+    The first row of each tree is listed in 'tree_starts'.
+    The arrays must not be modified, except through append_tree().
+    """
+    def __init__(self, registry=None):
+        self._layout = serialization._get_layout(registry)
+        self.kinds = array.array('B')
+        self.node_ids = array.array('i')
+        self.parents = array.array('q')
+        self.slots = array.array('q')
+        self.subtree_ends = array.array('q')
+        self.numbers = array.array('d')
+        self.integers = array.array('q')
+        self.string_ids = array.array('q')
+        self.strings = []
+        self.tree_starts = array.array('q')
+        self._index_of_string = {}
+
+    def __len__(self):
+        """
+        the number of trees.
+        """
+        return len(self.tree_starts)
+
+    def get_number_of_rows(self):
+        return len(self.kinds)
+
+    #####################################################################################
+    # conversion
+    #####################################################################################
+
+    def append_tree(self, obj, value=None, choice=None):
+        """
+        adds a validated object of the Node identified by 'value' or of the group of Nodes identified by 'choice'.
+        Returns the index of the new tree.
+        """
+        if (value is None) == (choice is None):
+            raise ProgrammingError("the Node or group of nodes must be identified by either a 'value' or a 'choice' of values.")
+        self.tree_starts.append(len(self.kinds))
+        self._add_node(obj, value, choice, -1, -1)
+        return len(self.tree_starts) - 1
+
+    def _add_row(self, kind, parent, slot, node_id=-1, number=math.nan, integer=0, string_id=-1):
+        row = len(self.kinds)
+        self.kinds.append(kind)
+        self.node_ids.append(node_id)
+        self.parents.append(parent)
+        self.slots.append(slot)
+        self.subtree_ends.append(row + 1)
+        self.numbers.append(number)
+        self.integers.append(integer)
+        self.string_ids.append(string_id)
+        return row
+
+    def _get_string_id(self, s):
+        res = self._index_of_string.get(s)
+        if res is None:
+            res = len(self.strings)
+            self.strings.append(s)
+            self._index_of_string[s] = res
+        return res
+
+    def _get_node_layout_of_object(self, obj, value, choice):
+        """
+        returns the layout of the Node that the object was validated with,
+        or None if it doesn't look like the result of a validation.
+        The keys need to be in the order of the field table, with the 'type' first, as validate() returns them.
+        """
+        if not isinstance(obj, dict):
+            return None
+        if value is None:
+            choice_type = obj.get('type')
+            if not isinstance(choice_type, str):
+                return None
+            value = self._layout.registry.choice_to_type_to_values[choice].get(choice_type)
+        node_layout = self._layout.node_of_value.get(value)
+        if node_layout is None:
+            return None
+        last_slot = -1
+        for i, (k, v) in enumerate(obj.items()):
+            if i == 0 and k == 'type' and node_layout.choice_type is not None:
+                if v != node_layout.choice_type:
+                    return None
+                continue
+            slot = node_layout.slot_of_field_name.get(k)
+            if slot is None or slot <= last_slot:
+                return None
+            last_slot = slot
+        return node_layout
+
+    def _add_node(self, obj, value, choice, parent, slot):
+        node_layout = self._get_node_layout_of_object(obj, value, choice)
+        if node_layout is None:
+            self._add_value(obj, parent, slot)
+            return
+        row = self._add_row(KIND_NODE, parent, slot, node_id=node_layout.node_id, integer=1 if 'type' in obj else 0)
+        slot_of_field_name = node_layout.slot_of_field_name
+        for k,v in obj.items():
+            if k != 'type':
+                field_slot = slot_of_field_name[k]
+                self._add_field_value(v, node_layout.fields[field_slot], row, field_slot)
+        self.subtree_ends[row] = len(self.kinds)
+
+    def _add_field_value(self, val, field, parent, slot):
+        """
+        adds the value of a Field, using the Field to recognize the objects of Nodes,
+        like serialization._Encoder.write_field_value().
+        """
+        if val is None:
+            self._add_row(KIND_NULL, parent, slot)
+        elif isinstance(field, fields.Value):
+            self._add_node(val, field.value, None, parent, slot)
+        elif isinstance(field, fields.Choice):
+            self._add_node(val, None, field.choice, parent, slot)
+        elif isinstance(field, fields.List) and isinstance(val, list):
+            row = self._add_row(KIND_LIST, parent, slot, integer=len(val))
+            for i, element in enumerate(val):
+                # the same distinction as in List.helper_for_validation()
+                if field.primitive is not None and (isinstance(element, (str, int, float, bool)) or
+                                                    (field.value is None and field.choice is None)):
+                    self._add_field_value(element, field.primitive, row, i)
+                else:
+                    self._add_node(element, field.value, field.choice, row, i)
+            self.subtree_ends[row] = len(self.kinds)
+        elif isinstance(field, fields.Mapping) and isinstance(val, dict):
+            row = self._add_row(KIND_DICT, parent, slot, integer=len(val))
+            for i, (k, v) in enumerate(val.items()):
+                self._add_value(k, row, 2 * i)
+                self._add_field_value(v, field.content, row, 2 * i + 1)
+            self.subtree_ends[row] = len(self.kinds)
+        elif isinstance(field, fields.PrimitiveValueOrGetter):
+            if isinstance(val, (str, int, float, bool)):
+                self._add_field_value(val, field.primitive_field, parent, slot)
+            else:
+                self._add_field_value(val, field.complex_field, parent, slot)
+        else:
+            self._add_value(val, parent, slot)
+
+    def _add_value(self, val, parent, slot):
+        """
+        adds any JSON-like value, without using the schema.
+        """
+        if val is None:
+            self._add_row(KIND_NULL, parent, slot)
+        elif val is True or val is False:
+            self._add_row(KIND_BOOLEAN, parent, slot, number=float(val), integer=int(val))
+        elif isinstance(val, int):
+            try:
+                number = float(val)
+            except OverflowError:
+                number = math.copysign(math.inf, val)
+            if _min_integer <= val <= _max_integer:
+                self._add_row(KIND_INTEGER, parent, slot, number=number, integer=val)
+            else:
+                self._add_row(KIND_LARGE_INTEGER, parent, slot, number=number, string_id=self._get_string_id(str(val)))
+        elif isinstance(val, float):
+            self._add_row(KIND_FLOAT, parent, slot, number=val)
+        elif isinstance(val, str):
+            self._add_row(KIND_STRING, parent, slot, string_id=self._get_string_id(val))
+        elif isinstance(val, (list, tuple)):
+            row = self._add_row(KIND_LIST, parent, slot, integer=len(val))
+            for i, element in enumerate(val):
+                self._add_value(element, row, i)
+            self.subtree_ends[row] = len(self.kinds)
+        elif isinstance(val, dict):
+            row = self._add_row(KIND_DICT, parent, slot, integer=len(val))
+            for i, (k, v) in enumerate(val.items()):
+                self._add_value(k, row, 2 * i)
+                self._add_value(v, row, 2 * i + 1)
+            self.subtree_ends[row] = len(self.kinds)
+        else:
+            raise ProgrammingError("can't convert a value of type %s" % (type(val).__name__,))
+
+    #####################################################################################
+    # access
+    #####################################################################################
+
+    def get_node_id(self, value):
+        """
+        returns the number that identifies the Node with the given name in 'node_ids'.
+        """
+        node_layout = self._layout.node_of_value.get(value)
+        if node_layout is None:
+            raise InvalidParamsException("there is no Node called '%s'" % (value,))
+        return node_layout.node_id
+
+    def get_node(self, row):
+        """
+        returns the Node of a row, or None if the row is not a Node.
+        """
+        node_id = self.node_ids[row]
+        return self._layout.nodes[node_id].node if node_id >= 0 else None
+
+    def get_slot(self, value, field_name):
+        """
+        returns the slot of a field of the Node with the given name.
+        """
+        res = self._layout.nodes[self.get_node_id(value)].slot_of_field_name.get(field_name)
+        if res is None:
+            raise InvalidParamsException("the Node '%s' has no field called '%s'" % (value, field_name,))
+        return res
+
+    def get_tree_rows(self, tree_index):
+        """
+        returns the range of the rows of a tree.
+        """
+        start = self.tree_starts[tree_index]
+        return range(start, self.subtree_ends[start])
+
+    def get_tree_of_row(self, row):
+        return bisect.bisect_right(self.tree_starts, row) - 1
+
+    def get_children(self, row):
+        """
+        yields the rows of the children of a row, in order.
+        """
+        child = row + 1
+        end = self.subtree_ends[row]
+        subtree_ends = self.subtree_ends
+        while child < end:
+            yield child
+            child = subtree_ends[child]
+
+    def get_field_row(self, row, slot):
+        """
+        returns the row of the field with the given slot in the Node in the given row,
+        or None if the object of the Node didn't contain the field.
+        """
+        for child in self.get_children(row):
+            if self.slots[child] == slot:
+                return child
+        return None
+
+    def get_tree(self, tree_index):
+        """
+        returns the validated object of a tree, as OrderedDicts and lists.
+        """
+        return self.get_value(self.tree_starts[tree_index])
+
+    def get_value(self, row):
+        """
+        returns the value of a row, as OrderedDicts and lists.
+        """
+        kind = self.kinds[row]
+        if kind == KIND_FLOAT:
+            return self.numbers[row]
+        if kind == KIND_INTEGER:
+            return self.integers[row]
+        if kind == KIND_STRING:
+            return self.strings[self.string_ids[row]]
+        if kind == KIND_NULL:
+            return None
+        if kind == KIND_BOOLEAN:
+            return bool(self.integers[row])
+        if kind == KIND_LARGE_INTEGER:
+            return int(self.strings[self.string_ids[row]])
+        if kind == KIND_LIST:
+            return [self.get_value(child) for child in self.get_children(row)]
+        if kind == KIND_DICT:
+            res = collections.OrderedDict()
+            key = None
+            for child in self.get_children(row):
+                if self.slots[child] % 2 == 0:
+                    key = self.get_value(child)
+                else:
+                    res[key] = self.get_value(child)
+            return res
+        # a Node
+        node_layout = self._layout.nodes[self.node_ids[row]]
+        res = collections.OrderedDict()
+        if self.integers[row]:
+            res['type'] = node_layout.choice_type
+        for child in self.get_children(row):
+            res[node_layout.slots[self.slots[child]][0]] = self.get_value(child)
+        return res
+
+    #####################################################################################
+    # queries
+    #####################################################################################
+
+    def find_nodes(self, value):
+        """
+        returns the rows of all objects of the Node with the given name, in all trees.
+        """
+        node_id = self.get_node_id(value)
+        return [row for row, a in enumerate(self.node_ids) if a == node_id]
+
+    def find_field_rows(self, value, field_name):
+        """
+        returns the rows of the values of a field in all objects of the Node with the given name, in all trees.
+        """
+        node_id = self.get_node_id(value)
+        slot = self.get_slot(value, field_name)
+        node_ids = self.node_ids
+        parents = self.parents
+        return [row for row, a in enumerate(self.slots) if a == slot and parents[row] >= 0 and
+                node_ids[parents[row]] == node_id]
+
+    def get_field_values(self, value, field_name):
+        """
+        returns the values of a field in all objects of the Node with the given name, in all trees.
+        """
+        return [self.get_value(row) for row in self.find_field_rows(value, field_name)]
+
+    def get_trees_containing(self, value):
+        """
+        returns the indices of the trees that contain an object of the Node with the given name.
+        """
+        res = []
+        for row in self.find_nodes(value):
+            tree_index = self.get_tree_of_row(row)
+            if not res or res[-1] != tree_index:
+                res.append(tree_index)
+        return res
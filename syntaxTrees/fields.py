@@ -3,6 +3,8 @@ import html
 import json
 import math
 import re
+import threading
+import time
 
 from .utilities import InvalidParamsException, ProgrammingError
 from . import basics as syntaxTreesBasics
@@ -28,7 +30,9 @@ class Value(syntaxTreesBasics.Field):
         """
         recurse the validation.
         """
-        return syntaxTreesBasics.execute_function_on_node('validate', val, stack_objects, _get_kwargs_to_use(kwargs, self.kwargs), value=self.value)
+        return syntaxTreesBasics.execute_function_on_node('validate', val, stack_objects,
+                                                          syntaxTreesBasics.get_kwargs_plan(self).apply(kwargs),
+                                                          value=self.value)
 
     def get_documentation_description(self, node):
         doc = """An object: [[%s]].""" % (self.value,)
@@ -68,7 +72,7 @@ class Choice(syntaxTreesBasics.Field):
         recurse the validation.
         """
         return syntaxTreesBasics.execute_function_on_node('validate', val, stack_objects,
-                                                          _get_kwargs_to_use(kwargs, self.kwargs),
+                                                          syntaxTreesBasics.get_kwargs_plan(self).apply(kwargs),
                                                           choice=self.choice)
 
     def get_documentation_description(self, node):
@@ -95,9 +99,12 @@ class List(syntaxTreesBasics.Field):
     """
     A list of several objects that are either of type 'value' or of type 'choice'.
     Optionally, may also have a 'primitive' version as well, which is not a list but a (str, int, float, bool).
+    With parallel=True, long lists are validated in parallel (see basics.set_parallel_validation_executor()).
     """
-    def __init__(self, value=None, choice=None, primitive=None, min_length=None, kwargs=None, *args, **kwargs_):
+    def __init__(self, value=None, choice=None, primitive=None, min_length=None, kwargs=None,
+                 *args, parallel=False, **kwargs_):
         self.min_length = min_length
+        self.parallel = parallel
         self.value = value
         self.choice = choice
         self.primitive = primitive
@@ -123,8 +130,11 @@ class List(syntaxTreesBasics.Field):
         if self.min_length is not None and len(val) < self.min_length:
             raise InvalidParamsException("the list must have at least %d element%s" % (self.min_length, "" if
                                             self.min_length == 1 else "s"))
-        res = []
-        for i, element in enumerate(val):
+        # the kwargs are the same for all elements
+        if self.value is not None or self.choice is not None:
+            element_kwargs = syntaxTreesBasics.get_kwargs_plan(self).apply(kwargs)
+
+        def validate_element(i, element, stack_objects):
             # append the index to the node_trace, then recurse
             with syntaxTreesBasics.node_trace_step(stack_objects, "index %d" % i, element):
                 # If a self.primitive is given and the object is a primitive value, use that field.
@@ -135,13 +145,11 @@ class List(syntaxTreesBasics.Field):
                 elif self.value is None and self.choice is None:
                     check_for_primitive = True
                 if check_for_primitive:
-                    validated_element = self.primitive.validate(element, stack_objects=stack_objects, kwargs=kwargs)
+                    return self.primitive.validate(element, stack_objects=stack_objects, kwargs=kwargs)
                 else:
-                    validated_element = syntaxTreesBasics.execute_function_on_node('validate', element, stack_objects,
-                                                                                   _get_kwargs_to_use(kwargs, self.kwargs),
-                                                                                   value=self.value, choice=self.choice)
-                res.append(validated_element)
-        return res
+                    return syntaxTreesBasics.execute_function_on_node('validate', element, stack_objects, element_kwargs,
+                                                                      value=self.value, choice=self.choice)
+        return list(syntaxTreesBasics.validate_elements(self, val, validate_element, stack_objects))
 
     def get_documentation_description(self, node):
         if self.value is not None or self.choice is not None:
@@ -193,6 +201,7 @@ def _get_kwargs_to_use(given_kwargs, field_kwargs):
     note that the field_kwargs are used by default, not the given_kwargs.
     field_kwargs can have PASS_ARG_ALONG to defer to given_kwargs,
     and given_kwargs can use OverwriteKeywordArgOfField to force an overwrite.
+    Validation uses basics.KwargsPlan instead, which does the same without building a new dictionary each time.
     """
     res = {}
     for k,v in field_kwargs.items():
@@ -219,10 +228,12 @@ class Mapping(syntaxTreesBasics.Field):
         'foo' : 1,
         'bar' : 2,
     }
+    With parallel=True, large mappings are validated in parallel (see basics.set_parallel_validation_executor()).
     """
-    def __init__(self, string_key, content, *args, **kwargs):
+    def __init__(self, string_key, content, *args, parallel=False, **kwargs):
         self.string_key = string_key
         self.content = content
+        self.parallel = parallel
         if not isinstance(string_key, String) or not isinstance(content, syntaxTreesBasics.Field):
             raise ProgrammingError("the mapping must map a String field to an arbitrary field.")
         super().__init__(*args, **kwargs)
@@ -232,8 +243,9 @@ class Mapping(syntaxTreesBasics.Field):
             raise InvalidParamsException("the value must be a dictionary")
         # note that IntegerAsString can turn different strings into the same one: ' 1', '1'
         # so you can't rely on this working out properly.
-        res = {}
-        for k,v in val.items():
+
+        def validate_item(i, item, stack_objects):
+            k, v = item
             try:
                 with syntaxTreesBasics.node_trace_step(stack_objects, 'key', k):
                     validated_key = self.string_key.validate(k, stack_objects=stack_objects, kwargs=kwargs)
@@ -244,6 +256,12 @@ class Mapping(syntaxTreesBasics.Field):
                 raise InvalidParamsException("could not parse the key '%s'. Exception was:\n%s" % (k, e,))
             with syntaxTreesBasics.node_trace_step(stack_objects, "value for key '%s'" % k, v):
                 validated_value = self.content.validate(v, stack_objects=stack_objects, kwargs=kwargs)
+            return validated_key, validated_value
+        # parallel validation needs to index the items, sequential validation just iterates over them
+        items = list(val.items()) if self.parallel else val.items()
+        res = {}
+        for validated_key, validated_value in syntaxTreesBasics.validate_elements(self, items, validate_item,
+                                                                                   stack_objects):
             if validated_key in res:
                 raise InvalidParamsException("after validating and simplifying, the key '%s' occurs more than once." % validated_key)
             res[validated_key] = validated_value
@@ -333,25 +351,200 @@ class PrimitiveValueOrGetter(syntaxTreesBasics.Field):
 
 
 class ArbitraryJson(syntaxTreesBasics.Field):
-    def __init__(self, *args, **kwargs):
+    """
+    Any JSON-like value. The result is a copy in canonical form, with the keys of dicts sorted,
+    exactly as if the value had been dumped to JSON with sorted keys and loaded again.
+    max_depth limits how deeply lists and dicts can be nested, and max_size limits the number of values,
+    counting lists and dicts as well as the values in them. Validation stops as soon as a limit is exceeded.
+    With frozen=True, the result is read-only: FrozenJsonDicts instead of OrderedDicts,
+    and FrozenJsonLists (which are tuples) instead of lists.
+    Values that are already frozen are then shared instead of copied.
+    """
+    def __init__(self, *args, max_depth=None, max_size=None, frozen=False, **kwargs):
         for a in ['null']:
             if a in kwargs:
                 raise ProgrammingError("can't overwrite this kwarg: %s" % a)
         kwargs['null'] = True
+        self.max_depth = max_depth
+        self.max_size = max_size
+        self.frozen = frozen
         super().__init__(*args, **kwargs)
 
     def helper_for_validation(self, val, stack_objects=None, kwargs=None):
+        canonicalizer = _JsonCanonicalizer(self.max_depth, self.max_size, self.frozen)
         try:
-            # dump to JSON and read again while preserving the order
-            return json.loads(json.dumps(val, sort_keys=True), object_pairs_hook=collections.OrderedDict)
+            canonicalizer.count_values(1)
+            return canonicalizer.canonicalize(val, 0)
+        except InvalidParamsException:
+            raise
         except Exception as e:
             raise InvalidParamsException("the value must be JSON-serializable")
 
     def get_documentation_description(self, node):
         doc = "An arbitrary JSON-like object."
+        if self.max_depth is not None:
+            doc += "\nLists and dicts can be nested at most %d levels deep." % (self.max_depth,)
+        if self.max_size is not None:
+            doc += "\nIt can consist of at most %d values." % (self.max_size,)
         return doc
 
 
+class FrozenJsonDict(collections.OrderedDict):
+    """
+    a read-only OrderedDict, returned by ArbitraryJson(frozen=True).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._is_frozen = True
+
+    def __setitem__(self, key, value):
+        if getattr(self, '_is_frozen', False):
+            raise TypeError("a FrozenJsonDict can't be modified")
+        super().__setitem__(key, value)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("a FrozenJsonDict can't be modified")
+
+    __delitem__ = clear = pop = popitem = setdefault = update = move_to_end = __ior__ = _read_only
+
+    def copy(self):
+        return self.__class__(self)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self.items()),))
+
+
+class FrozenJsonList(tuple):
+    """
+    a list of JSON values, returned by ArbitraryJson(frozen=True). Like any tuple, it can't be modified.
+    """
+    pass
+
+
+class _JsonCanonicalizer:
+    """
+    copies a JSON-like value into the form that json.loads(json.dumps(val, sort_keys=True),
+    object_pairs_hook=collections.OrderedDict) would return, without going through a string.
+    Frozen containers remember their size and depth, so that they can be shared while still enforcing the limits.
+    """
+    def __init__(self, max_depth, max_size, frozen):
+        self.max_depth = max_depth
+        self.max_size = max_size
+        self.frozen = frozen
+        self.size = 0
+        # the ids of the containers that are being copied, to detect circular references, like json.dumps() does
+        self.containers_in_progress = set()
+
+    def count_values(self, n):
+        self.size += n
+        if self.max_size is not None and self.size > self.max_size:
+            raise InvalidParamsException("the value consists of more than the maximum of %d values" % self.max_size)
+
+    def check_depth(self, depth):
+        if self.max_depth is not None and depth > self.max_depth:
+            raise InvalidParamsException("the value is nested more deeply than the maximum of %d levels" %
+                                         self.max_depth)
+
+    def canonicalize(self, val, depth):
+        """
+        returns the canonical form of the value, which is nested in 'depth' lists and dicts.
+        The value itself must already have been counted with count_values(), which is done for all the elements
+        of a list or dict at once.
+        Raises an InvalidParamsException if a limit is exceeded, and other exceptions if the value is not JSON-like.
+        """
+        # plain lists and dicts are by far the most common containers, and they skip the checks for primitives
+        val_type = type(val)
+        if val_type is not list and val_type is not dict and val_type is not collections.OrderedDict:
+            return self.canonicalize_other_value(val, depth)
+        return self.canonicalize_container(val, depth, val_type is list)
+
+    def canonicalize_other_value(self, val, depth):
+        # the checks are in the same order as in json.dumps()
+        if isinstance(val, str):
+            return str(val)
+        if val is None or val is True or val is False:
+            return val
+        if isinstance(val, int):
+            return _canonicalize_json_integer(val)
+        if isinstance(val, float):
+            return float(val)
+        if self.frozen and isinstance(val, (FrozenJsonDict, FrozenJsonList)) and hasattr(val, '_json_size'):
+            # already canonical, so it can be shared
+            self.check_depth(depth + val._json_depth)
+            self.count_values(val._json_size - 1)
+            return val
+        is_list = isinstance(val, (list, tuple))
+        if not is_list and not isinstance(val, dict):
+            raise TypeError("the value of type %s is not JSON-serializable" % (type(val).__name__,))
+        return self.canonicalize_container(val, depth, is_list)
+
+    def canonicalize_container(self, val, depth, is_list):
+        depth += 1
+        self.check_depth(depth)
+        size_before = self.size
+        self.count_values(len(val))
+        if id(val) in self.containers_in_progress:
+            raise ValueError("circular reference detected")
+        self.containers_in_progress.add(id(val))
+        # values of these types are returned as they are, so they are not passed to canonicalize()
+        canonical_types = _types_of_canonical_json_values
+        if is_list:
+            res = [a if type(a) in canonical_types or (type(a) is int and a.bit_length() <= _max_bits_of_short_integers)
+                   else self.canonicalize(a, depth) for a in val]
+            contents = res
+        else:
+            res = collections.OrderedDict()
+            for k,v in sorted(val.items()):
+                # later duplicates of the same key overwrite the value but keep the position, as in json.loads()
+                res[k if type(k) is str else _canonicalize_json_key(k)] = \
+                    v if type(v) in canonical_types or (type(v) is int and v.bit_length() <= _max_bits_of_short_integers) \
+                    else self.canonicalize(v, depth)
+            contents = res.values()
+        self.containers_in_progress.discard(id(val))
+        if self.frozen:
+            res = FrozenJsonList(res) if is_list else FrozenJsonDict(res)
+            res._json_size = self.size - size_before + 1
+            res._json_depth = 1 + max((a._json_depth for a in contents if isinstance(a, (FrozenJsonDict, FrozenJsonList))),
+                                      default=0)
+        return res
+
+
+# (integers are not in here, because json.dumps() rejects integers with too many digits)
+_types_of_canonical_json_values = frozenset([str, float, bool, type(None)])
+# integers that are certainly short enough to be converted to a string (see sys.set_int_max_str_digits())
+_max_bits_of_short_integers = 2000
+
+
+def _canonicalize_json_key(k):
+    """
+    converts the key of a dict to a string, in the same way as json.dumps() does.
+    """
+    if isinstance(k, str):
+        return str(k)
+    if isinstance(k, float):
+        if k != k:
+            return 'NaN'
+        if k in (math.inf, -math.inf):
+            return 'Infinity' if k > 0 else '-Infinity'
+        return float.__repr__(k)
+    if k is True:
+        return 'true'
+    if k is False:
+        return 'false'
+    if k is None:
+        return 'null'
+    if isinstance(k, int):
+        return int.__repr__(k)
+    raise TypeError("keys must be str, int, float, bool or None, not %s" % (type(k).__name__,))
+
+
+def _canonicalize_json_integer(val):
+    # json.dumps() fails for integers with too many digits, so try to convert the ones that might be too long
+    if val.bit_length() > _max_bits_of_short_integers:
+        int.__repr__(val)
+    return int(val)
+
+
 #####################################################################################
 # primitives
 #####################################################################################
@@ -505,22 +698,134 @@ class String(syntaxTreesBasics.Field):
 
 
 class RegexString(String):
+    """
+    A String that is a regular expression.
+    The compiled patterns are kept in a process-wide LRU cache (see set_regex_cache_size()),
+    and get_matcher() returns a RegexMatcher that uses the compiled pattern directly.
+    max_compile_seconds rejects patterns that take too long to compile.
+    max_match_seconds rejects patterns once a single match has taken too long. Python can't interrupt a match
+    that is running, so the limit can't shorten the first slow match, but every later use of the pattern fails
+    immediately, in validation as well as in matching.
+    """
+    def __init__(self, *args, max_compile_seconds=None, max_match_seconds=None, **kwargs):
+        self.max_compile_seconds = max_compile_seconds
+        self.max_match_seconds = max_match_seconds
+        super().__init__(*args, **kwargs)
+
     def helper_for_validation(self, val, stack_objects=None, kwargs=None):
         val = super().helper_for_validation(val, stack_objects=None, kwargs=None)
-        try:
-            re.compile(val)
-        except re.error:
-            raise InvalidParamsException("This is not a valid regular expression.")
+        self.get_matcher(val)
         return val
 
+    def get_matcher(self, regex):
+        """
+        returns a RegexMatcher for the pattern, which must be a valid value of this Field.
+        Raises an InvalidParamsException if it is not valid or exceeds the limits of this Field.
+        """
+        compiled_regex = _get_compiled_regex(regex)
+        if self.max_compile_seconds is not None and compiled_regex.compile_seconds > self.max_compile_seconds:
+            raise InvalidParamsException("This regular expression takes too long to compile.")
+        matcher = RegexMatcher(compiled_regex, self.max_match_seconds)
+        matcher.verify_match_time()
+        return matcher
+
     def check_regex_for_match(self, regex, s):
-        return re.match(regex, s)
+        return self.get_matcher(regex).match(s)
 
     def get_documentation_description(self, node):
         doc = """A Regular Expression. This uses Python's re.match() function in the backend."""
         return doc
 
 
+class RegexMatcher:
+    """
+    matches strings against a compiled regular expression, and enforces the time limit of the RegexString it came from.
+    """
+    def __init__(self, compiled_regex, max_match_seconds):
+        self.compiled_regex = compiled_regex
+        self.max_match_seconds = max_match_seconds
+        self.pattern = compiled_regex.pattern.pattern
+
+    def verify_match_time(self):
+        if self.max_match_seconds is not None and self.compiled_regex.slowest_match_seconds > self.max_match_seconds:
+            raise InvalidParamsException("This regular expression takes too long to match.")
+
+    def _run(self, method, s):
+        if self.max_match_seconds is None:
+            return method(s)
+        self.verify_match_time()
+        start_time = time.perf_counter()
+        res = method(s)
+        self.compiled_regex.record_match_time(time.perf_counter() - start_time)
+        self.verify_match_time()
+        return res
+
+    def match(self, s):
+        return self._run(self.compiled_regex.pattern.match, s)
+
+    def search(self, s):
+        return self._run(self.compiled_regex.pattern.search, s)
+
+    def fullmatch(self, s):
+        return self._run(self.compiled_regex.pattern.fullmatch, s)
+
+
+class _CompiledRegex:
+    """
+    an entry of the regex cache: a compiled pattern and how long it takes to use.
+    """
+    def __init__(self, pattern, compile_seconds):
+        self.pattern = pattern
+        self.compile_seconds = compile_seconds
+        self.slowest_match_seconds = 0.0
+
+    def record_match_time(self, seconds):
+        # (a race between threads can only lose a measurement that is not the slowest)
+        if seconds > self.slowest_match_seconds:
+            self.slowest_match_seconds = seconds
+
+
+# the compiled patterns of RegexStrings, by their text, with the most recently used last
+_regex_cache = collections.OrderedDict()
+_regex_cache_size = 1000
+_regex_cache_lock = threading.Lock()
+
+
+def set_regex_cache_size(size):
+    """
+    sets how many compiled patterns of RegexStrings are kept. The least recently used ones are dropped first.
+    """
+    global _regex_cache_size
+    if size < 1:
+        raise ProgrammingError("the size of the regex cache must be positive")
+    with _regex_cache_lock:
+        _regex_cache_size = size
+        while len(_regex_cache) > _regex_cache_size:
+            _regex_cache.popitem(last=False)
+
+
+def _get_compiled_regex(regex):
+    with _regex_cache_lock:
+        res = _regex_cache.get(regex)
+        if res is not None:
+            _regex_cache.move_to_end(regex)
+            return res
+    # compile outside of the lock, since this can be slow
+    start_time = time.perf_counter()
+    try:
+        pattern = re.compile(regex)
+    except (re.error, RecursionError, OverflowError):
+        raise InvalidParamsException("This is not a valid regular expression.")
+    res = _CompiledRegex(pattern, time.perf_counter() - start_time)
+    with _regex_cache_lock:
+        # if another thread compiled the same pattern in the meantime, use its entry, so that the times are shared
+        res = _regex_cache.setdefault(regex, res)
+        _regex_cache.move_to_end(regex)
+        while len(_regex_cache) > _regex_cache_size:
+            _regex_cache.popitem(last=False)
+    return res
+
+
 class IntegerAsString(String):
     """
     this is basically an Integer() Field, but the value must be given as a string instead of a number.
@@ -2,6 +2,7 @@ import collections
 import json
 
 from . import basics
+from . import columnar
 from .utilities import InvalidParamsException, ProgrammingError
 
 #####################################################################################
@@ -19,35 +20,56 @@ basics.finalize()
 #####################################################################################
 
 
-def validate_example_object(obj):
+@basics.observed_entry_point('validate_example_object')
+def validate_example_object(obj, lazy=False, limits=None):
     """
     Takes a dictionary describing an object described in nodesExample.py and validates it.
     Returns the validated object.
     If it fails, raises a descriptive InvalidParamsException.
+    If lazy is True, only the structure of the top-level object is checked immediately,
+    and a basics.LazyValidatedObject is returned, which validates each field when it is first accessed.
+    Call its force() method to validate the rest and get the validated object.
+    If basics.ValidationLimits are given, the object must stay within them.
+    Otherwise, an InputLimitExceededException is raised, usually before the validation starts.
+    Without limits, objects of any size are accepted.
     """
+    # A simple stack_objects group.
+    # These are the minimal values needed by the validation logic.
+    # You can also put additional variables in here, so that you can access them in your own functions.
+    stack_objects = {
+        # Keeps track of what has happened so far, for more useful error messages
+        'node_trace': [],
+        # Keeps track of the object currently under scrutiny, for more useful error messages
+        'current_object': None,
+        # If you put more fields in this dictionary and you don't want them to be messed with automatically,
+        # put their names in this list.
+        'immutable_fields': [],
+    }
     try:
         if not isinstance(obj, dict):
             raise InvalidParamsException("the value needs to be a dictionary")
-        # A simple stack_objects group.
-        # These are the minimal values needed by the validation logic.
-        # You can also put additional variables in here, so that you can access them in your own functions.
-        stack_objects = {
-            # Keeps track of what has happened so far, for more useful error messages
-            'node_trace': [],
-            # Keeps track of the object currently under scrutiny, for more useful error messages
-            'current_object': None,
-            # If you put more fields in this dictionary and you don't want them to be messed with automatically,
-            # put their names in this list.
-            'immutable_fields': [],
-        }
+        # reject objects that are too large before doing any work on them
+        if limits is not None:
+            limits.check_object(obj)
+            basics.set_validation_limits(stack_objects, limits)
         kwargs = {
             # We defined this as a required_additional_arguments_for_validation in nodesExample.py,
             # so we have to give a start value for this kwarg here.
             'allow_user_input_node': True
         }
+        if lazy:
+            # validate only the top-level Node lazily, which is validated with an empty node_trace
+            stack_objects['lazy_validation_depth'] = 0
         # Validate the object
         validated_object = basics.execute_function_on_node(choice='numerical_node', function='validate',
                                                            obj=obj, stack_objects=stack_objects, kwargs=kwargs)
+        if lazy:
+            # from now on, the LazyValidatedObject reports errors itself
+            stack_objects.pop('lazy_validation_depth', None)
+            # if the type of the object had to be resolved, it has been validated completely already
+            if not isinstance(validated_object, basics.LazyValidatedObject):
+                validated_object = basics.LazyValidatedObject(validated_object, {}, stack_objects, kwargs)
+            return validated_object
         # Error checking
         if len(stack_objects['node_trace']) != 0:
             raise ProgrammingError("the node_trace is imbalanced. A Node adds to it without removing it.")
@@ -73,22 +95,82 @@ def validate_example_object(obj):
         basics.detailed_error_handler_with_node_trace(e, stack_objects)
 
 
-def evaluate_numerical_node(obj):
+@basics.observed_entry_point('evaluate_numerical_node')
+def evaluate_numerical_node(obj, max_steps=None, timeout=None, deadline=None):
     """
     Takes a dictionary describing 'numerical_node' and applies the 'evaluate' function to it,
     which is implemented differently for each subclass of numerical_node.
+    The evaluation can be limited to a number of steps (Nodes evaluated), a timeout in seconds,
+    or a deadline as a value of time.monotonic().
+    If it exceeds them, it is stopped with an ExecutionLimitExceededException.
     """
     stack_objects = {
         'node_trace': ['evaluating numerical_node'],
         'current_object': None,
         'immutable_fields': [],
     }
+    if max_steps is not None or timeout is not None or deadline is not None:
+        basics.set_execution_budget(stack_objects, max_steps=max_steps, timeout=timeout, deadline=deadline)
     # Call the 'evaluate' function
     res = basics.execute_function_on_node(choice='numerical_node', function='evaluate',
                                           obj=obj, stack_objects=stack_objects, kwargs={})
     return res
 
 
+@basics.observed_entry_point('evaluate_numerical_nodes_in_columns')
+def evaluate_numerical_nodes_in_columns(columns):
+    """
+    Takes a columnar.ColumnarTrees of numerical_nodes and evaluates every tree in it,
+    with the same results as evaluate_numerical_node(), but by walking the arrays instead of dictionaries.
+    Returns a list with the result of each tree.
+    Trees that contain a user_input are evaluated with evaluate_numerical_node() instead,
+    so that the user is asked for input in the usual order.
+    """
+    constant_id = columns.get_node_id('constant')
+    sum_id = columns.get_node_id('sum')
+    constant_multiple_id = columns.get_node_id('constant_multiple')
+    val_slot = columns.get_slot('constant', 'val')
+    summands_slot = columns.get_slot('sum', 'summands')
+    constant_slot = columns.get_slot('constant_multiple', 'constant')
+    rest_slot = columns.get_slot('constant_multiple', 'rest')
+    trees_with_user_input = set(columns.get_trees_containing('user_input'))
+    kinds = columns.kinds
+    node_ids = columns.node_ids
+    subtree_ends = columns.subtree_ends
+    res = []
+    for tree_index in range(len(columns)):
+        rows = columns.get_tree_rows(tree_index)
+        start = rows.start
+        if tree_index in trees_with_user_input or kinds[start] != columnar.KIND_NODE:
+            res.append(evaluate_numerical_node(columns.get_tree(tree_index)))
+            continue
+        # The children of a Node come after it, so going backwards evaluates each Node after all of its children.
+        # If part of the tree doesn't look like the result of a validation, a value is missing,
+        # and evaluate_numerical_node() is used to report the error.
+        try:
+            values = [None] * len(rows)
+            for row in reversed(rows):
+                node_id = node_ids[row]
+                if node_id == constant_id:
+                    values[row - start] = columns.get_value(columns.get_field_row(row, val_slot))
+                elif node_id == sum_id:
+                    summands = columns.get_field_row(row, summands_slot)
+                    total = 0
+                    summand = summands + 1
+                    while summand < subtree_ends[summands]:
+                        total += values[summand - start]
+                        summand = subtree_ends[summand]
+                    values[row - start] = total
+                elif node_id == constant_multiple_id:
+                    constant = values[columns.get_field_row(row, constant_slot) - start]
+                    rest = values[columns.get_field_row(row, rest_slot) - start]
+                    values[row - start] = constant * rest
+            res.append(values[0])
+        except TypeError:
+            res.append(evaluate_numerical_node(columns.get_tree(tree_index)))
+    return res
+
+
 #####################################################################################
 # documentation
 #####################################################################################
@@ -97,6 +179,7 @@ def evaluate_numerical_node(obj):
 basics.set_function_to_convert_page_name_to_url(lambda page_name: "my/example/url")
 
 
+@basics.observed_entry_point('get_documentation_of_numerical_nodes')
 def get_documentation_of_numerical_nodes():
     """
     Returns a piece of HTML code that describes the documentation of the numerical_nodes.
@@ -109,6 +192,7 @@ def get_documentation_of_numerical_nodes():
 #####################################################################################
 
 
+@basics.observed_entry_point('visualize_numerical_node_in_html')
 def visualize_numerical_node_in_html(obj_dict):
     """
     Returns HTML code that nicely visualizes an object.
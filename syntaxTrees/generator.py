@@ -0,0 +1,420 @@
+import json
+import random
+import string
+
+from . import basics
+from . import fields
+from .utilities import InvalidParamsException, ProgrammingError
+
+
+#####################################################################################
+# Generates random objects that are valid according to the registered Nodes.
+# This walks the same tables that the validation uses (the fields of each Node, the types of each choice,
+# the limits of each Field, shortforms and the kwargs that are passed down the tree),
+# so it works for any schema, not just for nodesExample.py.
+# Every generated Node is checked with the actual validation logic, so Nodes with custom validate() methods
+# only ever produce objects that pass them. Objects that fail are discarded and generated again.
+# A Node is validated as soon as it has been generated, with the kwargs it gets in its position,
+# so constraints that depend on the kwargs are met where they apply instead of failing the whole object.
+# The Nodes nested in it were validated before, and their results are reused (see basics.set_prevalidated_objects()),
+# so each Node is validated once and the cost grows linearly with the size of the object.
+# A Node is invalid if validating it raises an InvalidParamsException,
+# or one of the invalid_object_exceptions for custom validate() methods that raise other exceptions.
+# Any other exception is a bug in the schema or in the generator, and is not caught.
+# The generator is seeded, so the same settings always produce the same objects.
+#####################################################################################
+
+
+class RandomTreeGenerator:
+    """
+    generates random valid objects.
+    -target_nodes: the approximate number of Nodes in each generated object.
+    -max_depth: no Node is nested deeper than this, unless a required field makes it unavoidable.
+    -target_bytes: if given, target_nodes is adjusted until the JSON-serialized object has approximately this size.
+    -omit_type_probability: the probability with which the 'type' field is left out of a Node that is one of a choice.
+    Objects with missing 'type' fields are slower to validate, because all possible types need to be tried.
+    The 'type' is only left out if the object can still be validated unambiguously without it.
+    -shortform_probability: the probability with which a Node that has a shortform is generated as a shortform.
+    -optional_field_probability: the probability with which a field that has a default value is set anyway.
+    -null_probability: the probability with which a nullable field is set to null.
+    -validate_subtrees: if True, every Node is validated as soon as it is generated, so that an invalid Node
+    is replaced immediately. If False, only Nodes without nested Nodes and complete objects are validated,
+    which is faster but can take many attempts if Nodes with nested Nodes have constraints that depend on the context.
+    -invalid_object_exceptions: exceptions other than InvalidParamsException that mean that an object is invalid.
+    -stack_objects_factory: a function that returns a new stack_objects for validation.
+    -registry: the Registry whose Nodes are generated. Defaults to the Registry that is active when this is created.
+    """
+    def __init__(self, seed=None, target_nodes=50, max_depth=8, target_bytes=None, max_list_length=5,
+                 max_string_length=20, omit_type_probability=0.0, shortform_probability=0.0,
+                 optional_field_probability=0.5, null_probability=0.1, validate_subtrees=True, max_attempts=20,
+                 invalid_object_exceptions=(), stack_objects_factory=None, registry=None):
+        self.random = random.Random(seed)
+        self.target_nodes = target_nodes
+        self.max_depth = max_depth
+        self.target_bytes = target_bytes
+        self.max_list_length = max_list_length
+        self.max_string_length = max_string_length
+        self.omit_type_probability = omit_type_probability
+        self.shortform_probability = shortform_probability
+        self.optional_field_probability = optional_field_probability
+        self.null_probability = null_probability
+        self.validate_subtrees = validate_subtrees
+        self.max_attempts = max_attempts
+        self.invalid_object_exceptions = (InvalidParamsException,) + tuple(invalid_object_exceptions)
+        self.stack_objects_factory = stack_objects_factory or _create_stack_objects
+        self.registry = basics.get_active_registry() if registry is None else registry
+        self._minimum_size_cache = {}
+        # the results of validating the Nodes of the object that is being generated, see _validate()
+        self._validated_nodes = {}
+        # the number of Nodes generated so far, to find out whether a Node has nested Nodes
+        self._generated_node_count = 0
+        # see _get_failure_key()
+        self._failed_references = set()
+
+    def generate(self, kwargs, value=None, choice=None):
+        """
+        generates one random object for the Node identified by 'value' or the group of Nodes identified by 'choice'.
+        The kwargs are the ones that would be given to execute_function_on_node() to validate the object.
+        """
+        if (value is None) == (choice is None):
+            raise ProgrammingError("the Node or group of nodes must be identified by either a 'value' or a 'choice' of values.")
+        self.registry.ensure_schema_is_built()
+        if self.target_bytes is None:
+            return self._generate_complete_object(value, choice, kwargs, self.target_nodes)
+        # adjust the number of nodes until the size in bytes is close to the target
+        target_nodes = max(1, self.target_nodes)
+        res = None
+        for i in range(5):
+            res = self._generate_complete_object(value, choice, kwargs, target_nodes)
+            size = len(json.dumps(res))
+            if abs(size - self.target_bytes) <= 0.1 * self.target_bytes:
+                break
+            target_nodes = max(1, int(target_nodes * self.target_bytes / max(size, 1)))
+        return res
+
+    def generate_many(self, count, kwargs, value=None, choice=None):
+        """
+        yields the given number of random objects.
+        """
+        for i in range(count):
+            yield self.generate(kwargs, value=value, choice=choice)
+
+    def _generate_complete_object(self, value, choice, kwargs, target_nodes):
+        try:
+            for attempt in range(self.max_attempts):
+                self._validated_nodes.clear()
+                try:
+                    res = self._generate_node(value, choice, kwargs, depth=1, budget=target_nodes)
+                except _GenerationFailed:
+                    continue
+                # with validate_subtrees, the top-level Node has already been validated
+                if self.validate_subtrees or self._validate(res, value, choice, kwargs):
+                    return res
+        finally:
+            self._validated_nodes.clear()
+        raise ProgrammingError("failed to generate a valid object for %s after %d attempts" %
+                               (value or choice, self.max_attempts))
+
+    #####################################################################################
+    # Nodes
+    #####################################################################################
+
+    def _generate_node(self, value, choice, kwargs, depth, budget):
+        """
+        generates a random Node that is referenced by the given value or choice.
+        The budget is the number of Nodes this subtree should approximately contain.
+        Raises _GenerationFailed if no valid Node could be generated with the given kwargs,
+        so that the caller can try something else instead.
+        """
+        # a reference that failed with the same kwargs before is assumed to fail again,
+        # so that a Node that the kwargs forbid doesn't make every Node it is nested in try max_attempts times
+        failure_key = _get_failure_key(value, choice, kwargs)
+        if failure_key in self._failed_references:
+            raise _GenerationFailed()
+        if value is not None:
+            all_candidates = [value]
+        else:
+            all_candidates = list(self.registry.choice_to_type_to_values[choice].values())
+        failed_values = set()
+        for attempt in range(self.max_attempts):
+            # try the Nodes that haven't failed yet first
+            candidates = [a for a in all_candidates if a not in failed_values] or all_candidates
+            # when the budget or the depth is used up, use a Node that requires as few nested Nodes as possible.
+            # When there is a lot of budget left, prefer Nodes that can branch out,
+            # because a chain of single nested Nodes would hit max_depth long before it hits the budget.
+            must_be_small = budget <= 1 or depth >= self.max_depth
+            if must_be_small:
+                smallest_size = min(self._get_minimum_size(a) for a in candidates)
+                options = [a for a in candidates if self._get_minimum_size(a) == smallest_size]
+            else:
+                growth = 2 if budget > self.max_depth - depth + 1 else 1
+                options = [a for a in candidates if self._get_growth(a) >= growth] or \
+                          [a for a in candidates if self._get_growth(a) >= 1] or candidates
+            selected_value = self.random.choice(options)
+            node = self.registry.value_to_node[selected_value]
+            generated_node_count = self._generated_node_count
+            failed_values.add(selected_value)
+            try:
+                res = self._generate_node_object(node, kwargs, depth, budget, must_be_small)
+            except _GenerationFailed:
+                continue
+            has_nested_nodes = self._generated_node_count != generated_node_count
+            self._generated_node_count += 1
+            if not self.validate_subtrees and has_nested_nodes:
+                return res
+            if self._validate(res, value, choice, kwargs):
+                return res
+            # the 'type' might be needed to clear up ambiguity
+            if isinstance(res, dict) and 'type' not in res and hasattr(node.Meta, 'choice_type'):
+                res = _with_type(res, node.Meta.choice_type)
+                if self._validate(res, value, choice, kwargs):
+                    return res
+        if failure_key is not None:
+            self._failed_references.add(failure_key)
+        raise _GenerationFailed()
+
+    def _generate_node_object(self, node, kwargs, depth, budget, must_be_small):
+        # use the shortform if possible
+        if hasattr(node.Meta, 'shortform_field') and self.random.random() < self.shortform_probability:
+            return self._generate_field_value(node.Meta.shortform_field, {}, depth, 1, True)
+        res = {}
+        if hasattr(node.Meta, 'choice_type') and self.random.random() >= self.omit_type_probability:
+            res['type'] = node.Meta.choice_type
+        fields_to_set = []
+        for field_name, field in self.registry.get_list_of_fields_for_node(node.Meta.name):
+            if field.dont_auto_validate or field.derived_field:
+                continue
+            if field.required or (not must_be_small and self.random.random() < self.optional_field_probability):
+                fields_to_set.append((field_name, field))
+        # split the remaining budget among the fields that can contain nested Nodes
+        fields_with_nested_nodes = [a for a in fields_to_set if _can_contain_nodes(a[1])]
+        budget_per_field = max(1, (budget - 1) // max(1, len(fields_with_nested_nodes)))
+        for field_name, field in fields_to_set:
+            res[field_name] = self._generate_field_value(field, kwargs, depth, budget_per_field, must_be_small)
+        return res
+
+    def _get_minimum_size(self, value):
+        """
+        returns the minimum number of Nodes that an object of the given Node needs to contain,
+        counting only required fields. Recursive Nodes that can't be finite count as very large.
+        """
+        if value in self._minimum_size_cache:
+            return self._minimum_size_cache[value]
+        # guard against recursion while this is being computed
+        self._minimum_size_cache[value] = float('inf')
+        res = 1
+        node = self.registry.value_to_node[value]
+        if not hasattr(node.Meta, 'shortform_field'):
+            for field_name, field in self.registry.get_list_of_fields_for_node(value):
+                if field.required and not field.dont_auto_validate and not field.derived_field:
+                    res += self._get_minimum_size_of_field(field)
+        self._minimum_size_cache[value] = res
+        return res
+
+    def _get_minimum_size_of_field(self, field):
+        if isinstance(field, fields.Value):
+            return self._get_minimum_size(field.value)
+        if isinstance(field, fields.Choice):
+            return min(self._get_minimum_size(a) for a in self.registry.choice_to_type_to_values[field.choice].values())
+        if isinstance(field, fields.List):
+            if not field.min_length:
+                return 0
+            if field.primitive is not None:
+                return 0
+            element_size = self._get_minimum_size(field.value) if field.value is not None else \
+                min(self._get_minimum_size(a) for a in self.registry.choice_to_type_to_values[field.choice].values())
+            return field.min_length * element_size
+        if isinstance(field, fields.PrimitiveValueOrGetter):
+            return 0
+        if isinstance(field, fields.Mapping):
+            return 0
+        return 0
+
+    def _get_growth(self, value):
+        """
+        returns 2 if the Node can contain any number of nested Nodes, 1 if it can contain a fixed number of them,
+        and 0 if it can't contain any.
+        """
+        res = 0
+        for field_name, field in self.registry.get_list_of_fields_for_node(value):
+            if field.dont_auto_validate or field.derived_field:
+                continue
+            res = max(res, _get_growth_of_field(field))
+        return res
+
+    def _validate(self, obj, value, choice, kwargs):
+        """
+        returns whether the object is valid.
+        The Nodes nested in it are not validated again, and the result is remembered for the Nodes it is nested in.
+        """
+        stack_objects = self.stack_objects_factory()
+        basics.set_prevalidated_objects(stack_objects, self._validated_nodes)
+        try:
+            validated_obj = basics.execute_function_on_node('validate', obj, stack_objects, kwargs,
+                                                            value=value, choice=choice, registry=self.registry)
+        except self.invalid_object_exceptions:
+            return False
+        # only dictionaries are unique objects. Primitive values like shortforms are cheap to validate again.
+        if isinstance(obj, dict):
+            self._validated_nodes[id(obj)] = (obj, validated_obj)
+        return True
+
+    #####################################################################################
+    # Fields
+    #####################################################################################
+
+    def _generate_field_value(self, field, kwargs, depth, budget, must_be_small):
+        """
+        generates a random value for a Field.
+        The kwargs are the ones given to the Node that the Field belongs to.
+        """
+        if field.null and not field.required and self.random.random() < self.null_probability:
+            if not isinstance(field, fields.MultipleChoiceSelection):
+                return None
+        if isinstance(field, fields.Value):
+            return self._generate_node(field.value, None, fields._get_kwargs_to_use(kwargs, field.kwargs),
+                                       depth + 1, budget)
+        if isinstance(field, fields.Choice):
+            return self._generate_node(None, field.choice, fields._get_kwargs_to_use(kwargs, field.kwargs),
+                                       depth + 1, budget)
+        if isinstance(field, fields.List):
+            return self._generate_list(field, kwargs, depth, budget, must_be_small)
+        if isinstance(field, fields.Mapping):
+            length = 0 if must_be_small else self.random.randint(0, self.max_list_length)
+            res = {}
+            for i in range(length * 3):
+                if len(res) >= length:
+                    break
+                k = self._generate_field_value(field.string_key, kwargs, depth, 1, True)
+                res[k] = self._generate_field_value(field.content, kwargs, depth, max(1, budget // max(1, length)),
+                                                    must_be_small)
+            return res
+        if isinstance(field, fields.PrimitiveValueOrGetter):
+            if not must_be_small and self.random.random() >= 0.5:
+                try:
+                    return self._generate_field_value(field.complex_field, kwargs, depth, budget, must_be_small)
+                except _GenerationFailed:
+                    pass
+            return self._generate_field_value(field.primitive_field, kwargs, depth, 1, True)
+        if isinstance(field, fields.ArbitraryJson):
+            return self._generate_arbitrary_json(0 if must_be_small else 2)
+        if isinstance(field, fields.Boolean):
+            return self.random.random() < 0.5
+        if isinstance(field, fields.Integer):
+            low, high = _get_range(field.min, field.max)
+            return self.random.randint(int(low), int(high))
+        if isinstance(field, fields.Float):
+            low, high = _get_range(field.min, field.max)
+            # round, so that the generated JSON stays readable
+            return min(high, max(low, round(self.random.uniform(low, high), 3)))
+        if isinstance(field, fields.MultipleChoiceSelection):
+            return [a for a in field.choices if self.random.random() < 0.5]
+        if isinstance(field, fields.StringFromSelection):
+            return self.random.choice(field.selection)
+        if isinstance(field, fields.IntegerAsString):
+            low, high = _get_range(field.min, field.max)
+            return str(self.random.randint(int(low), int(high)))
+        if isinstance(field, fields.RegexString):
+            return self.random.choice(["^[a-z]+$", "[0-9]{1,3}", "foo|bar", ".*", "^\\w+\\s\\w+$"])
+        if isinstance(field, fields.String):
+            return self._generate_string(field.min_length, field.max_length)
+        # an unknown type of Field: use its default value if it has one
+        if not field.required:
+            return field.get_the_default_value()
+        raise ProgrammingError("can't generate a random value for a required field of type %s" % type(field).__name__)
+
+    def _generate_list(self, field, kwargs, depth, budget, must_be_small):
+        min_length = field.min_length or 0
+        if must_be_small:
+            length = min_length
+        else:
+            length = self.random.randint(max(min_length, min(self.max_list_length, budget - 1)),
+                                         max(min_length, self.max_list_length))
+            length = max(min_length, min(length, budget))
+        budget_per_element = max(1, budget // max(1, length))
+        res = []
+        for i in range(length):
+            use_primitive = field.primitive is not None and \
+                            (field.value is None and field.choice is None or self.random.random() < 0.5)
+            if use_primitive:
+                res.append(self._generate_field_value(field.primitive, kwargs, depth, 1, True))
+            else:
+                res.append(self._generate_node(field.value, field.choice, fields._get_kwargs_to_use(kwargs, field.kwargs),
+                                               depth + 1, budget_per_element))
+        return res
+
+    def _generate_string(self, min_length, max_length):
+        low = min_length or 0
+        high = max_length if max_length is not None else max(low, self.max_string_length)
+        high = min(high, max(low, self.max_string_length))
+        length = self.random.randint(low, high)
+        return ''.join(self.random.choice(string.ascii_letters + ' ') for _ in range(length))
+
+    def _generate_arbitrary_json(self, remaining_depth):
+        r = self.random.random()
+        if remaining_depth <= 0 or r < 0.4:
+            return self.random.choice([None, True, False, self.random.randint(-100, 100),
+                                       round(self.random.uniform(-100, 100), 3), self._generate_string(0, 10)])
+        if r < 0.7:
+            return [self._generate_arbitrary_json(remaining_depth - 1) for _ in range(self.random.randint(0, 3))]
+        return {self._generate_string(1, 8): self._generate_arbitrary_json(remaining_depth - 1)
+                for _ in range(self.random.randint(0, 3))}
+
+
+class _GenerationFailed(Exception):
+    """
+    raised internally if no valid Node could be generated for a field,
+    for example because the kwargs forbid every Node that the field allows.
+    """
+    pass
+
+
+def _can_contain_nodes(field):
+    return _get_growth_of_field(field) > 0
+
+
+def _get_growth_of_field(field):
+    if isinstance(field, (fields.Value, fields.Choice)):
+        return 1
+    if isinstance(field, fields.List):
+        return 2 if field.value is not None or field.choice is not None else 0
+    if isinstance(field, fields.Mapping):
+        return 2 if _can_contain_nodes(field.content) else 0
+    if isinstance(field, fields.PrimitiveValueOrGetter):
+        return _get_growth_of_field(field.complex_field)
+    return 0
+
+
+def _get_range(low, high, default_width=1000):
+    if low is None and high is None:
+        return -default_width, default_width
+    if low is None:
+        return high - 2 * default_width, high
+    if high is None:
+        return low, low + 2 * default_width
+    return low, high
+
+
+def _get_failure_key(value, choice, kwargs):
+    """
+    returns what identifies a reference to a Node for remembering that no valid Node could be generated for it,
+    or None if the kwargs can't be used for that.
+    """
+    try:
+        return value, choice, frozenset(kwargs.items())
+    except TypeError:
+        return None
+
+
+def _with_type(obj, choice_type):
+    res = {'type': choice_type}
+    res.update(obj)
+    return res
+
+
+def _create_stack_objects():
+    return {
+        'node_trace': [],
+        'current_object': None,
+        'immutable_fields': [],
+    }
@@ -2,6 +2,7 @@ import numbers
 
 from . import basics
 from . import fields
+from .utilities import InvalidParamsException
 
 
 #####################################################################################
@@ -101,6 +102,8 @@ class ConstantNode(AbstractNodeForNumbers):
         while stack_objects is persistent and keeps a changed state even after going back up.
         If a class has two fields A and B, then after validating field A, field B will receive the same kwargs
         as field A, but the stack_objects it receives may have been altered by field A.
+        Each call of this function receives its own copy of the kwargs, so changing them here does not affect
+        other Nodes, but the Fields referencing other Nodes hand those Nodes new kwargs that are built from their own.
 
         super.validate() will validate the 'obj' against all fields of this class.
         The rest of this function can be used for custom code. Set dont_auto_validate=True on a field
@@ -145,7 +148,7 @@ class UserInputNode(AbstractNodeForNumbers):
         """
         obj = super().validate(cls, obj, stack_objects, kwargs)
         if not kwargs['allow_user_input_node']:
-            raise Exception("You can't ask for input in this branch!")
+            raise InvalidParamsException("You can't ask for input in this branch!")
         return obj
 
     def evaluate(cls, obj, stack_objects, kwargs):
@@ -172,6 +175,7 @@ class UserInputNode(AbstractNodeForNumbers):
 
 class SumNode(AbstractNodeForNumbers):
     summands = fields.List(choice='numerical_node', kwargs={'allow_user_input_node': basics.PASS_ARG_ALONG},
+                           parallel=True,
                            help="A list of values that are added together. "
                                 "Each of these can be any class of type 'numerical_node'.")
 
@@ -191,9 +195,10 @@ class SumNode(AbstractNodeForNumbers):
         Evaluate all objects in the list and return their sum.
         """
         res = 0
-        for a in obj['summands']:
-            res += basics.execute_function_on_node(choice='numerical_node', function='evaluate', obj=a,
-                                                   stack_objects=stack_objects, kwargs=kwargs)
+        for i, a in enumerate(obj['summands']):
+            with basics.node_trace_step(stack_objects, "[evaluating sum, summand %d]" % i, a):
+                res += basics.execute_function_on_node(choice='numerical_node', function='evaluate', obj=a,
+                                                       stack_objects=stack_objects, kwargs=kwargs)
         return res
 
 
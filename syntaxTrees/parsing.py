@@ -0,0 +1,548 @@
+import json
+import json.decoder
+import re
+
+from . import basics
+from . import fields
+from .utilities import InvalidParamsException, ProgrammingError
+
+
+#####################################################################################
+# An early-reject check of JSON text against the schema, while the text is being parsed.
+# This does not replace validation: the parsed object is validated afterwards as usual,
+# so valid objects are still parsed and then validated, and are not validated any faster.
+# What it saves is the work spent on invalid objects.
+# parse_json_for_validation() reads the JSON text of an object that is about to be validated,
+# and knows at each point of the text which Nodes and Fields the value there belongs to.
+# Unknown field names, values of the wrong kind, invalid primitive values, missing required fields and unknown types
+# are reported as soon as they have been read, so an invalid request body is rejected without reading the rest of it,
+# and without validating anything that came before the error.
+# Only errors that validation would certainly raise as well are reported here.
+# Everything else is left to the normal validation of the parsed object,
+# since the validate() function of a Node can depend on kwargs, the stack_objects and its own code.
+# For the same reason, the checks assume that the validate() function of a Node calls Node.validate()
+# on the object it was given, as all Nodes in nodesExample.py do.
+# The top-level object and the lists and Mappings directly in it are read piece by piece, in Python.
+# Everything below that, like each element of a long list, is read at once by the C scanner of the json module
+# and then checked, which is much faster than reading it in Python, and still stops at the first invalid element.
+# Errors in such an element are reported at the position where the element starts.
+#
+# Since valid objects are read in Python at the top and then validated in full, they take longer than with json.loads(),
+# so this only pays off where many of the request bodies are expected to be invalid.
+# Usage:
+#     obj = parsing.parse_json_for_validation(request_body, choice='numerical_node')
+#     validated_object = functions.validate_example_object(obj)
+#####################################################################################
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_WHITESPACE_CHARACTERS = ' \t\n\r'
+# the colon after a key, and the comma or closing bracket after a value, with the whitespace around them
+_END_OF_KEY = re.compile(r'[ \t\n\r]*:[ \t\n\r]*')
+_END_OF_VALUE = re.compile(r'[ \t\n\r]*([,}\]])[ \t\n\r]*')
+_scan_once = json.JSONDecoder().scan_once
+_scanstring = json.decoder.scanstring
+# Fields whose validation depends on nothing but the value itself, so their values can be validated as soon as they are read
+_LEAF_FIELD_TYPES = (fields.String, fields.Integer, fields.Float, fields.Boolean, fields.MultipleChoiceSelection)
+# marks a key that is not a field of a Node
+_UNKNOWN_FIELD = object()
+# values with a node_trace of this length or longer are read by the C scanner and checked afterwards
+_DEPTH_READ_AT_ONCE = 2
+
+
+def parse_json_for_validation(data, value=None, choice=None, registry=None):
+    """
+    parses JSON text describing an object of the Node identified by 'value'
+    or of the group of Nodes identified by 'choice', and returns the parsed object.
+    This is only a check that rejects invalid objects early. The parsed object still needs to be validated.
+    The text can be a str, or bytes in any encoding that json.loads() accepts.
+    Raises an InvalidParamsException as soon as the text turns out not to be valid JSON or not to be valid for the Node,
+    with the position of the error in the same format that validation uses.
+    The Nodes are looked up in the given Registry, or in the active Registry if none is given.
+    """
+    if (value is None) == (choice is None):
+        raise ProgrammingError("the Node or group of nodes must be identified by either a 'value' or a 'choice' of values.")
+    if registry is None:
+        registry = basics.get_active_registry()
+    registry.ensure_schema_is_built()
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = data.decode(json.detect_encoding(data), 'surrogatepass')
+        except UnicodeDecodeError as e:
+            raise InvalidParamsException("the request is not valid JSON: %s" % e)
+    elif not isinstance(data, str):
+        raise ProgrammingError("the JSON text must be a str or bytes, not %s" % type(data).__name__)
+    parser = _SchemaGuidedParser(registry, data)
+    try:
+        position = parser.skip_whitespace(0)
+        res, position = parser.parse_node(position, parser.get_infos(value, choice), choice)
+        position = parser.skip_whitespace(position)
+        if position != len(data):
+            raise json.JSONDecodeError("Extra data", data, position)
+    except json.JSONDecodeError as e:
+        raise InvalidParamsException("the request is not valid JSON: %s" % e)
+    except InvalidParamsException as e:
+        stack_objects = {
+            'node_trace': parser.node_trace,
+            'current_object': parser.current_object,
+            'immutable_fields': [],
+        }
+        e = InvalidParamsException("%s\n(at character %d of the JSON text)" % (e, parser.error_position,))
+        basics.detailed_error_handler_with_node_trace(e, stack_objects)
+    return res
+
+
+class _NodeInfo:
+    """
+    what the parser needs to know about a Node, collected once per Node.
+    """
+    def __init__(self, node):
+        self.node = node
+        self.name = node.Meta.name
+        self.choice_type = getattr(node.Meta, 'choice_type', None)
+        ordered_list_of_fields = node.Meta.registry.value_to_node_fields[node.Meta.name]
+        self.ordered_field_names = [a for a,b in ordered_list_of_fields]
+        self.required_field_names = [field_name for field_name, field in ordered_list_of_fields
+                                     if field.required and not field.dont_auto_validate]
+        self.shortform_field = getattr(node.Meta, 'shortform_field', None)
+        # maps each key the object may have to the Field its value is checked with,
+        # or to None if the value is not checked while parsing
+        self.fields_to_parse = {}
+        if hasattr(node.Meta, 'choice_type'):
+            self.fields_to_parse['type'] = None
+        for field_name in node.Meta.quietly_drop_superfluous_fields:
+            self.fields_to_parse[field_name] = None
+        for field_name, field in ordered_list_of_fields:
+            self.fields_to_parse[field_name] = None if field.dont_auto_validate else field
+
+
+class _Candidates:
+    """
+    the Nodes that an object being parsed can still belong to.
+    They are narrowed down by the 'type' and by the keys of the object,
+    and once none of them is left, an error is raised like validation would raise it.
+    """
+    def __init__(self, parser, infos, choice):
+        self.parser = parser
+        self.candidates = infos
+        self.infos = infos
+        self.choice = choice
+        self.is_selected = len(infos) == 1
+
+    def select_type(self, val, position, current_object):
+        """
+        picks the Node based on the 'type', like execute_function_on_node() does.
+        """
+        selected = self.parser.get_infos_by_type(self.choice).get(val) if isinstance(val, str) else None
+        if selected is None:
+            self.parser.fail("the type '%s' is not valid.\nValid types are: %s" %
+                             (val, ', '.join(self.parser.registry.choice_to_type_to_values[self.choice].keys()),),
+                             position, current_object)
+        self.infos = [selected]
+        self.is_selected = True
+
+    def select_field(self, k, position, current_object):
+        """
+        returns the Field that the value of the key is checked with, or None if it isn't checked.
+        """
+        if len(self.infos) == 1:
+            field = self.infos[0].fields_to_parse.get(k, _UNKNOWN_FIELD)
+            if field is _UNKNOWN_FIELD:
+                if self.is_selected:
+                    self.parser.fail("'%s' is not a valid field name.\nValid field names are:\n%s" %
+                                     (k, '\n'.join(self.infos[0].ordered_field_names),), position, current_object)
+                self.fail_to_find_node(position, current_object)
+            return field
+        self.infos = [a for a in self.infos if k in a.fields_to_parse]
+        if not self.infos:
+            self.fail_to_find_node(position, current_object)
+        # if the remaining candidates disagree about the Field, it is not known yet which one to check
+        field = self.infos[0].fields_to_parse[k]
+        if any(a.fields_to_parse[k] is not field for a in self.infos):
+            return None
+        return field
+
+    def check_required_fields(self, obj, position):
+        for info in self.infos:
+            for field_name in info.required_field_names:
+                if field_name not in obj:
+                    break
+            else:
+                return
+        if self.is_selected:
+            missing = [a for a in self.infos[0].required_field_names if a not in obj][0]
+            self.parser.fail("missing value for the required field '%s'" % (missing,), position, obj)
+        self.fail_to_find_node(position, obj)
+
+    def fail_to_find_node(self, position, current_object):
+        self.parser.fail("no valid way to parse this value could be found."
+                         "Please manually specify a 'type' field for a more detailed error message.\n"
+                         "Possible types are: %s" %
+                         (', '.join(a.choice_type for a in self.candidates)), position, current_object)
+
+
+class _SchemaGuidedParser:
+    """
+    reads JSON text top-down, knowing at each position which Nodes or Field the value there must match.
+    The parse_ functions take the position where a value starts, after any whitespace,
+    and return the value and the position after it.
+    The check_ functions check a value that has already been read by the C scanner,
+    whose position is self.position_of_value_read_at_once.
+    The node_trace is left as it is when an error is raised, so that it describes where the error occurred.
+    """
+    def __init__(self, registry, s):
+        self.registry = registry
+        self.s = s
+        self.node_trace = []
+        self.current_object = None
+        self.error_position = 0
+        self.position_of_value_read_at_once = 0
+
+    def fail(self, message, position, current_object):
+        self.error_position = position
+        self.current_object = current_object
+        raise InvalidParamsException(message)
+
+    def get_infos(self, value, choice):
+        """
+        returns the _NodeInfos of the Node identified by 'value' or of the group of Nodes identified by 'choice'.
+        """
+        cache = self.registry._json_parsing_node_info_cache
+        key = (value, choice)
+        res = cache.get(key)
+        if res is None:
+            if value is not None:
+                res = [_NodeInfo(self.registry.value_to_node[value])]
+            else:
+                res = [self.get_infos(v, None)[0] for v in self.registry.choice_to_type_to_values[choice].values()]
+            cache[key] = res
+        return res
+
+    def get_infos_by_type(self, choice):
+        """
+        returns a dictionary mapping each 'type' of the group of Nodes identified by 'choice' to the _NodeInfo of its Node.
+        """
+        cache = self.registry._json_parsing_node_info_cache
+        key = ('types', choice)
+        res = cache.get(key)
+        if res is None:
+            res = {k: self.get_infos(v, None)[0] for k,v in self.registry.choice_to_type_to_values[choice].items()}
+            cache[key] = res
+        return res
+
+    #####################################################################################
+    # reading the text
+    #####################################################################################
+
+    def skip_whitespace(self, position):
+        s = self.s
+        if position < len(s) and s[position] in _WHITESPACE_CHARACTERS:
+            position = _WHITESPACE.match(s, position).end()
+        return position
+
+    def scan_value(self, position):
+        """
+        reads a complete value with the C scanner.
+        """
+        try:
+            return _scan_once(self.s, position)
+        except StopIteration as e:
+            raise json.JSONDecodeError("Expecting value", self.s, e.value) from None
+
+    def start_container(self, position, closing_bracket):
+        """
+        reads the opening bracket of an object or list.
+        Returns the position of its first value, or the position after it if it is empty,
+        and whether there is a value.
+        """
+        position = self.skip_whitespace(position + 1)
+        if self.s[position:position + 1] == closing_bracket:
+            return position + 1, False
+        return position, True
+
+    def read_key(self, position):
+        """
+        reads a key of an object and the colon after it. Returns the key and the position where its value starts.
+        """
+        s = self.s
+        if s[position:position + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", s, position)
+        k, position = _scanstring(s, position + 1)
+        m = _END_OF_KEY.match(s, position)
+        if m is None:
+            raise json.JSONDecodeError("Expecting ':' delimiter", s, self.skip_whitespace(position))
+        return k, m.end()
+
+    def read_end_of_value(self, position, closing_bracket):
+        """
+        reads what follows a value in an object or list.
+        Returns the position of the next value, or the position after the object or list and any whitespace after it
+        if it has ended, and whether there is another value.
+        """
+        m = _END_OF_VALUE.match(self.s, position)
+        if m is not None:
+            c = m.group(1)
+            if c == ',':
+                return m.end(), True
+            if c == closing_bracket:
+                return m.end(), False
+        raise json.JSONDecodeError("Expecting ',' delimiter", self.s, self.skip_whitespace(position))
+
+    def read_at_once(self, position, check_function, *args):
+        """
+        reads a complete value with the C scanner and checks it with the check_function.
+        """
+        val, end = self.scan_value(position)
+        self.position_of_value_read_at_once = position
+        check_function(val, *args)
+        return val, end
+
+    #####################################################################################
+    # reading piece by piece
+    #####################################################################################
+
+    def parse_field(self, position, field):
+        if isinstance(field, _LEAF_FIELD_TYPES):
+            val, end = self.scan_value(position)
+            try:
+                field.validate(val)
+            except InvalidParamsException as e:
+                self.fail(str(e), position, val)
+            return val, end
+        if len(self.node_trace) >= _DEPTH_READ_AT_ONCE:
+            return self.read_at_once(position, self.check_field, field)
+        first = self.s[position:position + 1]
+        if first == 'n':
+            return self.read_at_once(position, self.check_field, field)
+        if isinstance(field, fields.Value):
+            return self.parse_node(position, self.get_infos(field.value, None), None)
+        if isinstance(field, fields.Choice):
+            return self.parse_node(position, self.get_infos(None, field.choice), field.choice)
+        if isinstance(field, fields.List):
+            if first != '[':
+                return self.read_at_once(position, self.check_field, field)
+            return self.parse_list(position, field)
+        if isinstance(field, fields.Mapping):
+            if first != '{':
+                return self.read_at_once(position, self.check_field, field)
+            return self.parse_mapping(position, field)
+        if isinstance(field, fields.PrimitiveValueOrGetter):
+            if first == '{' or first == '[':
+                return self.parse_field(position, field.complex_field)
+            return self.parse_field(position, field.primitive_field)
+        # the Field is not known here, so its value is left to validation
+        return self.scan_value(position)
+
+    def parse_list(self, position, field):
+        s = self.s
+        node_trace = self.node_trace
+        primitive = field.primitive
+        infos = None if field.value is None and field.choice is None else self.get_infos(field.value, field.choice)
+        res = []
+        position, more = self.start_container(position, ']')
+        while more:
+            node_trace.append("index %d" % len(res))
+            # like List.helper_for_validation(), use the primitive Field for primitive elements
+            if primitive is not None and (infos is None or s[position:position + 1] not in ('{', '[', 'n')):
+                element, position = self.parse_field(position, primitive)
+            else:
+                element, position = self.parse_node(position, infos, field.choice)
+            node_trace.pop()
+            res.append(element)
+            position, more = self.read_end_of_value(position, ']')
+        if field.min_length is not None and len(res) < field.min_length:
+            self.fail("the list must have at least %d element%s" % (field.min_length, "" if field.min_length == 1 else "s"),
+                      position, res)
+        return res, position
+
+    def parse_mapping(self, position, field):
+        node_trace = self.node_trace
+        res = {}
+        position, more = self.start_container(position, '}')
+        while more:
+            key_position = position
+            k, position = self.read_key(position)
+            self.check_key_of_mapping(k, field, key_position)
+            node_trace.append("value for key '%s'" % k)
+            res[k], position = self.parse_field(position, field.content)
+            node_trace.pop()
+            position, more = self.read_end_of_value(position, '}')
+        return res, position
+
+    def parse_node(self, position, infos, choice):
+        """
+        parses the value of one of the Nodes given as _NodeInfos.
+        As long as the 'type' is not known, an error in a field only means that one of the Nodes doesn't fit,
+        so it is reported like validation reports ambiguity: as an error of the whole object.
+        """
+        if len(self.node_trace) >= _DEPTH_READ_AT_ONCE or self.s[position:position + 1] != '{':
+            return self.read_at_once(position, self.check_node, infos, choice)
+        node_trace = self.node_trace
+        candidates = _Candidates(self, infos, choice)
+        res = {}
+        position, more = self.start_container(position, '}')
+        if not more and not candidates.is_selected:
+            self.fail_on_empty_object(infos, position, res)
+        while more:
+            key_position = position
+            k, position = self.read_key(position)
+            if k == 'type' and not candidates.is_selected:
+                res[k], position = self.scan_value(position)
+                candidates.select_type(res[k], key_position, res)
+                for previous_key in res:
+                    if previous_key != 'type':
+                        candidates.select_field(previous_key, key_position, res)
+            else:
+                field = candidates.select_field(k, key_position, res)
+                if field is None:
+                    res[k], position = self.scan_value(position)
+                elif candidates.is_selected:
+                    node_trace.append(k)
+                    res[k], position = self.parse_field(position, field)
+                    node_trace.pop()
+                else:
+                    depth = len(node_trace)
+                    try:
+                        node_trace.append(k)
+                        res[k], position = self.parse_field(position, field)
+                        node_trace.pop()
+                    except InvalidParamsException:
+                        del node_trace[depth:]
+                        candidates.fail_to_find_node(key_position, res)
+            position, more = self.read_end_of_value(position, '}')
+        candidates.check_required_fields(res, position)
+        return res, position
+
+    #####################################################################################
+    # checking values that were read at once
+    #####################################################################################
+
+    def check_field(self, val, field):
+        if isinstance(field, _LEAF_FIELD_TYPES):
+            try:
+                field.validate(val)
+            except InvalidParamsException as e:
+                self.fail(str(e), self.position_of_value_read_at_once, val)
+        elif val is None:
+            if not field.null:
+                self.fail("the value is not allowed to be null.", self.position_of_value_read_at_once, val)
+        elif isinstance(field, fields.Value):
+            self.check_node(val, self.get_infos(field.value, None), None)
+        elif isinstance(field, fields.Choice):
+            self.check_node(val, self.get_infos(None, field.choice), field.choice)
+        elif isinstance(field, fields.List):
+            self.check_list(val, field)
+        elif isinstance(field, fields.Mapping):
+            self.check_mapping(val, field)
+        elif isinstance(field, fields.PrimitiveValueOrGetter):
+            if isinstance(val, (str, int, float, bool)):
+                self.check_field(val, field.primitive_field)
+            else:
+                self.check_field(val, field.complex_field)
+
+    def check_list(self, val, field):
+        if not isinstance(val, list):
+            self.fail("the value must be a list", self.position_of_value_read_at_once, val)
+        if field.min_length is not None and len(val) < field.min_length:
+            self.fail("the list must have at least %d element%s" % (field.min_length, "" if field.min_length == 1 else "s"),
+                      self.position_of_value_read_at_once, val)
+        node_trace = self.node_trace
+        primitive = field.primitive
+        infos = None if field.value is None and field.choice is None else self.get_infos(field.value, field.choice)
+        for i, element in enumerate(val):
+            node_trace.append("index %d" % i)
+            if primitive is not None and (infos is None or isinstance(element, (str, int, float, bool))):
+                self.check_field(element, primitive)
+            else:
+                self.check_node(element, infos, field.choice)
+            node_trace.pop()
+
+    def check_mapping(self, val, field):
+        if not isinstance(val, dict):
+            self.fail("the value must be a dictionary", self.position_of_value_read_at_once, val)
+        node_trace = self.node_trace
+        for k, v in val.items():
+            self.check_key_of_mapping(k, field, self.position_of_value_read_at_once)
+            node_trace.append("value for key '%s'" % k)
+            self.check_field(v, field.content)
+            node_trace.pop()
+
+    def check_node(self, obj, infos, choice):
+        position = self.position_of_value_read_at_once
+        if not isinstance(obj, dict):
+            self.check_node_in_other_form(obj, infos, position)
+            return
+        node_trace = self.node_trace
+        candidates = _Candidates(self, infos, choice)
+        if not candidates.is_selected:
+            if not obj:
+                self.fail_on_empty_object(infos, position, obj)
+            if 'type' in obj:
+                candidates.select_type(obj['type'], position, obj)
+        for k, v in obj.items():
+            if k == 'type' and choice is not None and len(infos) > 1:
+                continue
+            field = candidates.select_field(k, position, obj)
+            if field is None:
+                continue
+            if candidates.is_selected:
+                node_trace.append(k)
+                self.check_field(v, field)
+                node_trace.pop()
+            else:
+                depth = len(node_trace)
+                try:
+                    node_trace.append(k)
+                    self.check_field(v, field)
+                    node_trace.pop()
+                except InvalidParamsException:
+                    del node_trace[depth:]
+                    candidates.fail_to_find_node(position, obj)
+        candidates.check_required_fields(obj, position)
+
+    #####################################################################################
+    # shared by both ways of reading
+    #####################################################################################
+
+    def check_key_of_mapping(self, k, field, position):
+        try:
+            field.string_key.validate(k)
+        except InvalidParamsException as e:
+            self.node_trace.append('key')
+            self.fail("could not parse the key '%s'. Exception was:\n%s" % (k, e,), position, k)
+
+    def check_node_in_other_form(self, val, infos, position):
+        """
+        checks a value of one of the Nodes that is not a dictionary, which only a shortform can be.
+        """
+        # null is handled by the Field that contains the Node
+        if val is None:
+            return
+        if len(infos) == 1:
+            shortform_field = infos[0].shortform_field
+            if shortform_field is None:
+                self.fail("the value must be a dictionary", position, val)
+            if isinstance(shortform_field, _LEAF_FIELD_TYPES):
+                try:
+                    shortform_field.validate(val)
+                except InvalidParamsException as e:
+                    self.node_trace.append('conversion from shortform')
+                    self.fail(str(e), position, val)
+            return
+        for info in infos:
+            shortform_field = info.shortform_field
+            if shortform_field is None:
+                continue
+            if not isinstance(shortform_field, _LEAF_FIELD_TYPES):
+                return
+            try:
+                shortform_field.validate(val)
+                return
+            except InvalidParamsException:
+                pass
+        _Candidates(self, infos, None).fail_to_find_node(position, val)
+
+    def fail_on_empty_object(self, infos, position, current_object):
+        self.fail("submitted an empty dictionary.\nValid types are: %s\n"
+                  "Select one of the valid types for a description of its fields." %
+                  ', '.join(a.name for a in infos), position, current_object)
@@ -0,0 +1,714 @@
+import bisect
+import collections
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+from . import basics
+
+
+#####################################################################################
+# Opt-in profiling of the calls of execute_function_on_node() and of the entry points in functions.py.
+# A Profiler is an ExecutionObserver (see basics.py) that counts, for each Node and function,
+# how often it was called, how much time it took, and how often ambiguity had to be resolved.
+# It also keeps a latency histogram for each entry point.
+# The results can be exported as a dict or in the text format of Prometheus.
+# A Tracer records a timed span for each call instead, so that it can be seen which subtree of a single object is slow.
+# A MemoryProfiler measures how much memory each phase and each type of Node allocates, using tracemalloc.
+#
+# Usage:
+#     with profiling.Profiler() as profiler:
+#         functions.validate_example_object(obj)
+#     print(profiler.to_prometheus_text())
+#     with profiling.Tracer() as tracer:
+#         functions.evaluate_numerical_node(obj)
+#     print(tracer.to_collapsed_stacks())
+#     with profiling.MemoryProfiler() as memory_profiler:
+#         functions.visualize_numerical_node_in_html(obj)
+#     print(memory_profiler.get_report())
+#####################################################################################
+
+
+# the upper bounds in seconds of the buckets of the latency histograms
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                           1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """
+    counts latencies in buckets with fixed upper bounds, like a Prometheus histogram.
+    Percentiles are estimated by interpolating within the bucket they fall into.
+    """
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # the last count is for values above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def get_percentile(self, fraction):
+        """
+        returns an estimate of the given percentile, as a fraction between 0 and 1, or None if nothing was recorded.
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count == 0:
+                continue
+            if cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * max(0.0, rank - cumulative) / count
+            cumulative += count
+        return self.max
+
+    def get_cumulative_buckets(self):
+        """
+        returns a list of tuples of (upper bound, number of values less than or equal to it),
+        ending with an upper bound of infinity.
+        """
+        res = []
+        cumulative = 0
+        for upper, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            res.append((upper, cumulative))
+        return res
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_seconds': self.sum,
+            'mean_seconds': self.sum / self.count if self.count else None,
+            'p50_seconds': self.get_percentile(0.5),
+            'p90_seconds': self.get_percentile(0.9),
+            'p99_seconds': self.get_percentile(0.99),
+            'max_seconds': self.max,
+            'buckets': [['+Inf' if upper == float('inf') else upper, count]
+                        for upper, count in self.get_cumulative_buckets()],
+        }
+
+
+class _Frame:
+    """
+    one call of execute_function_on_node() that has not returned yet.
+    """
+    __slots__ = ('function', 'name', 'start', 'child_seconds', 'candidate_attempts', 'failed_candidate_attempts')
+
+    def __init__(self, function, name):
+        self.function = function
+        # the value or choice until the Node is selected, then the name of the Node
+        self.name = name
+        self.start = time.perf_counter()
+        self.child_seconds = 0.0
+        self.candidate_attempts = 0
+        self.failed_candidate_attempts = 0
+
+
+class _NodeStatistics:
+    __slots__ = ('calls', 'errors', 'cumulative_seconds', 'self_seconds', 'ambiguity_resolutions',
+                 'candidate_attempts', 'failed_candidate_attempts')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cumulative_seconds = 0.0
+        self.self_seconds = 0.0
+        self.ambiguity_resolutions = 0
+        self.candidate_attempts = 0
+        self.failed_candidate_attempts = 0
+
+
+class Profiler(basics.ExecutionObserver):
+    """
+    collects statistics about the calls of execute_function_on_node() and of the entry points, in all threads.
+    For each combination of Node and function, it records:
+    -the number of calls and how many of them raised an exception.
+    -the cumulative time, including nested calls. Recursive calls are only counted once.
+    -the self time, excluding nested calls of execute_function_on_node().
+    -how often the Node had to be found by trying to validate with several candidates, because the 'type' was missing,
+    and how many candidates were tried and failed while doing so.
+    If the Node could not be determined, because the call failed before that, the value or choice is used as the name.
+    """
+    def __init__(self, latency_buckets=DEFAULT_LATENCY_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """
+        discards everything that was recorded so far.
+        """
+        with self._lock:
+            self._node_statistics = {}
+            self._entry_point_histograms = {}
+            self._entry_point_errors = {}
+
+    def start(self):
+        basics.add_execution_observer(self)
+        return self
+
+    def stop(self):
+        basics.remove_execution_observer(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, etype, value, traceback):
+        self.stop()
+
+    #####################################################################################
+    # ExecutionObserver
+    #####################################################################################
+
+    def _get_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    def node_function_started(self, function, obj, stack_objects, value, choice):
+        self._get_stack().append(_Frame(function, value if value is not None else choice))
+
+    def node_selected(self, node):
+        stack = self._get_stack()
+        if stack:
+            stack[-1].name = node.Meta.name
+
+    def ambiguity_candidate_started(self, node):
+        stack = self._get_stack()
+        if stack:
+            stack[-1].candidate_attempts += 1
+
+    def ambiguity_candidate_finished(self, node, succeeded):
+        stack = self._get_stack()
+        if stack and not succeeded:
+            stack[-1].failed_candidate_attempts += 1
+
+    def node_function_finished(self, error):
+        stack = self._get_stack()
+        if not stack:
+            # the Profiler was started in the middle of this call
+            return
+        frame = stack.pop()
+        elapsed = time.perf_counter() - frame.start
+        if stack:
+            stack[-1].child_seconds += elapsed
+        # recursive calls are already included in the cumulative time of the outermost call
+        is_recursive = any(a.name == frame.name and a.function == frame.function for a in stack)
+        with self._lock:
+            key = (frame.name, frame.function)
+            statistics = self._node_statistics.get(key)
+            if statistics is None:
+                statistics = _NodeStatistics()
+                self._node_statistics[key] = statistics
+            statistics.calls += 1
+            if error is not None:
+                statistics.errors += 1
+            if not is_recursive:
+                statistics.cumulative_seconds += elapsed
+            statistics.self_seconds += elapsed - frame.child_seconds
+            if frame.candidate_attempts:
+                statistics.ambiguity_resolutions += 1
+                statistics.candidate_attempts += frame.candidate_attempts
+                statistics.failed_candidate_attempts += frame.failed_candidate_attempts
+
+    def entry_point_finished(self, name, seconds, error):
+        with self._lock:
+            histogram = self._entry_point_histograms.get(name)
+            if histogram is None:
+                histogram = LatencyHistogram(self.latency_buckets)
+                self._entry_point_histograms[name] = histogram
+                self._entry_point_errors[name] = 0
+            histogram.add(seconds)
+            if error is not None:
+                self._entry_point_errors[name] += 1
+
+    #####################################################################################
+    # export
+    #####################################################################################
+
+    def get_statistics(self):
+        """
+        returns everything that was recorded as a JSON-serializable dict.
+        The Nodes are sorted by their self time, highest first.
+        """
+        with self._lock:
+            nodes = []
+            for (name, function), a in self._node_statistics.items():
+                nodes.append({
+                    'node': name,
+                    'function': function,
+                    'calls': a.calls,
+                    'errors': a.errors,
+                    'cumulative_seconds': a.cumulative_seconds,
+                    'self_seconds': a.self_seconds,
+                    'ambiguity_resolutions': a.ambiguity_resolutions,
+                    'candidate_attempts': a.candidate_attempts,
+                    'failed_candidate_attempts': a.failed_candidate_attempts,
+                })
+            entry_points = {}
+            for name, histogram in self._entry_point_histograms.items():
+                entry_points[name] = histogram.to_dict()
+                entry_points[name]['errors'] = self._entry_point_errors[name]
+        nodes.sort(key=lambda a: a['self_seconds'], reverse=True)
+        return {
+            'nodes': nodes,
+            'entry_points': entry_points,
+        }
+
+    def to_prometheus_text(self, prefix='syntaxtrees'):
+        """
+        returns everything that was recorded in the text exposition format of Prometheus.
+        """
+        statistics = self.get_statistics()
+        lines = []
+        node_metrics = [
+            ('node_function_calls_total', 'calls', "Number of calls of a function on a Node."),
+            ('node_function_errors_total', 'errors', "Number of calls of a function on a Node that raised an exception."),
+            ('node_function_seconds_total', 'cumulative_seconds',
+             "Time spent in calls of a function on a Node, including nested Nodes."),
+            ('node_function_self_seconds_total', 'self_seconds',
+             "Time spent in calls of a function on a Node, excluding nested Nodes."),
+            ('ambiguity_resolutions_total', 'ambiguity_resolutions',
+             "Number of times the Node had to be determined by trying several candidates."),
+            ('ambiguity_candidate_attempts_total', 'candidate_attempts',
+             "Number of candidates tried while resolving ambiguity."),
+            ('ambiguity_failed_candidate_attempts_total', 'failed_candidate_attempts',
+             "Number of candidates that failed to validate while resolving ambiguity."),
+        ]
+        for metric, key, description in node_metrics:
+            name = "%s_%s" % (prefix, metric)
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s counter" % name)
+            for a in statistics['nodes']:
+                lines.append("%s{node=\"%s\",function=\"%s\"} %s" %
+                             (name, _escape_label_value(a['node']), _escape_label_value(a['function']),
+                              _format_number(a[key])))
+        name = "%s_entry_point_latency_seconds" % prefix
+        lines.append("# HELP %s Latency of the entry points." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for entry_point, a in sorted(statistics['entry_points'].items()):
+            label = _escape_label_value(entry_point)
+            for upper, count in a['buckets']:
+                lines.append("%s_bucket{entry_point=\"%s\",le=\"%s\"} %d" %
+                             (name, label, upper if upper == '+Inf' else _format_number(upper), count))
+            lines.append("%s_sum{entry_point=\"%s\"} %s" % (name, label, _format_number(a['sum_seconds'])))
+            lines.append("%s_count{entry_point=\"%s\"} %d" % (name, label, a['count']))
+        name = "%s_entry_point_errors_total" % prefix
+        lines.append("# HELP %s Number of calls of the entry points that raised an exception." % name)
+        lines.append("# TYPE %s counter" % name)
+        for entry_point, a in sorted(statistics['entry_points'].items()):
+            lines.append("%s{entry_point=\"%s\"} %d" % (name, _escape_label_value(entry_point), a['errors']))
+        return '\n'.join(lines) + '\n'
+
+
+#####################################################################################
+# tracing
+#####################################################################################
+
+
+# node_trace labels that name a position in the object. All other labels only describe what is being done.
+_node_trace_index_regex = re.compile(r"^index (\d+)$")
+_node_trace_key_regex = re.compile(r"^value for key '(.*)'$", re.DOTALL)
+_node_trace_field_regex = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+
+class Tracer(basics.ExecutionObserver):
+    """
+    records a timed span for each call of execute_function_on_node(), keyed by the type of the Node
+    and the JSON path of the object it was called on, like $.summands[0].rest
+    The paths are found by looking up the objects in the object of the outermost call.
+    Objects that are not part of it, such as shortforms during validation, get their path from the labels
+    that node_trace_step() adds to the node_trace, which are also the ones shown in error messages.
+    Only calls in one thread are recorded: by default the thread that starts the Tracer.
+    The spans can be exported as collapsed stacks for flamegraph tools, or as a Chrome trace.
+    """
+    def __init__(self, thread_id=None):
+        self.thread_id = thread_id
+        self.spans = []
+        self._stack = []
+        self._paths_of_objects = {}
+        self._start_of_trace = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._start_of_trace = time.perf_counter()
+        basics.add_execution_observer(self)
+        return self
+
+    def stop(self):
+        basics.remove_execution_observer(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, etype, value, traceback):
+        self.stop()
+
+    def node_function_started(self, function, obj, stack_objects, value, choice):
+        if threading.get_ident() != self.thread_id:
+            return
+        node_trace = stack_objects.get('node_trace') or []
+        if not self._stack:
+            self._paths_of_objects = {}
+            _collect_paths_of_objects(obj, '$', self._paths_of_objects)
+            parent_path = '$'
+            new_labels = []
+        else:
+            parent = self._stack[-1]
+            parent_path = parent['path']
+            new_labels = node_trace[parent['node_trace_length']:]
+        path = self._paths_of_objects.get(id(obj)) if isinstance(obj, (dict, list)) else None
+        if path is None:
+            path = parent_path + ''.join(_node_trace_label_to_path_component(a) for a in new_labels)
+        self._stack.append({
+            'node': value if value is not None else choice,
+            'function': function,
+            'path': path,
+            'node_trace': ' - '.join("%s" % a for a in node_trace),
+            'node_trace_length': len(node_trace),
+            'depth': len(self._stack),
+            'start': time.perf_counter(),
+            'child_seconds': 0.0,
+        })
+
+    def node_selected(self, node):
+        if threading.get_ident() == self.thread_id and self._stack:
+            self._stack[-1]['node'] = node.Meta.name
+
+    def ambiguity_candidate_started(self, node):
+        # each attempt to resolve ambiguity gets its own span, nested in the span of the call
+        if threading.get_ident() != self.thread_id or not self._stack:
+            return
+        parent = self._stack[-1]
+        self._stack.append(dict(parent, node="%s (candidate)" % node.Meta.name, depth=len(self._stack),
+                                start=time.perf_counter(), child_seconds=0.0))
+
+    def ambiguity_candidate_finished(self, node, succeeded):
+        if threading.get_ident() == self.thread_id and self._stack:
+            self._finish_span(None if succeeded else 'failed to validate')
+
+    def node_function_finished(self, error):
+        if threading.get_ident() == self.thread_id and self._stack:
+            self._finish_span(None if error is None else type(error).__name__)
+
+    def _finish_span(self, error):
+        span = self._stack.pop()
+        seconds = time.perf_counter() - span['start']
+        stack_of_names = [_get_span_name(a) for a in self._stack] + [_get_span_name(span)]
+        if self._stack:
+            self._stack[-1]['child_seconds'] += seconds
+        else:
+            # the outermost call is finished. Don't keep the objects alive.
+            self._paths_of_objects = {}
+        self.spans.append({
+            'node': span['node'],
+            'function': span['function'],
+            'path': span['path'],
+            'node_trace': span['node_trace'],
+            'depth': span['depth'],
+            'stack': stack_of_names,
+            'start_seconds': span['start'] - self._start_of_trace,
+            'seconds': seconds,
+            'self_seconds': seconds - span['child_seconds'],
+            'error': error,
+        })
+
+    def to_collapsed_stacks(self):
+        """
+        returns the spans in the collapsed stack format used by flamegraph.pl and speedscope:
+        one line per stack, with the frames separated by semicolons and followed by the self time in microseconds.
+        """
+        self_time = collections.OrderedDict()
+        for span in self.spans:
+            key = ';'.join(a.replace(';', ',') for a in span['stack'])
+            self_time[key] = self_time.get(key, 0.0) + span['self_seconds']
+        return ''.join("%s %d\n" % (k, round(v * 1e6)) for k, v in self_time.items())
+
+    def to_chrome_trace(self):
+        """
+        returns the spans as a JSON-serializable dict in the trace event format,
+        which can be loaded in chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key=lambda a: (a['start_seconds'], a['depth'])):
+            events.append({
+                'name': _get_span_name(span),
+                'cat': span['function'],
+                'ph': 'X',
+                'ts': span['start_seconds'] * 1e6,
+                'dur': span['seconds'] * 1e6,
+                'pid': pid,
+                'tid': self.thread_id,
+                'args': {
+                    'node': span['node'],
+                    'path': span['path'],
+                    'node_trace': span['node_trace'],
+                    'error': span['error'],
+                },
+            })
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+        }
+
+
+def _get_span_name(span):
+    return "%s %s" % (span['node'], span['path'])
+
+
+def _collect_paths_of_objects(obj, path, res):
+    """
+    maps the ids of all dicts and lists in the object to their JSON paths.
+    Other values are not included, because equal numbers and strings can share the same id.
+    """
+    if isinstance(obj, dict):
+        if id(obj) in res:
+            return
+        res[id(obj)] = path
+        for k, v in obj.items():
+            _collect_paths_of_objects(v, path + _get_path_component_of_key(k), res)
+    elif isinstance(obj, list):
+        if id(obj) in res:
+            return
+        res[id(obj)] = path
+        for i, v in enumerate(obj):
+            _collect_paths_of_objects(v, "%s[%d]" % (path, i), res)
+
+
+def _node_trace_label_to_path_component(label):
+    label = "%s" % label
+    match = _node_trace_index_regex.match(label)
+    if match:
+        return "[%s]" % match.group(1)
+    match = _node_trace_key_regex.match(label)
+    if match:
+        return _get_path_component_of_key(match.group(1))
+    if _node_trace_field_regex.match(label):
+        return ".%s" % label
+    return ''
+
+
+def _get_path_component_of_key(k):
+    if isinstance(k, str) and _node_trace_field_regex.match(k):
+        return ".%s" % k
+    return "['%s']" % k
+
+
+#####################################################################################
+# memory
+#####################################################################################
+
+
+class _MemoryFrame:
+    """
+    a phase or a call of execute_function_on_node() that has not finished yet.
+    """
+    __slots__ = ('name', 'function', 'start_bytes', 'start_blocks', 'peak_bytes', 'snapshot')
+
+    def __init__(self, name, function, start_bytes, start_blocks):
+        self.name = name
+        self.function = function
+        self.start_bytes = start_bytes
+        self.start_blocks = start_blocks
+        self.peak_bytes = start_bytes
+        self.snapshot = None
+
+
+class MemoryProfiler(basics.ExecutionObserver):
+    """
+    measures the memory used by phases and by the calls of execute_function_on_node(), using tracemalloc.
+    tracemalloc is started if it is not running yet, which slows everything down considerably,
+    so this should not be used to measure time at the same time.
+    Only calls in one thread are measured: by default the thread that starts the MemoryProfiler.
+    For each phase and each call, it measures:
+    -the peak: the highest number of bytes that were allocated at the same time, on top of what was allocated before.
+    -the retained bytes: how many more bytes are allocated afterwards than before, e.g. for the result.
+    -the retained blocks: how many more memory blocks are allocated afterwards than before.
+    Every call of an entry point in functions.py is a phase. Other phases can be defined with phase().
+    If top_allocation_sites is positive, tracemalloc snapshots are taken around each phase
+    and the lines of code that retained the most memory are reported.
+    The results are aggregated per phase name and per combination of Node and function.
+    """
+    def __init__(self, thread_id=None, top_allocation_sites=0):
+        self.thread_id = thread_id
+        self.top_allocation_sites = top_allocation_sites
+        self._stack = []
+        self._phases = collections.OrderedDict()
+        self._node_statistics = {}
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        basics.add_execution_observer(self)
+        return self
+
+    def stop(self):
+        basics.remove_execution_observer(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, etype, value, traceback):
+        self.stop()
+
+    def phase(self, name):
+        """
+        returns a context manager that measures everything inside it as a phase with the given name.
+        """
+        return _MemoryPhase(self, name)
+
+    #####################################################################################
+    # measurements
+    #####################################################################################
+
+    def _start_frame(self, name, function):
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        # the peak is reset for each frame, so the peak so far belongs to the enclosing frame
+        if self._stack:
+            self._stack[-1].peak_bytes = max(self._stack[-1].peak_bytes, peak_bytes)
+        frame = _MemoryFrame(name, function, current_bytes, sys.getallocatedblocks())
+        self._stack.append(frame)
+        tracemalloc.reset_peak()
+        return frame
+
+    def _finish_frame(self):
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        frame = self._stack.pop()
+        frame.peak_bytes = max(frame.peak_bytes, peak_bytes)
+        if self._stack:
+            self._stack[-1].peak_bytes = max(self._stack[-1].peak_bytes, frame.peak_bytes)
+        tracemalloc.reset_peak()
+        return frame, {
+            'peak_bytes': frame.peak_bytes - frame.start_bytes,
+            'retained_bytes': current_bytes - frame.start_bytes,
+            'retained_blocks': blocks - frame.start_blocks,
+        }
+
+    def _start_phase(self, name):
+        frame = self._start_frame(name, None)
+        if self.top_allocation_sites > 0:
+            frame.snapshot = tracemalloc.take_snapshot()
+
+    def _finish_phase(self, name):
+        # if the MemoryProfiler was started in the middle of the phase, there is nothing to finish
+        if not self._stack or self._stack[-1].function is not None or self._stack[-1].name != name:
+            return
+        snapshot = tracemalloc.take_snapshot() if self._stack[-1].snapshot is not None else None
+        frame, measurement = self._finish_frame()
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = {'name': name, 'count': 0, 'max_peak_bytes': 0, 'total_retained_bytes': 0,
+                     'total_retained_blocks': 0, 'top_allocation_sites': []}
+            self._phases[name] = phase
+        phase['count'] += 1
+        phase['max_peak_bytes'] = max(phase['max_peak_bytes'], measurement['peak_bytes'])
+        phase['total_retained_bytes'] += measurement['retained_bytes']
+        phase['total_retained_blocks'] += measurement['retained_blocks']
+        if snapshot is not None:
+            # the allocation sites of the last time this phase was run
+            # leave out the memory used by the measurements themselves
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            statistics = snapshot.filter_traces(filters).compare_to(frame.snapshot.filter_traces(filters), 'lineno')
+            phase['top_allocation_sites'] = [{
+                'location': "%s:%d" % (a.traceback[0].filename, a.traceback[0].lineno),
+                'retained_bytes': a.size_diff,
+                'retained_blocks': a.count_diff,
+            } for a in statistics[:self.top_allocation_sites]]
+
+    #####################################################################################
+    # ExecutionObserver
+    #####################################################################################
+
+    def node_function_started(self, function, obj, stack_objects, value, choice):
+        if threading.get_ident() == self.thread_id:
+            self._start_frame(value if value is not None else choice, function)
+
+    def node_selected(self, node):
+        if threading.get_ident() == self.thread_id and self._stack and self._stack[-1].function is not None:
+            self._stack[-1].name = node.Meta.name
+
+    def node_function_finished(self, error):
+        if threading.get_ident() != self.thread_id or not self._stack or self._stack[-1].function is None:
+            return
+        frame, measurement = self._finish_frame()
+        key = (frame.name, frame.function)
+        statistics = self._node_statistics.get(key)
+        if statistics is None:
+            statistics = {'node': frame.name, 'function': frame.function, 'calls': 0, 'max_peak_bytes': 0,
+                          'total_retained_bytes': 0, 'total_retained_blocks': 0}
+            self._node_statistics[key] = statistics
+        statistics['calls'] += 1
+        statistics['max_peak_bytes'] = max(statistics['max_peak_bytes'], measurement['peak_bytes'])
+        statistics['total_retained_bytes'] += measurement['retained_bytes']
+        statistics['total_retained_blocks'] += measurement['retained_blocks']
+
+    def entry_point_started(self, name):
+        if threading.get_ident() == self.thread_id:
+            self._start_phase(name)
+
+    def entry_point_finished(self, name, seconds, error):
+        if threading.get_ident() == self.thread_id:
+            self._finish_phase(name)
+
+    #####################################################################################
+    # export
+    #####################################################################################
+
+    def get_report(self):
+        """
+        returns everything that was measured as a JSON-serializable dict.
+        The Nodes are sorted by their highest peak, highest first.
+        Note that the retained memory of a call includes that of the calls nested in it.
+        """
+        nodes = [dict(a) for a in self._node_statistics.values()]
+        nodes.sort(key=lambda a: a['max_peak_bytes'], reverse=True)
+        return {
+            'phases': [dict(a) for a in self._phases.values()],
+            'nodes': nodes,
+        }
+
+
+class _MemoryPhase:
+    def __init__(self, memory_profiler, name):
+        self.memory_profiler = memory_profiler
+        self.name = name
+
+    def __enter__(self):
+        self.memory_profiler._start_phase(self.name)
+
+    def __exit__(self, etype, value, traceback):
+        self.memory_profiler._finish_phase(self.name)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
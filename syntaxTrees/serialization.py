@@ -0,0 +1,463 @@
+import collections
+import hashlib
+import json
+import math
+import struct
+import threading
+import weakref
+
+from . import basics
+from . import fields
+from .utilities import InvalidParamsException, ProgrammingError
+
+
+#####################################################################################
+# A compact binary encoding for trees that have already been validated.
+# Nodes are identified by their index in the Registry, and their fields by their position in the field table
+# of the Node, so neither the field names nor the 'type' strings are stored.
+# Fields whose value is the default value are left out, and strings that occur several times are stored once.
+# Decoding reconstructs exactly the OrderedDicts that validation produced, so data that comes from a trusted source
+# doesn't need to be validated again.
+# The header contains a fingerprint of everything the encoding depends on,
+# so that data can't be decoded with a schema that has changed in the meantime.
+#
+# Usage:
+#     data = serialization.encode(validated_object, choice='numerical_node')
+#     validated_object = serialization.decode(data)
+# or for data from an untrusted source:
+#     validated_object = serialization.decode(data, validate_function=functions.validate_example_object)
+#####################################################################################
+
+
+_MAGIC = b'STB'
+_FORMAT_VERSION = 1
+_FINGERPRINT_LENGTH = 32
+_HEADER_LENGTH = len(_MAGIC) + 1 + _FINGERPRINT_LENGTH
+
+# each encoded value starts with one of these tags
+_TAG_NULL = 0
+_TAG_FALSE = 1
+_TAG_TRUE = 2
+_TAG_INTEGER = 3
+_TAG_FLOAT = 4
+_TAG_STRING = 5
+_TAG_STRING_REFERENCE = 6
+_TAG_LIST = 7
+_TAG_DICT = 8
+_TAG_NODE = 9
+
+_float_struct = struct.Struct('<d')
+
+
+def encode(obj, value=None, choice=None, registry=None):
+    """
+    encodes a validated object of the Node identified by 'value' or of the group of Nodes identified by 'choice'.
+    The Nodes are taken from the given Registry, or from the active Registry.
+    Parts of the object that don't look like the result of a validation are still encoded, just less compactly.
+    """
+    if (value is None) == (choice is None):
+        raise ProgrammingError("the Node or group of nodes must be identified by either a 'value' or a 'choice' of values.")
+    layout = _get_layout(registry)
+    encoder = _Encoder(layout)
+    encoder.out += _MAGIC
+    encoder.out.append(_FORMAT_VERSION)
+    encoder.out += layout.fingerprint
+    encoder.write_node(obj, value, choice)
+    return bytes(encoder.out)
+
+
+def decode(data, registry=None, validate_function=None):
+    """
+    decodes an object that was encoded with encode(), using the given Registry or the active Registry.
+    Without a validate_function, the data is trusted and the object is returned as it was when it was encoded.
+    Otherwise the decoded object is passed to the validate_function, e.g. functions.validate_example_object,
+    and its result is returned.
+    Raises an InvalidParamsException if the data is malformed or was encoded with a different schema.
+    """
+    layout = _get_layout(registry)
+    position = _read_header(layout, data, 0)
+    obj, position = _decode_value(layout, data, position)
+    if position != len(data):
+        raise InvalidParamsException("the encoded data has trailing bytes.")
+    if validate_function is not None:
+        obj = validate_function(obj)
+    return obj
+
+
+def get_encoding_fingerprint(registry=None):
+    """
+    returns a hash of everything that the encoding of the given Registry depends on:
+    the Nodes and their order, and the names and definitions of their Fields.
+    Unlike basics.get_schema_fingerprint(), this does not change when only the documentation changes.
+    """
+    return _get_layout(registry).fingerprint.hex()
+
+
+#####################################################################################
+# layout
+#####################################################################################
+
+
+# the layout of each Registry that has been used, computed on first use
+_layouts = weakref.WeakKeyDictionary()
+_layouts_lock = threading.Lock()
+
+
+class _NodeLayout:
+    """
+    describes how the objects of one Node are encoded.
+    """
+    def __init__(self, node_id, node, list_of_fields):
+        self.node_id = node_id
+        self.node = node
+        self.choice_type = getattr(node.Meta, 'choice_type', None)
+        self.fields = tuple(field for field_name, field in list_of_fields)
+        self.slot_of_field_name = {field_name: i for i, (field_name, field) in enumerate(list_of_fields)}
+        # default values used for comparison while encoding
+        self.defaults = tuple(field.get_the_default_value() for field in self.fields)
+        # for decoding: tuples of (field_name, default_value, function that creates the default value or None)
+        self.slots = tuple((field_name, field.default, field.default if callable(field.default) else None)
+                           for field_name, field in list_of_fields)
+
+
+class _Layout:
+    """
+    the tables used for encoding and decoding the objects of a Registry.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.nodes = tuple(_NodeLayout(i, node, registry.value_to_node_fields.get(node.Meta.name, ()))
+                           for i, node in enumerate(registry.all_nodes))
+        self.node_of_value = {a.node.Meta.name: a for a in self.nodes}
+        self.fingerprint = _compute_fingerprint(registry)
+
+
+def _get_layout(registry):
+    if registry is None:
+        registry = basics.get_active_registry()
+    layout = _layouts.get(registry)
+    if layout is None:
+        registry.ensure_schema_is_built()
+        if not registry.is_frozen:
+            raise ProgrammingError("finalize() must be called before objects can be encoded or decoded, "
+                                   "because the encoding depends on the tables of the Registry.")
+        with _layouts_lock:
+            layout = _layouts.get(registry)
+            if layout is None:
+                layout = _Layout(registry)
+                _layouts[registry] = layout
+    return layout
+
+
+def _compute_fingerprint(registry):
+    description = []
+    for node in registry.all_nodes:
+        description.append([
+            node.Meta.name,
+            getattr(node.Meta, 'choice_of', None),
+            getattr(node.Meta, 'choice_type', None),
+            [[field_name, _describe_field_for_fingerprint(field)]
+             for field_name, field in registry.value_to_node_fields.get(node.Meta.name, ())],
+        ])
+    serialized_description = json.dumps([_FORMAT_VERSION, description], sort_keys=True)
+    return hashlib.sha256(serialized_description.encode('utf-8')).digest()
+
+
+def _describe_field_for_fingerprint(field):
+    """
+    describes a Field like basics.get_schema_fingerprint() does, but without the help texts,
+    which don't matter for the encoding.
+    """
+    def strip_help_texts(description):
+        if isinstance(description, dict):
+            return {k: strip_help_texts(v) for k,v in description.items()
+                    if not (k == 'help' and '<class>' in description)}
+        if isinstance(description, list):
+            return [strip_help_texts(a) for a in description]
+        return description
+    return strip_help_texts(basics._describe_value_for_fingerprint(field))
+
+
+def _is_identical(a, b):
+    """
+    like ==, but values of different types are never identical (unlike 1, 1.0 and True),
+    so that a value can be replaced by the default value it is identical to.
+    """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return len(a) == len(b) and all(ka == kb and _is_identical(a[ka], b[kb]) for ka, kb in zip(a, b))
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_is_identical(x, y) for x, y in zip(a, b))
+    if isinstance(a, float):
+        # 0.0 and -0.0 are equal, but not identical
+        return a == b and math.copysign(1.0, a) == math.copysign(1.0, b)
+    return a == b
+
+
+#####################################################################################
+# encoding
+#####################################################################################
+
+
+class _Encoder:
+    def __init__(self, layout):
+        self.layout = layout
+        self.out = bytearray()
+        # maps each string that has been written to its index, so that it can be referenced later
+        self.strings = {}
+
+    def write_varint(self, n):
+        out = self.out
+        while n > 0x7f:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def write_node(self, obj, value, choice):
+        """
+        writes an object of the Node identified by 'value' or of one of the Nodes identified by 'choice'.
+        """
+        if not isinstance(obj, dict):
+            self.write_value(obj)
+            return
+        if value is None:
+            choice_type = obj.get('type')
+            if not isinstance(choice_type, str):
+                self.write_value(obj)
+                return
+            value = self.layout.registry.choice_to_type_to_values[choice].get(choice_type)
+        node_layout = self.layout.node_of_value.get(value)
+        if node_layout is None:
+            self.write_value(obj)
+            return
+        # the keys need to be in the order of the field table, with the 'type' first, as validate() returns them
+        slot_of_field_name = node_layout.slot_of_field_name
+        defaults = node_layout.defaults
+        present = 0
+        explicit = 0
+        explicit_values = []
+        last_slot = -1
+        for i, (k, v) in enumerate(obj.items()):
+            if i == 0 and k == 'type' and node_layout.choice_type is not None:
+                if v != node_layout.choice_type:
+                    self.write_value(obj)
+                    return
+                present = 1
+                continue
+            slot = slot_of_field_name.get(k)
+            if slot is None or slot <= last_slot:
+                self.write_value(obj)
+                return
+            last_slot = slot
+            present |= 2 << slot
+            if not _is_identical(v, defaults[slot]):
+                explicit |= 2 << slot
+                explicit_values.append((v, node_layout.fields[slot]))
+        self.out.append(_TAG_NODE)
+        self.write_varint(node_layout.node_id)
+        self.write_node_body(present, explicit, explicit_values)
+
+    def write_node_body(self, present, explicit, explicit_values):
+        self.write_varint(present)
+        self.write_varint(explicit)
+        for v, field in explicit_values:
+            self.write_field_value(v, field)
+
+    def write_field_value(self, val, field):
+        """
+        writes the value of a Field, using the Field to recognize the objects of Nodes.
+        """
+        if val is None:
+            self.out.append(_TAG_NULL)
+        elif isinstance(field, fields.Value):
+            self.write_node(val, field.value, None)
+        elif isinstance(field, fields.Choice):
+            self.write_node(val, None, field.choice)
+        elif isinstance(field, fields.List) and isinstance(val, list):
+            self.out.append(_TAG_LIST)
+            self.write_varint(len(val))
+            for element in val:
+                # the same distinction as in List.helper_for_validation()
+                if field.primitive is not None and (isinstance(element, (str, int, float, bool)) or
+                                                    (field.value is None and field.choice is None)):
+                    self.write_field_value(element, field.primitive)
+                else:
+                    self.write_node(element, field.value, field.choice)
+        elif isinstance(field, fields.Mapping) and isinstance(val, dict):
+            self.out.append(_TAG_DICT)
+            self.write_varint(len(val))
+            for k,v in val.items():
+                self.write_value(k)
+                self.write_field_value(v, field.content)
+        elif isinstance(field, fields.PrimitiveValueOrGetter):
+            if isinstance(val, (str, int, float, bool)):
+                self.write_field_value(val, field.primitive_field)
+            else:
+                self.write_field_value(val, field.complex_field)
+        else:
+            self.write_value(val)
+
+    def write_value(self, val):
+        """
+        writes any JSON-like value, without using the schema.
+        """
+        out = self.out
+        if val is None:
+            out.append(_TAG_NULL)
+        elif val is True:
+            out.append(_TAG_TRUE)
+        elif val is False:
+            out.append(_TAG_FALSE)
+        elif isinstance(val, int):
+            out.append(_TAG_INTEGER)
+            # zigzag encoding, so that small negative numbers are small as well
+            self.write_varint(val << 1 if val >= 0 else ((-val) << 1) - 1)
+        elif isinstance(val, float):
+            out.append(_TAG_FLOAT)
+            out += _float_struct.pack(val)
+        elif isinstance(val, str):
+            self.write_string(val)
+        elif isinstance(val, (list, tuple)):
+            out.append(_TAG_LIST)
+            self.write_varint(len(val))
+            for element in val:
+                self.write_value(element)
+        elif isinstance(val, dict):
+            out.append(_TAG_DICT)
+            self.write_varint(len(val))
+            for k,v in val.items():
+                self.write_value(k)
+                self.write_value(v)
+        else:
+            raise ProgrammingError("can't encode a value of type %s" % (type(val).__name__,))
+
+    def write_string(self, val):
+        index = self.strings.get(val)
+        if index is not None:
+            self.out.append(_TAG_STRING_REFERENCE)
+            self.write_varint(index)
+        else:
+            self.strings[val] = len(self.strings)
+            encoded = val.encode('utf-8')
+            self.out.append(_TAG_STRING)
+            self.write_varint(len(encoded))
+            self.out += encoded
+
+
+#####################################################################################
+# decoding
+#####################################################################################
+
+
+def _read_header(layout, data, position):
+    """
+    verifies the header of an encoded object and returns the position after it.
+    """
+    header = bytes(data[position:position + _HEADER_LENGTH])
+    if len(header) != _HEADER_LENGTH or not header.startswith(_MAGIC):
+        raise InvalidParamsException("the data is not an encoded object.")
+    if header[len(_MAGIC)] != _FORMAT_VERSION:
+        raise InvalidParamsException("the data was encoded with an unsupported version of the format: %d" %
+                                     header[len(_MAGIC)])
+    if header[len(_MAGIC) + 1:] != layout.fingerprint:
+        raise InvalidParamsException("the data was encoded with a different schema.")
+    return position + _HEADER_LENGTH
+
+
+def _decode_value(layout, data, position):
+    """
+    decodes one value, starting at the given position of the data, which can be any object that supports
+    indexing and slicing like bytes. Returns the value and the position after it.
+    """
+    try:
+        return _decode_value_unchecked(layout, data, position)
+    except (IndexError, TypeError, ValueError, struct.error, RecursionError):
+        raise InvalidParamsException("the encoded data is malformed.")
+
+
+def _decode_value_unchecked(layout, data, position):
+    nodes = layout.nodes
+    strings = []
+    OrderedDict = collections.OrderedDict
+    unpack_float = _float_struct.unpack_from
+
+    def read_varint():
+        nonlocal position
+        b = data[position]
+        position += 1
+        if b < 0x80:
+            return b
+        res = b & 0x7f
+        shift = 7
+        while True:
+            b = data[position]
+            position += 1
+            res |= (b & 0x7f) << shift
+            if b < 0x80:
+                return res
+            shift += 7
+
+    def read_value():
+        nonlocal position
+        tag = data[position]
+        position += 1
+        if tag == _TAG_NODE:
+            node_layout = nodes[read_varint()]
+            present = read_varint()
+            explicit = read_varint()
+            res = OrderedDict()
+            if present & 1:
+                res['type'] = node_layout.choice_type
+            present >>= 1
+            explicit >>= 1
+            for field_name, default, default_factory in node_layout.slots:
+                if not present:
+                    break
+                if present & 1:
+                    if explicit & 1:
+                        res[field_name] = read_value()
+                    elif default_factory is not None:
+                        res[field_name] = default_factory()
+                    else:
+                        res[field_name] = default
+                present >>= 1
+                explicit >>= 1
+            if present:
+                raise ValueError("a field that does not exist is marked as present")
+            return res
+        if tag == _TAG_STRING_REFERENCE:
+            return strings[read_varint()]
+        if tag == _TAG_STRING:
+            length = read_varint()
+            if position + length > len(data):
+                raise IndexError("the string is cut off")
+            res = str(data[position:position + length], 'utf-8')
+            position += length
+            strings.append(res)
+            return res
+        if tag == _TAG_INTEGER:
+            n = read_varint()
+            return -((n + 1) >> 1) if n & 1 else n >> 1
+        if tag == _TAG_LIST:
+            return [read_value() for _ in range(read_varint())]
+        if tag == _TAG_DICT:
+            res = OrderedDict()
+            for _ in range(read_varint()):
+                k = read_value()
+                res[k] = read_value()
+            return res
+        if tag == _TAG_FLOAT:
+            res = unpack_float(data, position)[0]
+            position += 8
+            return res
+        if tag == _TAG_NULL:
+            return None
+        if tag == _TAG_TRUE:
+            return True
+        if tag == _TAG_FALSE:
+            return False
+        raise ValueError("unknown tag: %d" % tag)
+
+    res = read_value()
+    return res, position
@@ -0,0 +1,454 @@
+import argparse
+import contextlib
+import http.server
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import socketserver
+import sys
+import threading
+import time
+
+from . import profiling
+
+
+#####################################################################################
+# A local HTTP server for validating, evaluating and visualizing objects,
+# so that services don't need to import syntaxTrees and finalize the schema themselves.
+# The module that defines and finalizes the schema is imported once, before a pool of worker processes is forked,
+# so each worker starts with the finished schema and is ready to serve requests right away.
+# The work is done in the workers. The threads of the server only read the requests and wait for the results.
+# Only a limited number of tasks can be waiting for a worker at the same time.
+# Requests beyond that are rejected with status 503 and a Retry-After header instead of piling up.
+# Only the standard library is used.
+# Evaluation can't ask for input here: user_input Nodes read an empty stdin and fall back to their 'on_error' value.
+# Anything that Nodes print is discarded, so it can't end up in the logs of the server.
+#
+# Endpoints:
+#     POST /validate, /evaluate, /visualize    the body is the JSON of one object.
+#         Responds with {"result": ...}, or with {"error": ..., "error_type": ...} and status 400.
+#     POST /batch                              the body is {"items": [{"operation": "validate", "object": {...}}, ...]}.
+#         The items are split into chunks that are processed by the workers in parallel.
+#         Responds with {"results": [...]}, with one result or error per item, in the same order.
+#     GET /health                              {"status": "ok", ...} while the workers are running.
+#     GET /metrics                             the number of requests and a latency histogram for each endpoint.
+#
+# Usage:
+#     python -m syntaxTrees.server --port 8000 --workers 4
+#     python -m syntaxTrees.server --unix-socket /tmp/syntaxTrees.sock
+#     curl -X POST --data '{"type": "sum", "summands": [1, 2]}' http://127.0.0.1:8000/evaluate
+#####################################################################################
+
+
+DEFAULT_MODULE = __package__ + '.functions'
+# the functions of the module that each operation applies to the object, one after the other
+DEFAULT_OPERATIONS = {
+    'validate': ['validate_example_object'],
+    'evaluate': ['validate_example_object', 'evaluate_numerical_node'],
+    'visualize': ['validate_example_object', 'visualize_numerical_node_in_html'],
+}
+
+
+class ServerOverloadedException(Exception):
+    """
+    raised when a request can't be accepted because too many tasks are already waiting for a worker.
+    """
+    pass
+
+
+#####################################################################################
+# the worker processes
+#####################################################################################
+
+
+# the functions of each operation, set in each worker process by _initialize_worker()
+_worker_operations = None
+
+
+def _initialize_worker(module_name, operations):
+    global _worker_operations
+    module = importlib.import_module(module_name)
+    _worker_operations = {operation: [getattr(module, a) for a in function_names]
+                          for operation, function_names in operations.items()}
+
+
+def _run_operation(operation, obj):
+    """
+    applies an operation to an object and returns a tuple of (HTTP status, JSON text of the response).
+    """
+    from .utilities import InvalidParamsException
+    try:
+        functions_to_apply = _worker_operations[operation]
+    except KeyError:
+        return 404, json.dumps({'error': "unknown operation '%s'" % (operation,), 'error_type': 'UnknownOperation'})
+    # Nodes that interact with the user must not read from or write into the streams of the worker
+    original_stdin = sys.stdin
+    sys.stdin = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for function in functions_to_apply:
+                obj = function(obj)
+        return 200, json.dumps({'result': obj})
+    except InvalidParamsException as e:
+        return 400, json.dumps({'error': str(e), 'error_type': type(e).__name__})
+    except Exception as e:
+        return 500, json.dumps({'error': str(e), 'error_type': type(e).__name__})
+    finally:
+        sys.stdin = original_stdin
+
+
+def _run_request_body(operation, body):
+    """
+    parses the body of a request for a single object in the worker, and applies the operation to it.
+    """
+    try:
+        obj = json.loads(body)
+    except ValueError as e:
+        return 400, json.dumps({'error': "the request is not valid JSON: %s" % e, 'error_type': 'InvalidJSON'})
+    return _run_operation(operation, obj)
+
+
+def _run_chunk(items):
+    """
+    applies the operations to a chunk of the items of a batch.
+    """
+    res = []
+    for item in items:
+        if not isinstance(item, dict) or 'operation' not in item or 'object' not in item:
+            res.append((400, json.dumps({'error': "each item must be a dictionary with an 'operation' and an 'object'",
+                                         'error_type': 'InvalidBatchItem'})))
+        else:
+            res.append(_run_operation(item['operation'], item['object']))
+    return res
+
+
+#####################################################################################
+# the server
+#####################################################################################
+
+
+class ValidationServer:
+    """
+    owns the pool of worker processes and the statistics, and runs the HTTP server.
+    It can also be used without HTTP, through run_single() and run_batch().
+    """
+    def __init__(self, module_name=DEFAULT_MODULE, operations=None, workers=None, max_pending_tasks=64,
+                 batch_chunk_size=32, max_batch_items=10000, max_body_bytes=16 * 1024 * 1024, task_timeout=30.0):
+        self.module_name = module_name
+        self.operations = dict(DEFAULT_OPERATIONS if operations is None else operations)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.max_pending_tasks = max_pending_tasks
+        self.batch_chunk_size = batch_chunk_size
+        self.max_batch_items = max_batch_items
+        self.max_body_bytes = max_body_bytes
+        self.task_timeout = task_timeout
+        self._pool = None
+        self._pending_tasks = threading.BoundedSemaphore(max_pending_tasks)
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._pending_task_count = 0
+        self._rejected_requests = 0
+        self._timed_out_requests = 0
+        self._endpoint_to_histogram = {}
+        self._endpoint_to_status_counts = {}
+        self._httpd = None
+
+    def start(self):
+        """
+        imports the module, so that the schema is finalized before the workers are forked, and starts the workers.
+        """
+        if self._pool is not None:
+            return
+        # fail here rather than in every worker if the module or a function is missing
+        _initialize_worker(self.module_name, self.operations)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        self._pool = context.Pool(self.workers, initializer=_initialize_worker,
+                                  initargs=(self.module_name, self.operations))
+        self._started_at = time.time()
+
+    def close(self):
+        if self._httpd is not None:
+            self._httpd.server_close()
+            self._httpd = None
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    #####################################################################################
+    # running tasks
+    #####################################################################################
+
+    def _reserve_tasks(self, count):
+        """
+        reserves places for the given number of tasks, or raises a ServerOverloadedException if there are not enough.
+        """
+        for i in range(count):
+            if not self._pending_tasks.acquire(blocking=False):
+                for _ in range(i):
+                    self._release_task()
+                with self._lock:
+                    self._rejected_requests += 1
+                raise ServerOverloadedException("too many tasks are waiting for a worker")
+            with self._lock:
+                self._pending_task_count += 1
+
+    def _release_task(self, *args):
+        with self._lock:
+            self._pending_task_count -= 1
+        self._pending_tasks.release()
+
+    def _submit(self, function, args):
+        """
+        submits a task whose place has been reserved. The place is freed once a worker has finished the task,
+        even if nobody waits for the result anymore.
+        """
+        return self._pool.apply_async(function, args, callback=self._release_task, error_callback=self._release_task)
+
+    def _wait(self, async_results):
+        deadline = time.perf_counter() + self.task_timeout
+        try:
+            return [a.get(max(0.0, deadline - time.perf_counter())) for a in async_results]
+        except multiprocessing.TimeoutError:
+            with self._lock:
+                self._timed_out_requests += 1
+            raise
+
+    def run_single(self, operation, body):
+        """
+        applies an operation to the object in the JSON text of a request body.
+        Returns a tuple of (HTTP status, JSON text of the response).
+        """
+        self._reserve_tasks(1)
+        return self._wait([self._submit(_run_request_body, (operation, body))])[0]
+
+    def run_batch(self, items):
+        """
+        applies the operations of the items of a batch in chunks, in parallel.
+        Returns the JSON text of the response, with the results in the same order as the items.
+        """
+        # there is no use in more chunks than workers, and fewer chunks make large batches less likely to be rejected
+        chunk_size = max(self.batch_chunk_size, -(-len(items) // self.workers))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        self._reserve_tasks(len(chunks))
+        results = self._wait([self._submit(_run_chunk, (chunk,)) for chunk in chunks])
+        return '{"results": [%s]}' % ', '.join(text for chunk_results in results for status, text in chunk_results)
+
+    #####################################################################################
+    # statistics
+    #####################################################################################
+
+    def record_request(self, endpoint, status, seconds):
+        with self._lock:
+            histogram = self._endpoint_to_histogram.get(endpoint)
+            if histogram is None:
+                histogram = self._endpoint_to_histogram[endpoint] = profiling.LatencyHistogram()
+                self._endpoint_to_status_counts[endpoint] = {}
+            histogram.add(seconds)
+            status_counts = self._endpoint_to_status_counts[endpoint]
+            status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    def get_health(self):
+        return {
+            'status': 'ok' if self._pool is not None else 'stopped',
+            'module': self.module_name,
+            'workers': self.workers,
+            'pending_tasks': self._pending_task_count,
+            'max_pending_tasks': self.max_pending_tasks,
+        }
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'uptime_seconds': time.time() - self._started_at if self._started_at is not None else 0.0,
+                'workers': self.workers,
+                'pending_tasks': self._pending_task_count,
+                'max_pending_tasks': self.max_pending_tasks,
+                'rejected_requests': self._rejected_requests,
+                'timed_out_requests': self._timed_out_requests,
+                'endpoints': {endpoint: {'status_counts': dict(self._endpoint_to_status_counts[endpoint]),
+                                         'latency': histogram.to_dict()}
+                              for endpoint, histogram in self._endpoint_to_histogram.items()},
+            }
+
+    #####################################################################################
+    # HTTP
+    #####################################################################################
+
+    def serve(self, host='127.0.0.1', port=8000, unix_socket=None):
+        """
+        serves requests until interrupted, on a TCP port or on a Unix socket.
+        """
+        self.start()
+        handler = type('_BoundRequestHandler', (_RequestHandler,), {'validation_server': self})
+        if unix_socket is not None:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self._httpd = _UnixHTTPServer(unix_socket, handler)
+        else:
+            self._httpd = http.server.ThreadingHTTPServer((host, port), handler)
+            self._httpd.daemon_threads = True
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+            if unix_socket is not None and os.path.exists(unix_socket):
+                os.remove(unix_socket)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    # set on the subclass created by ValidationServer.serve()
+    validation_server = None
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # the client address of a Unix socket is not a tuple
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix-socket'
+
+    def log_message(self, format, *args):
+        # the metrics endpoint is the log
+        pass
+
+    def _respond(self, status, text, extra_headers=()):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in extra_headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _respond_with_error(self, status, message, error_type, extra_headers=()):
+        self._respond(status, json.dumps({'error': message, 'error_type': error_type}), extra_headers)
+
+    def do_GET(self):
+        server = self.validation_server
+        start = time.perf_counter()
+        if self.path == '/health':
+            health = server.get_health()
+            status = 200 if health['status'] == 'ok' else 503
+            self._respond(status, json.dumps(health))
+        elif self.path == '/metrics':
+            status = 200
+            self._respond(status, json.dumps(server.get_metrics()))
+        else:
+            status = 404
+            self._respond_with_error(status, "unknown endpoint '%s'" % (self.path,), 'UnknownEndpoint')
+        server.record_request(self.path if status != 404 else 'unknown', status, time.perf_counter() - start)
+
+    def do_POST(self):
+        server = self.validation_server
+        start = time.perf_counter()
+        endpoint = self.path.strip('/')
+        if endpoint != 'batch' and endpoint not in server.operations:
+            endpoint = 'unknown'
+        status = self._handle_post(server, endpoint)
+        server.record_request(endpoint, status, time.perf_counter() - start)
+
+    def _handle_post(self, server, endpoint):
+        """
+        reads the body, runs the request and responds. Returns the status of the response.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.close_connection = True
+            self._respond_with_error(411, "the Content-Length header is required", 'LengthRequired')
+            return 411
+        if length > server.max_body_bytes:
+            self.close_connection = True
+            self._respond_with_error(413, "the body is larger than %d bytes" % server.max_body_bytes, 'BodyTooLarge')
+            return 413
+        body = self.rfile.read(length)
+        if endpoint == 'unknown':
+            self._respond_with_error(404, "unknown endpoint '%s'" % (self.path,), 'UnknownEndpoint')
+            return 404
+        try:
+            if endpoint == 'batch':
+                try:
+                    items = json.loads(body)['items']
+                    if not isinstance(items, list):
+                        raise ValueError("'items' must be a list")
+                except (ValueError, KeyError, TypeError) as e:
+                    self._respond_with_error(400, "the body must be a JSON object with a list of 'items': %s" % e,
+                                             'InvalidBatch')
+                    return 400
+                if len(items) > server.max_batch_items:
+                    self._respond_with_error(413, "a batch can have at most %d items" % server.max_batch_items,
+                                             'BatchTooLarge')
+                    return 413
+                status, text = 200, server.run_batch(items)
+            else:
+                status, text = server.run_single(endpoint, body)
+        except ServerOverloadedException as e:
+            self._respond_with_error(503, str(e), 'Overloaded', extra_headers=[('Retry-After', '1')])
+            return 503
+        except multiprocessing.TimeoutError:
+            self._respond_with_error(504, "the request took longer than %s seconds" % server.task_timeout, 'Timeout')
+            return 504
+        self._respond(status, text)
+        return status
+
+
+#####################################################################################
+# command line
+#####################################################################################
+
+
+def _parse_operation(text):
+    operation, _, function_names = text.partition('=')
+    if not function_names:
+        raise argparse.ArgumentTypeError("operations are given as name=function1,function2")
+    return operation, function_names.split(',')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve validation, evaluation and visualization over HTTP.")
+    parser.add_argument('--module', default=DEFAULT_MODULE,
+                        help="the module that defines and finalizes the schema and contains the functions")
+    parser.add_argument('--operation', type=_parse_operation, action='append', default=[],
+                        help="an operation as name=function1,function2, applied one after the other. "
+                             "Replaces the default operations if given.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--workers', type=int, default=None, help="the number of worker processes. "
+                                                                  "Defaults to the number of CPUs.")
+    parser.add_argument('--max-pending-tasks', type=int, default=64,
+                        help="requests beyond this number of tasks waiting for a worker are rejected with status 503")
+    parser.add_argument('--batch-chunk-size', type=int, default=32,
+                        help="the minimum number of items of a batch that a worker processes in one task")
+    parser.add_argument('--max-batch-items', type=int, default=10000)
+    parser.add_argument('--max-body-bytes', type=int, default=16 * 1024 * 1024)
+    parser.add_argument('--task-timeout', type=float, default=30.0,
+                        help="seconds after which a request is answered with status 504")
+    args = parser.parse_args(argv)
+    server = ValidationServer(module_name=args.module, operations=dict(args.operation) or None, workers=args.workers,
+                              max_pending_tasks=args.max_pending_tasks, batch_chunk_size=args.batch_chunk_size,
+                              max_batch_items=args.max_batch_items, max_body_bytes=args.max_body_bytes,
+                              task_timeout=args.task_timeout)
+    server.serve(host=args.host, port=args.port, unix_socket=args.unix_socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
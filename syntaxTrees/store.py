@@ -0,0 +1,318 @@
+import collections
+import collections.abc
+import mmap
+import os
+import struct
+import tempfile
+
+from . import serialization
+from .serialization import _TAG_NULL, _TAG_FALSE, _TAG_TRUE, _TAG_INTEGER, _TAG_FLOAT, _TAG_STRING_REFERENCE, \
+    _TAG_LIST, _TAG_DICT, _TAG_NODE
+from .utilities import InvalidParamsException
+
+
+#####################################################################################
+# A read-only file of validated trees that is memory-mapped instead of loaded.
+# The trees are encoded like in serialization.py, with two differences:
+# each Node is prefixed with its length, so that it can be skipped without decoding it,
+# and all strings are kept in one table for the whole file.
+# Reading a tree returns a NodeProxy, which behaves like the OrderedDict that validation returned,
+# but only decodes the fields of a Node when they are first accessed.
+# Nested Nodes are NodeProxies as well, so only the parts of a tree that are actually used are ever decoded,
+# and functions like 'evaluate' and 'construct_object_visualization_html' can run directly on the mapped file.
+# Since the file is mapped read-only, several processes that open the same file share its memory.
+#
+# Usage:
+#     store.write_tree_store('rules.stt', validated_objects, choice='numerical_node')
+#     with store.TreeStore('rules.stt') as rules:
+#         for rule in rules:
+#             functions.evaluate_numerical_node(rule)
+#####################################################################################
+
+
+_MAGIC = b'STS'
+_FORMAT_VERSION = 1
+# magic, version, encoding fingerprint, number of trees, offset of the index of the trees,
+# number of strings, offset of the index of the strings
+_header_struct = struct.Struct('<3sB32sQQQQ')
+_offset_struct = struct.Struct('<Q')
+_offset_pair_struct = struct.Struct('<QQ')
+_float_struct = struct.Struct('<d')
+
+
+def write_tree_store(path, objects, value=None, choice=None, registry=None):
+    """
+    writes validated objects of the Node identified by 'value' or of the group of Nodes identified by 'choice'
+    to a file that can be opened with TreeStore. The objects can be any iterable, so they don't all need to be
+    in memory at once. The file is written under a temporary name first and then renamed,
+    so readers never see a partially written file. Returns the number of objects written.
+    """
+    layout = serialization._get_layout(registry)
+    encoder = _StoreEncoder(layout)
+    directory = os.path.dirname(os.path.abspath(path))
+    f = tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.tmp', delete=False)
+    try:
+        with f:
+            f.write(b'\0' * _header_struct.size)
+            position = _header_struct.size
+            object_offsets = []
+            for obj in objects:
+                encoder.out = bytearray()
+                encoder.write_node(obj, value, choice)
+                object_offsets.append(position)
+                f.write(encoder.out)
+                position += len(encoder.out)
+            # the strings, followed by the offset at which each string starts, plus the end of the last string
+            string_offsets = []
+            for s in encoder.string_list:
+                encoded = s.encode('utf-8')
+                string_offsets.append(position)
+                f.write(encoded)
+                position += len(encoded)
+            string_offsets.append(position)
+            padding = -position % 8
+            f.write(b'\0' * padding)
+            position += padding
+            object_index_offset = position
+            f.write(struct.pack('<%dQ' % len(object_offsets), *object_offsets))
+            string_index_offset = object_index_offset + 8 * len(object_offsets)
+            f.write(struct.pack('<%dQ' % len(string_offsets), *string_offsets))
+            f.seek(0)
+            f.write(_header_struct.pack(_MAGIC, _FORMAT_VERSION, layout.fingerprint, len(object_offsets),
+                                        object_index_offset, len(encoder.string_list), string_index_offset))
+        os.replace(f.name, path)
+    except BaseException:
+        os.remove(f.name)
+        raise
+    return len(object_offsets)
+
+
+class _StoreEncoder(serialization._Encoder):
+    def __init__(self, layout):
+        super().__init__(layout)
+        self.string_list = []
+
+    def write_node_body(self, present, explicit, explicit_values):
+        # write the body separately first, to find out its length
+        out = self.out
+        self.out = bytearray()
+        super().write_node_body(present, explicit, explicit_values)
+        body = self.out
+        self.out = out
+        self.write_varint(len(body))
+        out += body
+
+    def write_string(self, val):
+        index = self.strings.get(val)
+        if index is None:
+            index = len(self.string_list)
+            self.strings[val] = index
+            self.string_list.append(val)
+        self.out.append(_TAG_STRING_REFERENCE)
+        self.write_varint(index)
+
+
+class TreeStore:
+    """
+    a file written by write_tree_store(), mapped into memory.
+    Behaves like a read-only list of the trees in it.
+    The file is trusted: only its header is verified, with the Registry that is given or active.
+    """
+    def __init__(self, path, registry=None):
+        self._layout = serialization._get_layout(registry)
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._map) < _header_struct.size:
+                raise InvalidParamsException("the file is not a tree store.")
+            magic, version, fingerprint, self._count, self._object_index_offset, self._string_count, \
+                self._string_index_offset = _header_struct.unpack_from(self._map, 0)
+            if magic != _MAGIC:
+                raise InvalidParamsException("the file is not a tree store.")
+            if version != _FORMAT_VERSION:
+                raise InvalidParamsException("the tree store was written with an unsupported version of the format: %d" %
+                                             version)
+            if fingerprint != self._layout.fingerprint:
+                raise InvalidParamsException("the tree store was written with a different schema.")
+        except BaseException:
+            self.close()
+            raise
+        # decoded strings, by their index
+        self._strings = {}
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("tree store index out of range")
+        offset = _offset_struct.unpack_from(self._map, self._object_index_offset + 8 * index)[0]
+        return self._read_value(offset)[0]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def _get_string(self, index):
+        res = self._strings.get(index)
+        if res is None:
+            start, end = _offset_pair_struct.unpack_from(self._map, self._string_index_offset + 8 * index)
+            res = str(self._map[start:end], 'utf-8')
+            self._strings[index] = res
+        return res
+
+    def _read_value(self, position):
+        """
+        returns the value at the given position, and the position after it.
+        """
+        data = self._map
+        tag = data[position]
+        position += 1
+        if tag == _TAG_NODE:
+            node_id, position = _read_varint(data, position)
+            length, position = _read_varint(data, position)
+            return NodeProxy(self, self._layout.nodes[node_id], position), position + length
+        if tag == _TAG_STRING_REFERENCE:
+            index, position = _read_varint(data, position)
+            return self._get_string(index), position
+        if tag == _TAG_INTEGER:
+            n, position = _read_varint(data, position)
+            return (-((n + 1) >> 1) if n & 1 else n >> 1), position
+        if tag == _TAG_FLOAT:
+            return _float_struct.unpack_from(data, position)[0], position + 8
+        if tag == _TAG_LIST:
+            count, position = _read_varint(data, position)
+            res = []
+            for _ in range(count):
+                element, position = self._read_value(position)
+                res.append(element)
+            return res, position
+        if tag == _TAG_DICT:
+            count, position = _read_varint(data, position)
+            res = collections.OrderedDict()
+            for _ in range(count):
+                k, position = self._read_value(position)
+                res[k], position = self._read_value(position)
+            return res, position
+        if tag == _TAG_NULL:
+            return None, position
+        if tag == _TAG_TRUE:
+            return True, position
+        if tag == _TAG_FALSE:
+            return False, position
+        raise InvalidParamsException("the tree store is corrupted: unknown tag %d" % tag)
+
+    def _read_node_fields(self, node_layout, position):
+        """
+        decodes the fields of a Node into an OrderedDict. Nested Nodes are not decoded, but become NodeProxies.
+        """
+        present, position = _read_varint(self._map, position)
+        explicit, position = _read_varint(self._map, position)
+        res = collections.OrderedDict()
+        if present & 1:
+            res['type'] = node_layout.choice_type
+        present >>= 1
+        explicit >>= 1
+        for field_name, default, default_factory in node_layout.slots:
+            if not present:
+                break
+            if present & 1:
+                if explicit & 1:
+                    res[field_name], position = self._read_value(position)
+                elif default_factory is not None:
+                    res[field_name] = default_factory()
+                else:
+                    res[field_name] = default
+            present >>= 1
+            explicit >>= 1
+        return res
+
+
+def _read_varint(data, position):
+    b = data[position]
+    position += 1
+    if b < 0x80:
+        return b, position
+    res = b & 0x7f
+    shift = 7
+    while True:
+        b = data[position]
+        position += 1
+        res |= (b & 0x7f) << shift
+        if b < 0x80:
+            return res, position
+        shift += 7
+
+
+class NodeProxy(collections.abc.Mapping):
+    """
+    a read-only view of the validated object of a Node in a TreeStore.
+    It behaves like the OrderedDict that validation returned, but its fields are only decoded when first accessed.
+    It stays usable only as long as the TreeStore is open.
+    """
+    __slots__ = ('_store', '_node_layout', '_position', '_fields')
+
+    def __init__(self, store, node_layout, position):
+        self._store = store
+        self._node_layout = node_layout
+        self._position = position
+        self._fields = None
+
+    def _get_fields(self):
+        fields = self._fields
+        if fields is None:
+            fields = self._store._read_node_fields(self._node_layout, self._position)
+            self._fields = fields
+        return fields
+
+    def __getitem__(self, key):
+        return self._get_fields()[key]
+
+    def __contains__(self, key):
+        return key in self._get_fields()
+
+    def __iter__(self):
+        return iter(self._get_fields())
+
+    def __len__(self):
+        return len(self._get_fields())
+
+    def __repr__(self):
+        return "<NodeProxy %s>" % (self._node_layout.node.Meta.name,)
+
+    def get_node(self):
+        """
+        returns the Node that this object belongs to, without decoding anything.
+        """
+        return self._node_layout.node
+
+    def materialize(self):
+        """
+        returns a copy of the whole object as OrderedDicts and lists, exactly as validation returned it.
+        """
+        return materialize(self)
+
+
+def materialize(val):
+    """
+    replaces all NodeProxies in a value read from a TreeStore by OrderedDicts, recursively.
+    """
+    if isinstance(val, (NodeProxy, dict)):
+        return collections.OrderedDict((k, materialize(v)) for k,v in val.items())
+    if isinstance(val, list):
+        return [materialize(a) for a in val]
+    return val
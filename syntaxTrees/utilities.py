@@ -27,9 +27,29 @@ class InvalidParamsException(Exception):
     pass
 
 
+class InputLimitExceededException(InvalidParamsException):
+    """
+    An exception that indicates that a value given to the server is too large or too complex to be processed.
+    The limit is the name of the limit that was exceeded, for example 'max_depth'.
+    """
+    def __init__(self, message, limit):
+        super().__init__(message)
+        self.limit = limit
+
+
 class ProgrammingError(Exception):
     """
     This exception shouldn't happen during the normal course of operations at all.
     If it does, it means that a programming mistake has been made.
     """
     pass
+
+
+class ExecutionLimitExceededException(Exception):
+    """
+    An exception that indicates that executing a function on a tree took more steps or more time than it was allowed to.
+    The node_trace is the position in the tree where the execution was stopped.
+    """
+    def __init__(self, message, node_trace=None):
+        super().__init__(message)
+        self.node_trace = list(node_trace) if node_trace is not None else []